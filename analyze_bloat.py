@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Раздувание таблиц/индексов, мёртвые строки и отставание autovacuum
+для таблиц с массовыми UPDATE/DELETE (users, course_days, content_items).
+
+Использование:
+    python3 analyze_bloat.py                             # текущее состояние и рекомендации
+    python3 analyze_bloat.py --save before.json          # замер до задания
+    python3 analyze_bloat.py --compare before.json       # замер после и разница
+    python3 analyze_bloat.py --run "python3 backend/cleanup_lessons.py"   # до, задание, после
+    python3 analyze_bloat.py users energy_transactions   # другие таблицы (--all - все)
+"""
+import argparse
+import os
+import subprocess
+import time
+
+from db_analysis.bloat import TABLES, BloatMonitor, advice, compare, load, save
+from db_analysis.counts import cursor_fetch, format_bytes
+from db_analysis.db import ConnectionPool
+
+# Параметры подключения (как у city_sync)
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', '31.128.36.81'),
+    'port': int(os.getenv('DB_PORT', '5423')),
+    'database': os.getenv('DB_NAME', 'club_hranitel'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'kH*kyrS&9z7K'),
+    'connect_timeout': 10,
+}
+
+STATS_SETTLE_SECONDS = 2  # статистика pg_stat_* обновляется не мгновенно после коммита
+
+POOL = ConnectionPool(DB_CONFIG, size=1)
+
+def print_measurement(measurement):
+    """Таблицы, индексы и рекомендации одного замера"""
+    print(f"🔎 Оценка: {measurement['method']}, замер {measurement['taken_at']}")
+    for name, table in measurement["tables"].items():
+        bloat = table["bloat_bytes"]
+        bloat_str = "?" if bloat is None else f"~{format_bytes(bloat)}"
+        print(f"\n📋 {name}: {format_bytes(table['bytes'])} (с индексами {format_bytes(table['total_bytes'])}), "
+              f"раздувание {bloat_str}")
+        print(f"   Живых строк: {table['live_rows']:,}, мёртвых: {table['dead_rows']:,} "
+              f"(autovacuum с {table['autovacuum_at']:,}), последний VACUUM: {table['last_vacuum'] or 'никогда'}")
+        for index_name, index in measurement["indexes"].items():
+            if index["table"] == name:
+                bloat = index["bloat_bytes"]
+                bloat_str = "?" if bloat is None else f"~{format_bytes(bloat)}"
+                print(f"   - {index_name}: {format_bytes(index['bytes'])}, раздувание {bloat_str}")
+
+    print("\n💡 РЕКОМЕНДАЦИИ:")
+    lines = advice(measurement)
+    if not lines:
+        print("   ✅ Обслуживание не требуется")
+    for line in lines:
+        print(f"   {line}")
+
+def print_compare(before, after):
+    print("\n" + "=" * 80)
+    print(f"📊 ИЗМЕНЕНИЯ {before['taken_at']} -> {after['taken_at']}:")
+    print("-" * 80)
+    lines = compare(before, after)
+    if not lines:
+        print("   Без изменений")
+    for line in lines:
+        print(f"   {line}")
+
+def analyze_bloat(args):
+    monitor = BloatMonitor(cursor_fetch(POOL.connection), None if args.all else args.tables or TABLES)
+
+    print("=" * 80)
+    print(f"РАЗДУВАНИЕ И МЁРТВЫЕ СТРОКИ: {DB_CONFIG['database']}")
+    print("=" * 80)
+
+    before = load(args.compare) if args.compare else None
+    if args.run:
+        before = monitor.measure()
+        print(f"▶️  Запуск: {args.run}")
+        code = subprocess.run(args.run, shell=True).returncode
+        print(f"⏹  Завершено с кодом {code}")
+        time.sleep(STATS_SETTLE_SECONDS)
+
+    measurement = monitor.measure()
+    print_measurement(measurement)
+    if before:
+        print_compare(before, measurement)
+    if args.save:
+        save(measurement, args.save)
+        print(f"\n💾 Замер сохранён: {args.save}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Раздувание таблиц и отставание autovacuum")
+    parser.add_argument("tables", nargs="*", help=f"таблицы (по умолчанию: {', '.join(TABLES)})")
+    parser.add_argument("--all", action="store_true", help="все таблицы схемы public")
+    parser.add_argument("--save", metavar="PATH", help="сохранить замер в JSON")
+    parser.add_argument("--compare", metavar="PATH", help="сравнить с сохранённым замером")
+    parser.add_argument("--run", metavar="CMD", help="замерить до и после команды")
+    args = parser.parse_args()
+    try:
+        analyze_bloat(args)
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        POOL.close()
@@ -2,8 +2,10 @@
 """
 Полный анализ существующей БД клуба КОД ДЕНЕГ (в Docker контейнере)
 """
-import subprocess
-import json
+
+from db_analysis.counts import TableCounts, psql_fetch, quote_ident
+from db_analysis.profile import ColumnProfiler, parse_sample_percent
+from db_analysis.ssh import RemotePsql, SSHMaster
 
 SSH_HOST = "31.128.36.81"
 SSH_USER = "root"
@@ -21,22 +23,37 @@ PRIORITY_TABLES = [
     'statistics_club_IK',              # Статистика заходов
 ]
 
+# Одно SSH-соединение и один psql в контейнере на весь анализ
+SSH = SSHMaster(SSH_HOST, SSH_USER, SSH_PASSWORD)
+PSQL = RemotePsql(SSH, f"docker exec -i {CONTAINER} psql -U postgres -d postgres")
+# Количество записей - оценка из статистики, точный COUNT(*) только с --exact
+COUNTS = TableCounts(psql_fetch(PSQL))
+# Профиль колонок: pg_stats, без статистики - TABLESAMPLE (--sample-percent)
+PROFILER = ColumnProfiler(psql_fetch(PSQL), parse_sample_percent())
+
 def ssh_cmd(cmd):
     """Execute SSH command"""
-    full_cmd = ['sshpass', '-p', SSH_PASSWORD, 'ssh', '-o', 'StrictHostKeyChecking=no', f'{SSH_USER}@{SSH_HOST}', cmd]
-    result = subprocess.run(full_cmd, capture_output=True, text=True, timeout=60)
-    return result.stdout
+    stdout, _, _ = SSH.run(cmd)
+    return stdout or ""
+
+def psql_rows(query):
+    """Rows of a query in the shared psql session (COPY ... CSV, NULL -> None)"""
+    return PSQL.rows(query)
 
-def psql_query(query):
-    """Execute PostgreSQL query in Docker"""
-    escaped = query.replace("'", "'\\''")
-    cmd = f"docker exec {CONTAINER} psql -U postgres -d postgres -t -A -F'|' -c '{escaped}' 2>/dev/null"
-    return ssh_cmd(cmd)
+def psql_value(query):
+    """First value of a query result as text"""
+    rows = psql_rows(query)
+    return "" if not rows or rows[0][0] is None else rows[0][0]
 
 def psql_describe(table):
-    """Describe table structure"""
-    cmd = f"docker exec {CONTAINER} psql -U postgres -d postgres -c '\\d {table}' 2>/dev/null"
-    return ssh_cmd(cmd)
+    """Table structure: (column, type, nullable) rows"""
+    return psql_rows(f"""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod),
+               CASE WHEN a.attnotnull THEN 'not null' ELSE '' END
+        FROM pg_attribute a
+        WHERE a.attrelid = '"{table}"'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum;
+    """)
 
 print("=" * 100)
 print("📊 АНАЛИЗ СУЩЕСТВУЮЩЕЙ БАЗЫ ДАННЫХ КЛУБА 'КОД ДЕНЕГ' (Docker PostgreSQL)")
@@ -45,21 +62,24 @@ print()
 
 # Test connection
 print("🔌 Проверка подключения...")
-result = ssh_cmd("docker exec postgres psql -U postgres -d postgres -c 'SELECT version();' 2>/dev/null | head -3")
+try:
+    SSH.start()
+    result = psql_value("SELECT version();")
+except Exception as e:
+    result = str(e)
 if 'PostgreSQL' in result:
-    lines = result.strip().split('\n')
-    version_line = next((l for l in lines if 'PostgreSQL' in l), "Connected")
-    print(f"✅ {version_line}")
+    print(f"✅ {result.strip()}")
 else:
-    print("❌ Ошибка подключения")
+    print(f"❌ Ошибка подключения: {result.strip()}")
     exit(1)
 print()
 
 # Get all tables
 print("📋 Получение списка таблиц...")
-output = psql_query("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' ORDER BY table_name;")
-all_tables = [line.strip() for line in output.strip().split('\n') if line.strip()]
+all_tables = [row[0] for row in psql_rows("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' ORDER BY table_name;")]
 print(f"✅ Найдено таблиц: {len(all_tables)}")
+COUNTS.load()
+print(f"🔢 Количество записей: {COUNTS.mode()}")
 print()
 
 # Analyze priority tables
@@ -76,45 +96,32 @@ for table in PRIORITY_TABLES:
     print(f"{'='*100}")
 
     # Count
-    output = psql_query(f"SELECT COUNT(*) FROM {table};")
-    count = output.strip()
-    print(f"\n📊 Количество записей: {count:>10}")
+    count = COUNTS[table]
+    print(f"\n📊 Количество записей: {count}")
 
     # Structure
     print(f"\n📐 СТРУКТУРА ТАБЛИЦЫ:")
     print("-" * 100)
-    describe_output = psql_describe(table)
-    in_columns = False
     columns = []
 
-    for line in describe_output.split('\n'):
-        line_stripped = line.strip()
-
-        if 'Column' in line and 'Type' in line:
-            in_columns = True
-            print(f"{'Колонка':<30} | {'Тип':<25} | {'Nullable':<10}")
-            print("-" * 100)
-            continue
-
-        if in_columns:
-            if line_stripped.startswith('---') or line_stripped.startswith('Indexes') or not line_stripped or line_stripped.startswith('Foreign'):
-                in_columns = False
-                continue
-
-            if '|' in line:
-                parts = [p.strip() for p in line.split('|')]
-                if len(parts) >= 3:
-                    col_name, col_type, nullable = parts[0], parts[1], parts[2]
-                    columns.append(col_name)
-                    print(f"{col_name:<30} | {col_type:<25} | {nullable:<10}")
+    print(f"{'Колонка':<30} | {'Тип':<25} | {'Nullable':<10}")
+    print("-" * 100)
+    for col_name, col_type, nullable in psql_describe(table):
+        columns.append(col_name)
+        print(f"{col_name:<30} | {col_type:<25} | {nullable or '':<10}")
 
-    # Sample data with column headers
+    # Column profile
+    print(f"\n🔬 ПРОФИЛЬ КОЛОНОК:")
+    print("-" * 100)
     try:
-        record_count = int(count) if count.strip() else 0
-    except:
-        record_count = 0
-
-    if record_count > 0:
+        for column in PROFILER.profile(table, count.table_bytes):
+            for line in column.lines(count.rows):
+                print(f"  {line}")
+    except RuntimeError as e:
+        print(f"  ⚠️  Не удалось: {e}")
+
+    # Sample data with column headers (по оценке пустые таблицы пропускаем)
+    if count.rows != 0:
         print(f"\n📝 ПРИМЕРЫ ДАННЫХ (последние 3 записи):")
         print("-" * 100)
 
@@ -126,27 +133,30 @@ for table in PRIORITY_TABLES:
                 WHERE table_name = '{table}'
                 ORDER BY ordinal_position;
             """
-            col_output = psql_query(col_query)
-            columns = [line.strip() for line in col_output.strip().split('\n') if line.strip()]
+            columns = [row[0] for row in psql_rows(col_query)]
 
-        # Get sample data
+        # Get sample data (имя в кавычках: statistics_club_IK без них не найдётся)
         has_id = 'id' in columns
         if has_id:
-            sample_query = f"SELECT * FROM {table} ORDER BY id DESC LIMIT 3;"
+            sample_query = f"SELECT * FROM {quote_ident(table)} ORDER BY id DESC LIMIT 3;"
         else:
-            sample_query = f"SELECT * FROM {table} LIMIT 3;"
+            sample_query = f"SELECT * FROM {quote_ident(table)} LIMIT 3;"
 
-        sample_output = psql_query(sample_query)
+        try:
+            sample_rows = psql_rows(sample_query)
+        except RuntimeError as e:
+            print(f"  ⚠️  Не удалось: {e}")
+            sample_rows = []
 
-        if sample_output.strip():
+        if sample_rows:
             print(f"\nКолонки: {', '.join(columns)}\n")
 
-            for i, line in enumerate(sample_output.strip().split('\n')[:3], 1):
+            for i, values in enumerate(sample_rows[:3], 1):
                 print(f"Запись #{i}:")
-                values = line.split('|')
 
                 for col, val in zip(columns, values):
                     # Truncate long values
+                    val = "NULL" if val is None else val
                     val_display = val if len(val) <= 80 else val[:80] + "..."
                     print(f"  {col:<25} = {val_display}")
                 print()
@@ -154,49 +164,44 @@ for table in PRIORITY_TABLES:
     # Key statistics
     print(f"\n📈 КЛЮЧЕВАЯ СТАТИСТИКА:")
     print("-" * 100)
+    print(f"  {'Всего записей':<30} = {count}")
 
     # For transaction table - sum of points
     if table == 'private_club_transactions':
         stats = [
-            ("Всего транзакций", f"SELECT COUNT(*) FROM {table};"),
             ("Сумма всех баллов", f"SELECT COALESCE(SUM(points), 0) FROM {table};"),
             ("Средний балл", f"SELECT COALESCE(ROUND(AVG(points), 2), 0) FROM {table};"),
             ("Уникальных пользователей", f"SELECT COUNT(DISTINCT COALESCE(telegram_id, user_id)) FROM {table} WHERE COALESCE(telegram_id, user_id) IS NOT NULL;"),
         ]
         for stat_name, query in stats:
             try:
-                result = psql_query(query)
-                print(f"  {stat_name:<30} = {result.strip()}")
-            except:
-                pass
+                print(f"  {stat_name:<30} = {psql_value(query)}")
+            except RuntimeError as e:
+                print(f"  {stat_name:<30} = ? ({e})")
 
     # For users table
     elif table == 'private_club_users':
         stats = [
-            ("Всего пользователей", f"SELECT COUNT(*) FROM {table};"),
             ("Активных подписок", f"SELECT COUNT(*) FROM {table} WHERE subscription_end > NOW();"),
             ("Истекших подписок", f"SELECT COUNT(*) FROM {table} WHERE subscription_end <= NOW();"),
         ]
         for stat_name, query in stats:
             try:
-                result = psql_query(query)
-                print(f"  {stat_name:<30} = {result.strip()}")
-            except:
-                pass
+                print(f"  {stat_name:<30} = {psql_value(query)}")
+            except RuntimeError as e:
+                print(f"  {stat_name:<30} = ? ({e})")
 
     # For payments table
     elif table == 'prodamus_payments':
         stats = [
-            ("Всего платежей", f"SELECT COUNT(*) FROM {table};"),
             ("Сумма платежей", f"SELECT COALESCE(SUM(CAST(sum AS NUMERIC)), 0) FROM {table} WHERE sum ~ '^[0-9.]+$';"),
             ("Успешных платежей", f"SELECT COUNT(*) FROM {table} WHERE status = 'success' OR payment_status = 'success';"),
         ]
         for stat_name, query in stats:
             try:
-                result = psql_query(query)
-                print(f"  {stat_name:<30} = {result.strip()}")
-            except:
-                pass
+                print(f"  {stat_name:<30} = {psql_value(query)}")
+            except RuntimeError as e:
+                print(f"  {stat_name:<30} = ? ({e})")
 
 print("\n" + "=" * 100)
 print("📚 СПИСОК ВСЕХ ОСТАЛЬНЫХ ТАБЛИЦ:")
@@ -204,10 +209,12 @@ print("=" * 100)
 
 other_tables = sorted([t for t in all_tables if t not in PRIORITY_TABLES])
 for i, table in enumerate(other_tables, 1):
-    output = psql_query(f"SELECT COUNT(*) FROM {table};")
-    count = output.strip()
-    print(f"  {i:2}. {table:<50} - {count:>10} записей")
+    count = COUNTS[table]
+    print(f"  {i:2}. {table:<50} - {count}")
 
 print("\n" + "=" * 100)
 print("✅ АНАЛИЗ ЗАВЕРШЁН")
 print("=" * 100)
+
+PSQL.close()
+SSH.close()
@@ -2,8 +2,9 @@
 """
 Упрощенный скрипт для анализа БД через SSH
 """
-import subprocess
-import sys
+
+from db_analysis.counts import TableCounts, psql_fetch
+from db_analysis.ssh import RemotePsql, SSHMaster
 
 SSH_HOST = "31.128.36.81"
 SSH_USER = "root"
@@ -20,11 +21,15 @@ TABLES = [
     'statistics_club_IK'
 ]
 
-def ssh_exec(cmd):
-    """Execute command via SSH"""
-    full_cmd = ['sshpass', '-p', SSH_PASSWORD, 'ssh', '-o', 'StrictHostKeyChecking=no', f'{SSH_USER}@{SSH_HOST}', cmd]
-    result = subprocess.run(full_cmd, capture_output=True, text=True, timeout=30)
-    return result.stdout
+# Одно SSH-соединение и один psql на весь анализ
+SSH = SSHMaster(SSH_HOST, SSH_USER, SSH_PASSWORD).start()
+PSQL = RemotePsql(SSH, "sudo -u postgres psql -d postgres")
+# Оценка из статистики вместо COUNT(*); точно - с --exact
+COUNTS = TableCounts(psql_fetch(PSQL))
+
+def psql(query):
+    """Rows of a query in the shared psql session (COPY ... CSV, NULL -> None)"""
+    return PSQL.rows(query)
 
 print("="*80)
 print("АНАЛИЗ БАЗЫ ДАННЫХ КЛУБА 'КОД ДЕНЕГ'")
@@ -33,17 +38,11 @@ print()
 
 # List all tables
 print("📊 Получение списка таблиц...")
-output = ssh_exec("sudo -u postgres psql -d postgres -t -c '\\dt public.*' 2>/dev/null")
-all_tables = []
-for line in output.split('\n'):
-    if '|' in line:
-        parts = line.split('|')
-        if len(parts) >= 2:
-            table_name = parts[1].strip()
-            if table_name:
-                all_tables.append(table_name)
+all_tables = [row[0] for row in psql("SELECT tablename FROM pg_tables WHERE schemaname = 'public' ORDER BY tablename;")]
 
 print(f"✅ Найдено таблиц: {len(all_tables)}")
+COUNTS.load()
+print(f"🔢 Количество записей: {COUNTS.mode()}")
 print()
 
 print("🔥 АНАЛИЗ ПРИОРИТЕТНЫХ ТАБЛИЦ:")
@@ -58,35 +57,29 @@ for table in TABLES:
     print("-"*40)
 
     # Count records
-    output = ssh_exec(f"sudo -u postgres psql -d postgres -t -c 'SELECT COUNT(*) FROM {table};' 2>/dev/null")
-    count = output.strip()
-    print(f"   Записей: {count}")
+    print(f"   Записей: {COUNTS[table]}")
 
     # Get structure
-    cmd = f"sudo -u postgres psql -d postgres -c '\\d {table}' 2>/dev/null"
-    output = ssh_exec(cmd)
+    rows = psql(f"""
+        SELECT attname, format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = '"{table}"'::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum;
+    """)
     print(f"   Структура:")
-    in_columns = False
-    for line in output.split('\n'):
-        line = line.strip()
-        if 'Column' in line and 'Type' in line:
-            in_columns = True
-            continue
-        if in_columns:
-            if line.startswith('---') or line.startswith('Indexes') or not line:
-                in_columns = False
-                continue
-            if '|' in line:
-                parts = [p.strip() for p in line.split('|')]
-                if len(parts) >= 2:
-                    print(f"      - {parts[0]}: {parts[1]}")
+    for col_name, col_type in rows:
+        print(f"      - {col_name}: {col_type}")
 
     # Sample data
-    cmd = f"sudo -u postgres psql -d postgres -t -A -F'|' -c 'SELECT * FROM {table} ORDER BY id DESC LIMIT 2;' 2>/dev/null"
-    output = ssh_exec(cmd)
-    if output.strip():
+    try:
+        rows = psql(f'SELECT * FROM "{table}" ORDER BY id DESC LIMIT 2;')
+    except RuntimeError as e:
+        rows = []
+        print(f"   ⚠️  {e}")
+    if rows:
         print(f"   Последние записи:")
-        for i, line in enumerate(output.strip().split('\n')[:2], 1):
+        for i, row in enumerate(rows[:2], 1):
+            line = "|".join("NULL" if value is None else value for value in row)
             # Truncate long lines
             if len(line) > 150:
                 line = line[:150] + "..."
@@ -98,10 +91,11 @@ print("-"*80)
 
 other_tables = sorted([t for t in all_tables if t not in TABLES])
 for table in other_tables:
-    output = ssh_exec(f"sudo -u postgres psql -d postgres -t -c 'SELECT COUNT(*) FROM {table};' 2>/dev/null")
-    count = output.strip()
-    print(f"   - {table}: {count} записей")
+    print(f"   - {table}: {COUNTS[table]}")
 
 print("\n" + "="*80)
 print("✅ АНАЛИЗ ЗАВЕРШЁН")
 print("="*80)
+
+PSQL.close()
+SSH.close()
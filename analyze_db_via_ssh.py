@@ -2,8 +2,9 @@
 """
 Скрипт для анализа существующей базы данных через SSH туннель
 """
-import subprocess
-import json
+
+from db_analysis.counts import TableCounts, psql_fetch
+from db_analysis.ssh import RemotePsql, SSHMaster
 
 # SSH и DB параметры
 SSH_HOST = "31.128.36.81"
@@ -24,26 +25,29 @@ PRIORITY_TABLES = [
     'statistics_club_IK'
 ]
 
+# Одно SSH-соединение и один psql на весь анализ
+SSH = SSHMaster(SSH_HOST, SSH_USER, SSH_PASSWORD)
+PSQL = RemotePsql(SSH, f"sudo -u {DB_USER} psql -d {DB_NAME}")
+# Оценка количества записей из статистики; точный COUNT(*) - с --exact
+COUNTS = TableCounts(psql_fetch(PSQL))
+
 def run_ssh_command(command):
     """Выполнить команду через SSH"""
-    ssh_cmd = [
-        'sshpass', '-p', SSH_PASSWORD,
-        'ssh', '-o', 'StrictHostKeyChecking=no',
-        f'{SSH_USER}@{SSH_HOST}',
-        command
-    ]
     try:
-        result = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=30)
-        return result.stdout, result.stderr, result.returncode
+        SSH.start()
     except Exception as e:
         return None, str(e), 1
+    return SSH.run(command, timeout=30)
 
 def run_psql_query(query):
-    """Выполнить SQL запрос через SSH"""
-    # Экранируем кавычки в запросе
-    escaped_query = query.replace('"', '\\"').replace("'", "'\\''")
-    psql_cmd = f"sudo -u {DB_USER} psql -d {DB_NAME} -t -A -F'|' -c \"{escaped_query}\""
-    return run_ssh_command(psql_cmd)
+    """
+    Выполнить SQL запрос в общей psql-сессии: (строки, ошибка, код).
+    Строки приходят через COPY ... CSV, NULL -> None
+    """
+    try:
+        return PSQL.rows(query), "", 0
+    except RuntimeError as e:
+        return [], str(e), 1
 
 def analyze_database():
     """Анализ базы данных"""
@@ -64,14 +68,16 @@ def analyze_database():
     # Список таблиц
     print("📊 Получение списка таблиц...")
     query = "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public' ORDER BY table_name;"
-    stdout, stderr, code = run_psql_query(query)
+    rows, stderr, code = run_psql_query(query)
 
     if code != 0:
         print(f"❌ Ошибка получения таблиц: {stderr}")
         return
 
-    all_tables = [t.strip() for t in stdout.strip().split('\n') if t.strip()]
+    all_tables = [row[0] for row in rows]
     print(f"✅ Найдено таблиц: {len(all_tables)}")
+    COUNTS.load()
+    print(f"🔢 Количество записей: {COUNTS.mode()}")
     print()
 
     # Анализ приоритетных таблиц
@@ -87,11 +93,10 @@ def analyze_database():
         print("-" * 40)
 
         # Количество записей
-        query = f"SELECT COUNT(*) FROM {table};"
-        stdout, stderr, code = run_psql_query(query)
-        if code == 0:
-            count = stdout.strip()
-            print(f"   Записей: {count}")
+        try:
+            print(f"   Записей: {COUNTS[table]}")
+        except RuntimeError as e:
+            print(f"   Записей: ? ({e})")
 
         # Структура таблицы
         query = f"""
@@ -100,17 +105,13 @@ def analyze_database():
             WHERE table_name = '{table}'
             ORDER BY ordinal_position;
         """
-        stdout, stderr, code = run_psql_query(query)
+        rows, stderr, code = run_psql_query(query)
         if code == 0:
             print(f"   Структура:")
-            for line in stdout.strip().split('\n'):
-                if line.strip():
-                    parts = line.split('|')
-                    if len(parts) >= 4:
-                        col_name, data_type, max_length, nullable = parts[:4]
-                        length_str = f"({max_length})" if max_length != '' else ""
-                        nullable_str = "NULL" if nullable == "YES" else "NOT NULL"
-                        print(f"      - {col_name}: {data_type}{length_str} {nullable_str}")
+            for col_name, data_type, max_length, nullable in rows:
+                length_str = f"({max_length})" if max_length is not None else ""
+                nullable_str = "NULL" if nullable == "YES" else "NOT NULL"
+                print(f"      - {col_name}: {data_type}{length_str} {nullable_str}")
 
         # Примеры данных (3 последние записи)
         # Определяем есть ли колонка id
@@ -118,19 +119,19 @@ def analyze_database():
             SELECT column_name FROM information_schema.columns
             WHERE table_name = '{table}' AND column_name = 'id';
         """
-        stdout, stderr, code = run_psql_query(query)
-        has_id = stdout.strip() != ''
+        rows, stderr, code = run_psql_query(query)
+        has_id = bool(rows)
 
         if has_id:
             query = f"SELECT * FROM {table} ORDER BY id DESC LIMIT 2;"
         else:
             query = f"SELECT * FROM {table} LIMIT 2;"
 
-        stdout, stderr, code = run_psql_query(query)
-        if code == 0 and stdout.strip():
+        rows, stderr, code = run_psql_query(query)
+        if code == 0 and rows:
             print(f"   Последние записи:")
-            lines = stdout.strip().split('\n')
-            for i, line in enumerate(lines[:2], 1):
+            for i, row in enumerate(rows[:2], 1):
+                line = "|".join("NULL" if value is None else value for value in row)
                 # Ограничиваем вывод
                 if len(line) > 200:
                     line = line[:200] + "..."
@@ -143,10 +144,11 @@ def analyze_database():
 
     other_tables = [t for t in all_tables if t not in PRIORITY_TABLES]
     for table in sorted(other_tables):
-        query = f"SELECT COUNT(*) FROM {table};"
-        stdout, stderr, code = run_psql_query(query)
-        count = stdout.strip() if code == 0 else "?"
-        print(f"   - {table}: {count} записей")
+        try:
+            count = COUNTS[table]
+        except RuntimeError:
+            count = "?"
+        print(f"   - {table}: {count}")
 
     print("\n" + "=" * 80)
     print("✅ АНАЛИЗ ЗАВЕРШЁН")
@@ -159,3 +161,6 @@ if __name__ == "__main__":
         print(f"❌ Ошибка: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        PSQL.close()
+        SSH.close()
@@ -4,7 +4,11 @@
 """
 import psycopg2
 from psycopg2.extras import RealDictCursor
-import json
+
+from db_analysis.counts import TableCounts, cursor_fetch, quote_ident
+from db_analysis.db import ConnectionPool
+from db_analysis.profile import ColumnProfiler, parse_sample_percent
+from db_analysis.snapshot import SnapshotProfiler, parse_snapshot_path
 
 # Параметры подключения
 DB_CONFIG = {
@@ -17,9 +21,12 @@ DB_CONFIG = {
     'sslmode': 'prefer'
 }
 
+# Несколько соединений на весь анализ вместо нового подключения на каждый запрос
+POOL = ConnectionPool(DB_CONFIG)
+
 def get_connection():
-    """Подключение к БД"""
-    return psycopg2.connect(**DB_CONFIG)
+    """Соединение из пула (возвращается в пул при выходе из with)"""
+    return POOL.connection()
 
 def get_tables():
     """Получить список таблиц"""
@@ -50,29 +57,25 @@ def get_table_structure(table_name):
             """, (table_name,))
             return cur.fetchall()
 
-def get_table_sample(table_name, limit=3):
-    """Получить примеры данных из таблицы"""
+def get_table_sample(table_name, limit=3, has_id=False):
+    """Получить примеры данных из таблицы (последние по id, если он есть)"""
+    # Имя в кавычках: без них statistics_club_IK превращается в statistics_club_ik
+    order = "ORDER BY id DESC" if has_id else ""
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(f"""
-                SELECT * FROM public.{table_name}
-                ORDER BY
-                    CASE
-                        WHEN EXISTS (SELECT 1 FROM information_schema.columns
-                                    WHERE table_name = %s AND column_name = 'id')
-                        THEN id
-                        ELSE NULL
-                    END DESC
-                LIMIT %s;
-            """, (table_name, limit))
+            cur.execute(f"SELECT * FROM public.{quote_ident(table_name)} {order} LIMIT %s;", (limit,))
             return cur.fetchall()
 
+# Оценки из статистики; точный COUNT(*) только с --exact
+COUNTS = TableCounts(cursor_fetch(get_connection))
+# Профиль колонок из pg_stats, без статистики - TABLESAMPLE
+PROFILER = ColumnProfiler(cursor_fetch(get_connection), parse_sample_percent())
+# Снимок: неизменившиеся таблицы не профилируются заново (--snapshot PATH)
+SNAPSHOTS = SnapshotProfiler(cursor_fetch(get_connection), PROFILER, parse_snapshot_path("club_db"))
+
 def get_table_count(table_name):
-    """Получить количество записей"""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT COUNT(*) FROM public.{table_name};")
-            return cur.fetchone()[0]
+    """Получить количество записей (оценка или точное, с размером)"""
+    return COUNTS[table_name]
 
 def analyze_database():
     """Полный анализ базы данных"""
@@ -84,6 +87,9 @@ def analyze_database():
     # Получаем список таблиц
     tables = get_tables()
     print(f"📊 Найдено таблиц: {len(tables)}")
+    COUNTS.load()
+    SNAPSHOTS.load()
+    print(f"🔢 Количество записей: {COUNTS.mode()}")
     print()
 
     # Приоритетные таблицы из ТЗ
@@ -102,47 +108,71 @@ def analyze_database():
     print("🔥 ПРИОРИТЕТНЫЕ ТАБЛИЦЫ:")
     print("-" * 80)
 
-    for table in priority_tables:
-        if table in tables:
-            print(f"\n📋 Таблица: {table}")
-            print("-" * 40)
-
-            # Количество записей
+    def profile_table(table):
+        """
+        Количество, структура и примеры одной таблицы (выполняется в пуле потоков).
+        Ошибка одной таблицы возвращается, а не выбрасывается: остальные печатаются как обычно
+        """
+        try:
             count = get_table_count(table)
-            print(f"   Записей: {count:,}")
-
-            # Структура
-            print(f"   Структура:")
             structure = get_table_structure(table)
-            for col in structure:
-                col_name, data_type, max_length, nullable, default = col
-                length_str = f"({max_length})" if max_length else ""
-                nullable_str = "NULL" if nullable == "YES" else "NOT NULL"
-                default_str = f" DEFAULT {default}" if default else ""
-                print(f"      - {col_name}: {data_type}{length_str} {nullable_str}{default_str}")
-
-            # Примеры данных
-            if count > 0:
-                print(f"   Примеры данных:")
-                samples = get_table_sample(table, limit=2)
-                for i, sample in enumerate(samples, 1):
-                    print(f"      Запись #{i}:")
-                    for key, value in sample.items():
-                        # Сокращаем длинные значения
-                        val_str = str(value)
-                        if len(val_str) > 100:
-                            val_str = val_str[:100] + "..."
-                        print(f"         {key}: {val_str}")
+            has_id = any(col[0] == 'id' for col in structure)
+            samples = get_table_sample(table, limit=2, has_id=has_id) if count.rows != 0 else []
+            columns = SNAPSHOTS.profile(table, count)
+        except psycopg2.Error as e:
+            return None, str(e).strip()
+        return (count, structure, samples, columns), None
+
+    found = [table for table in priority_tables if table in tables]
+    for table, (result, error) in zip(found, POOL.map(profile_table, found)):
+        print(f"\n📋 Таблица: {table}")
+        print("-" * 40)
+        if error:
+            print(f"   ❌ Ошибка: {error}")
+            continue
+        count, structure, samples, columns = result
+
+        # Количество записей
+        print(f"   Записей: {count}")
+
+        # Структура
+        print(f"   Структура:")
+        for col in structure:
+            col_name, data_type, max_length, nullable, default = col
+            length_str = f"({max_length})" if max_length else ""
+            nullable_str = "NULL" if nullable == "YES" else "NOT NULL"
+            default_str = f" DEFAULT {default}" if default else ""
+            print(f"      - {col_name}: {data_type}{length_str} {nullable_str}{default_str}")
+
+        # Профиль колонок
+        print(f"   Профиль колонок:")
+        for column in columns:
+            for line in column.lines(count.rows):
+                print(f"      {line}")
+
+        # Примеры данных
+        if samples:
+            print(f"   Примеры данных:")
+            for i, sample in enumerate(samples, 1):
+                print(f"      Запись #{i}:")
+                for key, value in sample.items():
+                    # Сокращаем длинные значения
+                    val_str = str(value)
+                    if len(val_str) > 100:
+                        val_str = val_str[:100] + "..."
+                    print(f"         {key}: {val_str}")
 
     # Остальные таблицы
     print("\n" + "=" * 80)
     print("📚 ОСТАЛЬНЫЕ ТАБЛИЦЫ:")
     print("-" * 80)
 
-    other_tables = [t for t in tables if t not in priority_tables]
-    for table in sorted(other_tables):
-        count = get_table_count(table)
-        print(f"   - {table}: {count:,} записей")
+    other_tables = sorted(t for t in tables if t not in priority_tables)
+    for table, count in zip(other_tables, POOL.map(get_table_count, other_tables)):
+        print(f"   - {table}: {count}")
+
+    SNAPSHOTS.save()
+    print(f"\n📸 {SNAPSHOTS.stats()}")
 
     print("\n" + "=" * 80)
     print("✅ АНАЛИЗ ЗАВЕРШЁН")
@@ -155,3 +185,5 @@ if __name__ == "__main__":
         print(f"❌ Ошибка: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        POOL.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Отчёт о нагрузке на БД club_hranitel: горячие запросы, неиспользуемые индексы,
+таблицы с seq scan и кандидаты в индексы.
+
+Нужно расширение pg_stat_statements (shared_preload_libraries + CREATE EXTENSION),
+без него раздел горячих запросов и кандидатов будет пустым.
+
+Использование:
+    python3 analyze_usage.py [--limit 15]
+"""
+import argparse
+import os
+
+from db_analysis.counts import cursor_fetch, format_bytes, quote_ident
+from db_analysis.db import ConnectionPool
+from db_analysis.usage import HOT_QUERIES_LIMIT, UsageReport, short_query
+
+# Параметры подключения (как у city_sync)
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', '31.128.36.81'),
+    'port': int(os.getenv('DB_PORT', '5423')),
+    'database': os.getenv('DB_NAME', 'club_hranitel'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'kH*kyrS&9z7K'),
+    'connect_timeout': 10,
+}
+
+POOL = ConnectionPool(DB_CONFIG, size=1)
+
+def analyze_usage(limit):
+    """Отчёт по накопительной статистике"""
+    report = UsageReport(cursor_fetch(POOL.connection), hot_limit=limit)
+
+    print("=" * 80)
+    print(f"НАГРУЗКА НА БД {DB_CONFIG['database']}")
+    print("=" * 80)
+    print(f"🕒 {report.stats_reset()}")
+
+    # Горячие запросы
+    print("\n" + "=" * 80)
+    print(f"🔥 САМЫЕ ДОРОГИЕ ЗАПРОСЫ (топ {limit} по суммарному времени):")
+    print("-" * 80)
+    hot = report.hot_queries()
+    if not hot:
+        print("   ⚠️  pg_stat_statements не установлен или пуст")
+    for i, (share, total_ms, calls, mean_ms, rows, read_blocks, query) in enumerate(hot, 1):
+        print(f"{i:2}. {share:6.1%}  всего {total_ms / 1000:,.1f} с, вызовов {calls:,}, "
+              f"среднее {mean_ms:,.2f} мс, строк {rows:,}, блоков с диска {read_blocks:,}")
+        print(f"    {short_query(query)}")
+
+    # Таблицы с seq scan
+    print("\n" + "=" * 80)
+    print("🐢 ТАБЛИЦЫ, КОТОРЫЕ В ОСНОВНОМ ЧИТАЮТСЯ SEQ SCAN:")
+    print("-" * 80)
+    heavy = report.seq_scan_heavy()
+    if not heavy:
+        print("   ✅ Нет")
+    for table, seq_scan, seq_tup_read, idx_scan, n_live in heavy:
+        print(f"   - {table}: seq scan {seq_scan:,} (прочитано строк {seq_tup_read:,}), "
+              f"index scan {idx_scan:,}, строк ~{n_live:,}")
+
+    # Кандидаты в индексы
+    print("\n" + "=" * 80)
+    print("💡 КАНДИДАТЫ В ИНДЕКСЫ:")
+    print("-" * 80)
+    candidates = report.index_candidates()
+    if not candidates:
+        print("   Нет (или нет данных pg_stat_statements по этим таблицам)")
+    for table, column, seq_scan, per_scan, by_index, total_ms, queries in candidates:
+        index_str = "?" if by_index is None else f"~{by_index:,.0f}"
+        print(f"   - {table}({column}): сейчас ~{per_scan:,.0f} строк на seq scan, по индексу {index_str}; "
+              f"{queries} запрос(ов) с условием, {total_ms / 1000:,.1f} с суммарно")
+        print(f"     CREATE INDEX CONCURRENTLY {quote_ident(f'{table}_{column}_idx')} "
+              f"ON {quote_ident(table)} ({quote_ident(column)});")
+
+    # Неиспользуемые индексы
+    print("\n" + "=" * 80)
+    print("🗑  НЕИСПОЛЬЗУЕМЫЕ ИНДЕКСЫ (idx_scan = 0, без PK/UNIQUE):")
+    print("-" * 80)
+    unused = report.unused_indexes()
+    if not unused:
+        print("   ✅ Нет")
+    for table, index, size in unused:
+        print(f"   - {index} на {table}: {format_bytes(size)}")
+    if unused:
+        print(f"   Всего: {format_bytes(sum(size for _, _, size in unused))} "
+              "(проверьте реплики и редкие отчёты, прежде чем удалять)")
+
+    print("\n" + "=" * 80)
+    print("✅ ОТЧЁТ ГОТОВ")
+    print("=" * 80)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчёт о нагрузке на БД club_hranitel")
+    parser.add_argument("--limit", type=int, default=HOT_QUERIES_LIMIT, help="сколько горячих запросов показать")
+    args = parser.parse_args()
+    try:
+        analyze_usage(args.limit)
+    except Exception as e:
+        print(f"❌ Ошибка: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        POOL.close()
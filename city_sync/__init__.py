@@ -0,0 +1,4 @@
+"""
+Общий код синхронизации городов пользователей по участию в городских чатах
+(city_chats_ik → users.city / users.city_chat_id).
+"""
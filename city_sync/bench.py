@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк стратегий синхронизации на фейковом Bot API.
+
+Поднимает city_sync.fake_bot_api с синтетической матрицей членства,
+заполняет ОТДЕЛЬНУЮ тестовую БД теми же пользователями и чатами
+и по очереди прогоняет стратегии. Для каждой печатает число вызовов
+getChatMember, 429, время, найденных пользователей и вызовов на найденного.
+Перед прогонами проверяются повторы после 429 (check_user_in_chat через
+RateLimiter против фейкового сервера с низким лимитом) и на той же БД -
+запрос offline-first (типы и пары id/telegram_id, которые он возвращает
+через psycopg2). Только проверки, без БД: --checks-only.
+
+Тестовая БД задаётся BENCH_DB_NAME (по умолчанию city_sync_bench, должна
+существовать); таблицы users и city_chats_ik в ней пересоздаются.
+
+Запуск: python3 -m city_sync.bench --users 10000 --chats 80 --strategies resume,chat-major
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+import uuid
+
+from city_sync.config import DB_CONFIG
+from city_sync.core import check_user_in_chat, connect, ensure_schema, make_bot
+from city_sync.fake_bot_api import FakeBotAPIServer, FakeWorld
+from city_sync.hedging import Hedger
+from city_sync.limiter import RateLimiter
+from city_sync.strategies import STRATEGIES, SyncContext, load_city_texts
+from city_sync.writer import CityWriter
+
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "city_sync_bench")
+PROTECTED_DATABASES = ("club_hranitel", "postgres")
+
+SERVICE_TABLES = ("city_chat_probes", "city_chat_members", "city_sync_queue", "city_sync_state")
+
+
+def reset_db(conn, world: FakeWorld):
+    """Вернуть тестовую БД в исходное состояние перед прогоном стратегии"""
+    world.seed_db(conn)
+    with conn.cursor() as cur:
+        ensure_schema(cur)
+        cur.execute(f"TRUNCATE {', '.join(SERVICE_TABLES)}")
+    conn.commit()
+
+
+def check_results(conn, world: FakeWorld) -> tuple:
+    """(найдено, из них ошибочно) - сверка users.city_chat_id с матрицей членства"""
+    platform_by_record = {chat["record_id"]: chat["platform_id"] for chat in world.chats}
+    with conn.cursor() as cur:
+        cur.execute("SELECT telegram_id, city_chat_id FROM users WHERE city_chat_id IS NOT NULL")
+        rows = cur.fetchall()
+    conn.commit()
+    wrong = sum(1 for tg_id, record_id in rows
+                if not world.is_member(platform_by_record.get(record_id), tg_id))
+    return len(rows), wrong
+
+
+async def check_retry_after(probes: int = 40, flood_rps: float = 10):
+    """
+    Повторы после 429: одновременные check_user_in_chat против сервера с низким
+    лимитом должны получить 429, дождаться retry_after и вернуть верный ответ
+    (половина - с событием started, как у Hedger)
+    """
+    world = FakeWorld(probes, 4, seed=7)
+    server = FakeBotAPIServer(("127.0.0.1", 0), world, latency_ms=5, slow_share=0,
+                              flood_rps=flood_rps).start()
+    # Темп выше лимита сервера - 429 гарантированы
+    limiter = RateLimiter(rate=probes, burst=probes, max_concurrency=probes)
+    chat_id = world.chats[0]["platform_id"]
+    users = [user["telegram_id"] for user in world.users]
+    try:
+        async with make_bot(pool_size=probes, api_url=server.url) as bot:
+            results = await asyncio.gather(
+                *(check_user_in_chat(bot, chat_id, tg_id, limiter, asyncio.Event() if i % 2 else None)
+                  for i, tg_id in enumerate(users)),
+                return_exceptions=True)
+    finally:
+        server.shutdown()
+    for tg_id, result in zip(users, results):
+        if result is not world.is_member(chat_id, tg_id):
+            raise AssertionError(f"после 429: {tg_id} -> {result!r}, ожидалось {world.is_member(chat_id, tg_id)}")
+    if not limiter.throttled:
+        raise AssertionError("фейковый сервер не ответил 429 - повторы не проверены")
+    print(f"✅ Повторы после 429: {probes} проверок, 429: {limiter.throttled}, повторов: {limiter.retries}",
+          flush=True)
+
+
+def check_city_texts(conn, world: FakeWorld):
+    """
+    Запрос offline-first на настоящей БД: id приходят строками UUID
+    и в паре со своими telegram_id (seed_db строит id из telegram_id)
+    """
+    reset_db(conn, world)
+    with conn.cursor() as cur:
+        texts = load_city_texts(cur)
+    conn.commit()
+    expected = sum(1 for user in world.users if user["city"])
+    pairs = 0
+    for city, user_ids, telegram_ids in texts:
+        if len(user_ids) != len(telegram_ids):
+            raise AssertionError(f"{city!r}: {len(user_ids)} id и {len(telegram_ids)} telegram_id")
+        for user_id, tg_id in zip(user_ids, telegram_ids):
+            if not isinstance(user_id, str) or uuid.UUID(user_id).int != tg_id:
+                raise AssertionError(f"{city!r}: id {user_id!r} не соответствует telegram_id {tg_id}")
+            pairs += 1
+    if pairs != expected:
+        raise AssertionError(f"offline-first: {pairs} пользователей с текстом города, ожидалось {expected}")
+    print(f"✅ Запрос offline-first: {len(texts)} написаний, {pairs} пользователей", flush=True)
+
+
+async def run_strategy(name: str, conn, server: FakeBotAPIServer, args) -> dict:
+    reset_db(conn, server.world)
+    server.reset_stats()
+    limiter = RateLimiter(rate=args.rate, max_concurrency=args.max_concurrency)
+    writer = CityWriter()
+
+    started = time.monotonic()
+    async with make_bot(pool_size=args.max_concurrency, api_url=server.url) as bot:
+        hedger = Hedger(limiter) if args.hedge else None
+        ctx = SyncContext(conn, bot, limiter, writer, workers=args.max_concurrency, hedger=hedger)
+        # Построчный вывод стратегий в бенчмарке не нужен
+        with contextlib.redirect_stdout(io.StringIO()):
+            await ctx.prepare()
+            await STRATEGIES[name](ctx)
+    wall = time.monotonic() - started
+
+    resolved, wrong = check_results(conn, server.world)
+    calls = server.stats["getChatMember"]
+    return {
+        "strategy": name,
+        "wall_sec": round(wall, 1),
+        "get_chat_member": calls,
+        "other_calls": sum(v for k, v in server.stats.items() if k not in ("getChatMember", "429")),
+        "http_429": server.stats["429"],
+        "resolved": resolved,
+        "resolvable": server.world.resolvable(),
+        "wrong": wrong,
+        "calls_per_resolved": round(calls / resolved, 2) if resolved else None,
+        "calls_per_sec": round(calls / wall, 1) if wall else None,
+        "hedged": hedger.hedged if hedger else 0,
+    }
+
+
+def print_table(results: list):
+    print(f"\n{'стратегия':<16} {'время,с':>8} {'getChatMember':>14} {'429':>6} "
+          f"{'найдено':>12} {'ошибок':>7} {'вызовов/найд.':>14} {'rps':>6} {'хедж':>6}")
+    print("-" * 99)
+    for r in results:
+        print(f"{r['strategy']:<16} {r['wall_sec']:>8} {r['get_chat_member']:>14} {r['http_429']:>6} "
+              f"{r['resolved']:>6}/{r['resolvable']:<5} {r['wrong']:>7} "
+              f"{r['calls_per_resolved'] or '-':>14} {r['calls_per_sec'] or '-':>6} {r['hedged']:>6}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк стратегий синхронизации на фейковом Bot API")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--chats", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--strategies", default="resume,chat-major",
+                        help=f"через запятую из: {', '.join(STRATEGIES)}")
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--slow-share", type=float, default=0.01)
+    parser.add_argument("--flood-rps", type=float, default=30,
+                        help="лимит фейкового сервера (0 - без лимита)")
+    parser.add_argument("--rate", type=float, default=28, help="темп RateLimiter")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--hedge", action="store_true", help="хеджировать медленные запросы")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--checks-only", action="store_true", help="только проверки, не требующие БД")
+    args = parser.parse_args()
+
+    await check_retry_after()
+    if args.checks_only:
+        return
+
+    if BENCH_DB_NAME in PROTECTED_DATABASES:
+        print(f"❌ BENCH_DB_NAME={BENCH_DB_NAME}: бенчмарк очищает таблицы, нужна отдельная БД")
+        return
+
+    world = FakeWorld(args.users, args.chats, args.seed)
+    server = FakeBotAPIServer(("127.0.0.1", 0), world, latency_ms=args.latency_ms,
+                              slow_share=args.slow_share, flood_rps=args.flood_rps).start()
+    print(f"🤖 Фейковый Bot API: {server.url} | {args.users} × {args.chats} | находимых: {world.resolvable()}",
+          flush=True)
+
+    conn = connect({**DB_CONFIG, "database": BENCH_DB_NAME})
+    results = []
+    try:
+        check_city_texts(conn, world)
+        for name in args.strategies.split(","):
+            print(f"⏱  {name}...", flush=True)
+            results.append(await run_strategy(name.strip(), conn, server, args))
+    finally:
+        conn.close()
+        server.shutdown()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Постоянный кэш результатов getChatMember по парам (telegram_id, чат).
+
+Таблица city_chat_probes хранит статус последней проверки и время.
+У каждого статуса свой срок жизни: свежий ответ «не участник» тоже
+считается известным, поэтому повторные запуски не тратят запросы
+на пользователей, которых не нашли ни в одном чате совсем недавно.
+"""
+
+import os
+
+from psycopg2.extras import execute_values
+
+MEMBER = "member"
+NOT_MEMBER = "not_member"
+ERROR = "error"
+
+# Срок жизни результата по статусу, часы
+PROBE_TTL_HOURS = {
+    MEMBER: float(os.getenv("PROBE_TTL_MEMBER_HOURS", str(30 * 24))),
+    NOT_MEMBER: float(os.getenv("PROBE_TTL_NOT_MEMBER_HOURS", str(7 * 24))),
+    ERROR: float(os.getenv("PROBE_TTL_ERROR_HOURS", "1")),
+}
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS city_chat_probes (
+        telegram_id BIGINT NOT NULL,
+        chat_platform_id BIGINT NOT NULL,    -- city_chats_ik.platform_id
+        status TEXT NOT NULL,                -- member / not_member / error
+        checked_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (telegram_id, chat_platform_id)
+    );
+"""
+
+
+def status_of(is_member: bool | None) -> str:
+    if is_member is None:
+        return ERROR
+    return MEMBER if is_member else NOT_MEMBER
+
+
+class ProbeCache:
+    """Свежие результаты проверок в памяти + буфер новых записей"""
+
+    def __init__(self, save_negative: bool = True):
+        # save_negative=False - «не участник» не записывается в city_chat_probes:
+        # новый подписчик (listen) может вступить в чат через минуту после проверки
+        self.save_negative = save_negative
+        # {telegram_id: {chat_platform_id: True/False/None}}
+        self.fresh = {}
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, cur, telegram_ids: list | None = None):
+        """
+        Загрузить свежие (не истёкшие) результаты.
+        telegram_ids - ограничить выборку этими пользователями
+        """
+        query = """
+            SELECT telegram_id, chat_platform_id, status
+            FROM city_chat_probes
+            WHERE checked_at > NOW() - make_interval(secs => CASE status
+                WHEN %(member)s THEN %(ttl_member)s
+                WHEN %(not_member)s THEN %(ttl_not_member)s
+                ELSE %(ttl_error)s END)
+        """
+        params = {
+            "member": MEMBER,
+            "not_member": NOT_MEMBER,
+            "ttl_member": PROBE_TTL_HOURS[MEMBER] * 3600,
+            "ttl_not_member": PROBE_TTL_HOURS[NOT_MEMBER] * 3600,
+            "ttl_error": PROBE_TTL_HOURS[ERROR] * 3600,
+        }
+        if telegram_ids is not None:
+            query += " AND telegram_id = ANY(%(ids)s)"
+            params["ids"] = list(telegram_ids)
+        cur.execute(query, params)
+        for telegram_id, chat_platform_id, status in cur.fetchall():
+            value = None if status == ERROR else status == MEMBER
+            self.fresh.setdefault(telegram_id, {})[chat_platform_id] = value
+
+    def known(self, telegram_id: int, chat_platform_id: int) -> bool:
+        """Есть ли свежий результат (включая «не участник» и ошибку)"""
+        found = chat_platform_id in self.fresh.get(telegram_id, ())
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def get(self, telegram_id: int, chat_platform_id: int) -> bool | None:
+        return self.fresh.get(telegram_id, {}).get(chat_platform_id)
+
+    def put(self, telegram_id: int, chat_platform_id: int, is_member: bool | None):
+        self.fresh.setdefault(telegram_id, {})[chat_platform_id] = is_member
+        if is_member is False and not self.save_negative:
+            return
+        self.pending[(telegram_id, chat_platform_id)] = status_of(is_member)
+
+    def forget(self, telegram_id: int):
+        """Освободить память по обработанному пользователю"""
+        self.fresh.pop(telegram_id, None)
+
+    def flush(self, cur) -> int:
+        """Записать накопленные результаты одним запросом"""
+        if not self.pending:
+            return 0
+        rows = [(tg, chat, status) for (tg, chat), status in self.pending.items()]
+        execute_values(cur, """
+            INSERT INTO city_chat_probes (telegram_id, chat_platform_id, status, checked_at)
+            VALUES %s
+            ON CONFLICT (telegram_id, chat_platform_id) DO UPDATE SET
+                status = EXCLUDED.status,
+                checked_at = EXCLUDED.checked_at
+        """, rows, template="(%s, %s, %s, NOW())", page_size=1000)
+        self.pending.clear()
+        return len(rows)
+
+    def stats(self) -> str:
+        return f"кэш: {self.hits} попаданий / {self.misses} промахов"
@@ -0,0 +1,34 @@
+"""
+Конфигурация синхронизации городов.
+Значения по умолчанию совпадают с sync_city_chats*.py, любое можно
+переопределить через переменные окружения.
+"""
+
+import os
+
+BOT_TOKEN = os.getenv("BOT_TOKEN", "8233570593:AAFUrEuTDQbUvwollurpJhxynMHu54i4_sk")
+
+# Базовый URL Bot API. Для локальных прогонов указываем фейковый сервер,
+# например TELEGRAM_API_URL=http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# HTTP-транспорт Bot API: один пул keep-alive соединений на процесс.
+# HTTP/2 включается только для https и при установленном h2
+# (pip install "python-telegram-bot[http2]"), иначе HTTP/1.1
+BOT_HTTP_VERSION = os.getenv("BOT_HTTP_VERSION", "2")
+BOT_POOL_SIZE = int(os.getenv("BOT_POOL_SIZE", "32"))
+BOT_KEEPALIVE_SECONDS = float(os.getenv("BOT_KEEPALIVE_SECONDS", "60"))
+BOT_CONNECT_TIMEOUT = float(os.getenv("BOT_CONNECT_TIMEOUT", "5"))
+BOT_READ_TIMEOUT = float(os.getenv("BOT_READ_TIMEOUT", "10"))
+BOT_POOL_TIMEOUT = float(os.getenv("BOT_POOL_TIMEOUT", "30"))
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "31.128.36.81"),
+    "port": int(os.getenv("DB_PORT", "5423")),
+    "database": os.getenv("DB_NAME", "club_hranitel"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "kH*kyrS&9z7K"),
+}
+
+# Статусы, при которых пользователь считается участником чата
+MEMBER_STATUSES = ("creator", "administrator", "member", "restricted")
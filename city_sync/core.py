@@ -0,0 +1,192 @@
+"""
+Общие функции для работы с чатами и пользователями: подключение к БД,
+загрузка city_chats_ik, создание служебных таблиц, проверка членства.
+"""
+
+import asyncio
+import importlib.util
+import socket
+
+import httpx
+import psycopg2
+from telegram import Bot
+from telegram.error import BadRequest, TelegramError
+from telegram.request import HTTPXRequest
+
+from city_sync import cache, work_queue
+from city_sync.config import (
+    BOT_CONNECT_TIMEOUT, BOT_HTTP_VERSION, BOT_KEEPALIVE_SECONDS, BOT_POOL_SIZE, BOT_POOL_TIMEOUT,
+    BOT_READ_TIMEOUT, BOT_TOKEN, DB_CONFIG, MEMBER_STATUSES, TELEGRAM_API_URL,
+)
+
+# Служебные таблицы синхронизации (создаются при первом запуске)
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS city_chat_members (
+        telegram_id BIGINT NOT NULL,
+        chat_id INTEGER NOT NULL,            -- city_chats_ik.id
+        status TEXT NOT NULL,                -- статус из Bot API
+        is_member BOOLEAN NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (telegram_id, chat_id)
+    );
+    CREATE INDEX IF NOT EXISTS city_chat_members_chat_idx
+        ON city_chat_members (chat_id) WHERE is_member;
+
+    CREATE TABLE IF NOT EXISTS city_sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+"""
+
+
+# Ответы BadRequest про пользователя, а не про чат («chat not found» сюда не относится)
+USER_NOT_IN_CHAT_ERRORS = ("user not found", "participant_id_invalid")
+
+# Чаты, ошибку которых уже напечатали (одно сообщение на чат за процесс)
+_unreachable_chats = set()
+
+
+def connect(db_config: dict | None = None):
+    """Подключение к club_hranitel (или к указанной БД, например тестовой)"""
+    conn = psycopg2.connect(**(db_config or DB_CONFIG), connect_timeout=30)
+    conn.autocommit = False
+    return conn
+
+
+def make_request(pool_size: int = BOT_POOL_SIZE, api_url: str | None = None,
+                 http_version: str = BOT_HTTP_VERSION) -> HTTPXRequest:
+    """
+    Настроенный транспорт Bot API: пул keep-alive соединений, таймауты, HTTP/2.
+    pool_size должен быть не меньше числа одновременных запросов (MAX_CONCURRENCY),
+    по умолчанию у PTB всего одно соединение.
+    """
+    api_url = api_url or TELEGRAM_API_URL
+    # Без TLS HTTP/2 был бы h2c без согласования - фейковый сервер и прокси его не поймут
+    if http_version != "1.1" and (not api_url.startswith("https://") or not importlib.util.find_spec("h2")):
+        http_version = "1.1"
+    transport = httpx.AsyncHTTPTransport(
+        http1=http_version == "1.1",
+        http2=http_version != "1.1",
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=BOT_KEEPALIVE_SECONDS,
+        ),
+        # Заголовки и тело запроса уходят отдельными пакетами: без TCP_NODELAY
+        # Nagle + delayed ACK добавляют до 40 мс к каждому запросу
+        socket_options=[
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ],
+    )
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=BOT_CONNECT_TIMEOUT,
+        read_timeout=BOT_READ_TIMEOUT,
+        write_timeout=BOT_READ_TIMEOUT,
+        pool_timeout=BOT_POOL_TIMEOUT,
+        http_version=http_version,
+        # Свой транспорт: у httpx limits/http2 клиента не применяются к transport,
+        # поэтому всё задаём в нём
+        httpx_kwargs={"transport": transport},
+    )
+
+
+def make_bot(token: str = BOT_TOKEN, pool_size: int = BOT_POOL_SIZE, api_url: str | None = None) -> Bot:
+    """
+    Бот с общим настроенным транспортом (make_request) и настраиваемым
+    адресом Bot API (для локального фейкового сервера).
+    """
+    api_url = (api_url or TELEGRAM_API_URL).rstrip("/")
+    return Bot(
+        token=token,
+        base_url=f"{api_url}/bot",
+        base_file_url=f"{api_url}/file/bot",
+        request=make_request(pool_size, api_url),
+        # Long polling трекера держит соединение до POLL_TIMEOUT - отдельный пул
+        get_updates_request=make_request(1, api_url),
+    )
+
+
+def ensure_schema(cur):
+    """Создать служебные таблицы, если их ещё нет"""
+    cur.execute(SCHEMA_SQL)
+    cur.execute(cache.SCHEMA_SQL)
+    cur.execute(work_queue.SCHEMA_SQL)
+
+
+def load_chats(cur) -> list:
+    """
+    Загрузить городские чаты.
+    Возвращает [(telegram_chat_id, db_record_id, city_name), ...]
+    """
+    cur.execute("""
+        SELECT id, platform_id, city
+        FROM city_chats_ik
+        WHERE platform_id IS NOT NULL
+        ORDER BY city
+    """)
+    return [(int(platform_id), record_id, city) for record_id, platform_id, city in cur.fetchall()]
+
+
+def is_active_member(member) -> bool:
+    """Является ли ChatMember действующим участником чата"""
+    if member.status not in MEMBER_STATUSES:
+        return False
+    # restricted бывает и у вышедших из чата: смотрим флаг is_member
+    if member.status == "restricted":
+        return bool(getattr(member, "is_member", True))
+    return True
+
+
+def get_state(cur, key: str, default=None):
+    """Прочитать значение из city_sync_state"""
+    cur.execute("SELECT value FROM city_sync_state WHERE key = %s", (key,))
+    row = cur.fetchone()
+    return row[0] if row else default
+
+
+def set_state(cur, key: str, value):
+    """Записать значение в city_sync_state"""
+    cur.execute("""
+        INSERT INTO city_sync_state (key, value, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+    """, (key, str(value)))
+
+
+async def check_user_in_chat(bot: Bot, chat_id: int, user_id: int, limiter,
+                             started: asyncio.Event | None = None) -> bool | None:
+    """
+    Проверить, является ли пользователь участником чата.
+    True/False - ответ Telegram, None - проверить не удалось (чат недоступен,
+    кончились повторы после RetryAfter и т.п.), такой ответ нельзя считать «не участник».
+    started - выставляется, когда ограничитель пропустил запрос (для Hedger)
+    """
+    try:
+        member = await limiter.call(lambda: bot.get_chat_member(chat_id, user_id), started)
+    except BadRequest as e:
+        # «user not found» / «PARTICIPANT_ID_INVALID» - пользователя в чате нет
+        message = str(e).lower()
+        if any(error in message for error in USER_NOT_IN_CHAT_ERRORS):
+            return False
+        # «chat not found» и прочее про сам чат - ошибка, а не «не участник»
+        if chat_id not in _unreachable_chats:
+            _unreachable_chats.add(chat_id)
+            print(f"  ⚠️  Чат {chat_id} недоступен боту: {e}", flush=True)
+        return None
+    except TelegramError:
+        return None
+    return is_active_member(member)
+
+
+async def fetch_member_counts(bot: Bot, limiter, chat_list: list) -> dict:
+    """Число участников каждого чата: {db_record_id: count}. Один запрос на чат за запуск"""
+    counts = {}
+    for telegram_chat_id, db_record_id, city_name in chat_list:
+        try:
+            counts[db_record_id] = await limiter.call(lambda: bot.get_chat_member_count(telegram_chat_id))
+        except TelegramError as e:
+            print(f"  ⚠️  Не удалось получить число участников {city_name}: {e}", flush=True)
+    return counts
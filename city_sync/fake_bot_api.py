@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Локальный фейковый Telegram Bot API для прогонов синхронизации без Telegram.
+
+Реализует getMe, getChatMember, getChatMemberCount, getChatAdministrators
+и getUpdates (события chat_member) поверх синтетической матрицы
+«пользователь × чат». Задержка ответа - логнормальная с редкими медленными
+выбросами, при превышении глобального лимита отвечает 429 с retry_after,
+как настоящий Bot API.
+
+Запуск: python3 -m city_sync.fake_bot_api --port 8081 --users 10000 --chats 80
+затем: TELEGRAM_API_URL=http://127.0.0.1:8081 python3 sync_city_chats.py ...
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from psycopg2.extras import execute_values
+
+COUNTRIES = [("Россия", "7", 0.8), ("Казахстан", "77", 0.1), ("Беларусь", "375", 0.1)]
+CITY_TEXT_SHARE = 0.4   # доля пользователей с заполненным users.city
+MEMBER_SHARE = 0.7      # доля пользователей, состоящих хотя бы в одном чате
+SECOND_CHAT_SHARE = 0.05
+
+BENCH_USERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS city_chats_ik (
+        id SERIAL PRIMARY KEY,
+        country TEXT,
+        city TEXT NOT NULL,
+        chat_name TEXT,
+        chat_link TEXT,
+        platform_id TEXT
+    );
+    CREATE TABLE IF NOT EXISTS users (
+        id UUID PRIMARY KEY,
+        telegram_id BIGINT UNIQUE NOT NULL,
+        first_name TEXT,
+        phone TEXT,
+        city TEXT,
+        city_chat_id INTEGER,
+        subscription_expires TIMESTAMP
+    );
+"""
+
+
+class FakeWorld:
+    """Синтетические чаты, пользователи и матрица членства (детерминированно по seed)"""
+
+    def __init__(self, users: int = 10_000, chats: int = 80, seed: int = 1):
+        rng = random.Random(seed)
+        self.rng = rng
+
+        # Чаты: размеры по закону Ципфа - несколько крупных городов и длинный хвост
+        self.chats = []
+        for i in range(chats):
+            country, code, _ = rng.choices(COUNTRIES, weights=[c[2] for c in COUNTRIES])[0]
+            self.chats.append({
+                "record_id": i + 1,
+                "platform_id": -1001000000000 - i,
+                "city": f"Город {i + 1:03d}",
+                "country": country,
+                "code": code,
+                "weight": 1.0 / (i + 1),
+            })
+        weights = [chat["weight"] for chat in self.chats]
+
+        self.users = []
+        self.members = {}   # telegram_id -> set(platform_id)
+        for i in range(users):
+            tg_id = 100_000_000 + i
+            joined = set()
+            home = None
+            if rng.random() < MEMBER_SHARE:
+                home = rng.choices(self.chats, weights=weights)[0]
+                joined.add(home["platform_id"])
+                if rng.random() < SECOND_CHAT_SHARE:
+                    joined.add(rng.choices(self.chats, weights=weights)[0]["platform_id"])
+            code = home["code"] if home else rng.choice(COUNTRIES)[1]
+            phone = "+" + code + "".join(str(rng.randint(0, 9)) for _ in range(11 - len(code)))
+            city_text = None
+            if home and rng.random() < CITY_TEXT_SHARE:
+                city_text = rng.choice([home["city"], f"г. {home['city']}", home["city"].upper()])
+            self.users.append({"telegram_id": tg_id, "first_name": f"User{i}", "phone": phone, "city": city_text})
+            self.members[tg_id] = joined
+
+        self.chat_by_platform = {chat["platform_id"]: chat for chat in self.chats}
+        self.lock = threading.Lock()
+
+    def is_member(self, chat_id: int, user_id: int) -> bool:
+        return chat_id in self.members.get(user_id, ())
+
+    def member_count(self, chat_id: int) -> int:
+        # +1: бот синхронизации тоже участник чата
+        return sum(1 for joined in self.members.values() if chat_id in joined) + 1
+
+    def resolvable(self) -> int:
+        """Сколько пользователей вообще можно найти"""
+        return sum(1 for joined in self.members.values() if joined)
+
+    def seed_db(self, conn):
+        """
+        Заполнить тестовую БД чатами и пользователями этого мира.
+        Только для отдельной тестовой базы - таблицы очищаются!
+        """
+        with conn.cursor() as cur:
+            cur.execute(BENCH_USERS_SCHEMA)
+            cur.execute("TRUNCATE city_chats_ik, users RESTART IDENTITY")
+            execute_values(cur, """
+                INSERT INTO city_chats_ik (id, country, city, chat_name, platform_id) VALUES %s
+            """, [(c["record_id"], c["country"], c["city"], f"Чат {c['city']}", str(c["platform_id"]))
+                  for c in self.chats])
+            expires = datetime.now() + timedelta(days=30)
+            execute_values(cur, """
+                INSERT INTO users (id, telegram_id, first_name, phone, city, subscription_expires) VALUES %s
+            """, [(str(uuid.UUID(int=u["telegram_id"])), u["telegram_id"], u["first_name"], u["phone"],
+                   u["city"], expires) for u in self.users], page_size=5000)
+        conn.commit()
+
+    def random_event(self) -> tuple:
+        """Случайное вступление/выход: (chat_id, user_id, old_status, new_status)"""
+        with self.lock:
+            user = self.rng.choice(self.users)["telegram_id"]
+            chat = self.rng.choice(self.chats)["platform_id"]
+            joined = self.members[user]
+            if chat in joined:
+                joined.discard(chat)
+                return chat, user, "member", "left"
+            joined.add(chat)
+            return chat, user, "left", "member"
+
+
+class FakeBotAPIServer(ThreadingHTTPServer):
+    """HTTP-сервер фейкового Bot API со статистикой вызовов"""
+
+    daemon_threads = True
+
+    def __init__(self, address, world: FakeWorld, latency_ms: float = 40, latency_sigma: float = 0.5,
+                 slow_share: float = 0.01, slow_ms: float = 1500, flood_rps: float = 30,
+                 flood_burst: int = 30, events_per_sec: float = 0):
+        super().__init__(address, FakeBotAPIHandler)
+        self.world = world
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.slow_share = slow_share
+        self.slow_ms = slow_ms
+        self.flood_rps = flood_rps
+        self.flood_burst = flood_burst
+        self.tokens = float(flood_burst)
+        self.tokens_updated = time.monotonic()
+        self.events_per_sec = events_per_sec
+
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.updates = []
+        self.updates_cond = threading.Condition()
+        self.next_update_id = 1
+        self._rng = random.Random(world.rng.random())
+
+    def handle_error(self, request, client_address):
+        # Клиент отменил запрос (хеджирование, остановка) - это не ошибка сервера
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats.clear()
+
+    def take_token(self) -> float:
+        """0 - запрос разрешён, иначе retry_after в секундах"""
+        if not self.flood_rps:
+            return 0
+        with self.stats_lock:
+            now = time.monotonic()
+            self.tokens = min(self.flood_burst, self.tokens + (now - self.tokens_updated) * self.flood_rps)
+            self.tokens_updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return max(1, math.ceil((1 - self.tokens) / self.flood_rps))
+
+    def latency(self) -> float:
+        with self.stats_lock:
+            if self._rng.random() < self.slow_share:
+                return self.slow_ms / 1000
+            return self.latency_ms / 1000 * math.exp(self._rng.gauss(0, self.latency_sigma))
+
+    def push_event(self, chat_id: int, user_id: int, old_status: str, new_status: str):
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        with self.updates_cond:
+            self.updates.append({
+                "update_id": self.next_update_id,
+                "chat_member": {
+                    "chat": {"id": chat_id, "type": "supergroup", "title": str(chat_id)},
+                    "from": user,
+                    "date": int(time.time()),
+                    "old_chat_member": {"status": old_status, "user": user},
+                    "new_chat_member": {"status": new_status, "user": user},
+                },
+            })
+            self.next_update_id += 1
+            self.updates_cond.notify_all()
+
+    def run_events(self):
+        """Фоновый генератор событий chat_member"""
+        while self.events_per_sec:
+            time.sleep(self._rng.expovariate(self.events_per_sec))
+            self.push_event(*self.world.random_event())
+
+    def start(self) -> "FakeBotAPIServer":
+        """Запустить сервер (и генератор событий) в фоновых потоках"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        if self.events_per_sec:
+            threading.Thread(target=self.run_events, daemon=True).start()
+        return self
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у api.telegram.org
+    disable_nagle_algorithm = True  # заголовки и тело пишутся отдельно, без этого +40 мс на ответ
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self) -> dict:
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if len(body.encode()) < length:
+                raise ConnectionResetError("клиент закрыл соединение, не дослав тело запроса")
+            if "json" in (self.headers.get("Content-Type") or ""):
+                params.update(json.loads(body or "{}"))
+            else:
+                params.update({k: v[0] for k, v in parse_qs(body).items()})
+        return params
+
+    def _reply(self, payload: dict, code: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code: int, description: str, **parameters):
+        payload = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            payload["parameters"] = parameters
+        self._reply(payload, code)
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        server = self.server
+        method = urlparse(self.path).path.rsplit("/", 1)[-1]
+        params = self._params()
+
+        if method != "getUpdates":
+            retry_after = server.take_token()
+            if retry_after:
+                server.count("429")
+                return self._error(429, f"Too Many Requests: retry after {retry_after}", retry_after=retry_after)
+            time.sleep(server.latency())
+        server.count(method)
+
+        handler = getattr(self, f"api_{method}", None)
+        if not handler:
+            return self._error(404, "Not Found")
+        handler(params)
+
+    def api_getMe(self, params):
+        self._reply({"ok": True, "result": {
+            "id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False,
+        }})
+
+    def api_getChatMember(self, params):
+        chat_id, user_id = int(params["chat_id"]), int(params["user_id"])
+        if chat_id not in self.server.world.chat_by_platform:
+            return self._error(400, "Bad Request: chat not found")
+        status = "member" if self.server.world.is_member(chat_id, user_id) else "left"
+        self._reply({"ok": True, "result": {
+            "status": status,
+            "user": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        }})
+
+    def api_getChatMemberCount(self, params):
+        chat_id = int(params["chat_id"])
+        if chat_id not in self.server.world.chat_by_platform:
+            return self._error(400, "Bad Request: chat not found")
+        self._reply({"ok": True, "result": self.server.world.member_count(chat_id)})
+
+    def api_getChatAdministrators(self, params):
+        self._reply({"ok": True, "result": [{
+            "status": "administrator",
+            "user": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+            "can_be_edited": False, "is_anonymous": False, "can_manage_chat": True,
+            "can_delete_messages": True, "can_manage_video_chats": True, "can_restrict_members": True,
+            "can_promote_members": True, "can_change_info": True, "can_invite_users": True,
+        }]})
+
+    def api_getUpdates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self.server.updates_cond:
+            # Подтверждённые обновления удаляем, как настоящий Bot API
+            self.server.updates = [u for u in self.server.updates if u["update_id"] >= offset]
+            while not self.server.updates and time.monotonic() < deadline:
+                self.server.updates_cond.wait(deadline - time.monotonic())
+            result = self.server.updates[:100]
+        self._reply({"ok": True, "result": result})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фейковый Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--chats", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=40, help="медианная задержка ответа")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="разброс (логнормальный)")
+    parser.add_argument("--slow-share", type=float, default=0.01, help="доля медленных ответов")
+    parser.add_argument("--slow-ms", type=float, default=1500, help="задержка медленного ответа")
+    parser.add_argument("--flood-rps", type=float, default=30, help="лимит, после которого отвечаем 429")
+    parser.add_argument("--events-per-sec", type=float, default=0, help="генерировать события chat_member")
+    args = parser.parse_args()
+
+    world = FakeWorld(args.users, args.chats, args.seed)
+    server = FakeBotAPIServer(
+        (args.host, args.port), world,
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        slow_share=args.slow_share, slow_ms=args.slow_ms,
+        flood_rps=args.flood_rps, events_per_sec=args.events_per_sec,
+    )
+    print(f"🤖 Фейковый Bot API: {server.url} | {args.users} пользователей × {args.chats} чатов "
+          f"| находимых: {world.resolvable()}", flush=True)
+    if args.events_per_sec:
+        threading.Thread(target=server.run_events, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Хеджирование запросов к Bot API против хвостовых задержек.
+
+Если ответ на getChatMember не пришёл за p95 последних запросов,
+отправляем такой же запрос ещё раз и берём тот ответ, что придёт первым;
+второй отменяется. Дополнительные запросы ограничены бюджетом -
+долей от всех запросов запуска, - чтобы при общем замедлении Telegram
+хеджирование не удвоило нагрузку и не упёрлось в 429.
+"""
+
+import asyncio
+import os
+
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))  # доля дополнительных запросов (порог p95 - это ~5%)
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 100  # пока задержек мало, p95 ненадёжен - не хеджируем
+HEDGE_MIN_DELAY = 0.05   # сек, не чаще чем через 50 мс после основного запроса
+
+
+class Hedger:
+    """Повтор медленного запроса по порогу p95 с бюджетом дополнительных вызовов"""
+
+    def __init__(self, limiter, budget: float = HEDGE_BUDGET, percentile: float = HEDGE_PERCENTILE):
+        self.limiter = limiter
+        self.budget = budget
+        self.percentile = percentile
+        self.hedged = 0
+        self.wins = 0
+
+    def threshold(self) -> float | None:
+        """Через сколько секунд отправлять дублирующий запрос (None - сейчас нельзя)"""
+        metrics = self.limiter.metrics
+        if len(metrics.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.hedged >= self.budget * max(self.limiter.calls, 1):
+            return None
+        return max(HEDGE_MIN_DELAY, metrics.percentile(self.percentile))
+
+    async def run(self, make_call):
+        """
+        make_call(started) - возвращает корутину запроса, started (asyncio.Event)
+        выставляется, когда ограничитель пропустил запрос в сеть.
+        Ошибка (None) не считается ответом, пока второй запрос ещё не завершён.
+        """
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(make_call(started))
+        delay = self.threshold()
+        if delay is None:
+            return await primary
+        # Порог p95 - по сетевым задержкам (metrics.latencies), поэтому и отсчёт - с момента,
+        # когда ограничитель пропустил запрос: ожидание в очереди token bucket / AIMD не хеджируем
+        waiting = asyncio.ensure_future(started.wait())
+        try:
+            await asyncio.wait({primary, waiting}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiting.cancel()
+        if primary.done():
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or self.threshold() is None:
+            return await primary
+
+        self.hedged += 1
+        hedge = asyncio.ensure_future(make_call(asyncio.Event()))
+        tasks = [primary, hedge]
+        try:
+            result = None
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result is not None:
+                    break
+            if hedge.done() and not primary.done():
+                self.wins += 1
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> str:
+        return f"хеджирование: {self.hedged} повторов, {self.wins} быстрее основного"
@@ -0,0 +1,180 @@
+"""
+Общий ограничитель запросов к Bot API.
+
+- token bucket задаёт средний темп запросов (по умолчанию чуть ниже ~30 rps,
+  после которых Telegram начинает отвечать 429);
+- AIMD регулирует число одновременных запросов: +1 за каждое «окно»
+  успешных ответов, ×0.5 при RetryAfter;
+- RetryAfter ставит на паузу всех, кто пользуется ограничителем,
+  на указанное Telegram время, после чего запрос повторяется.
+
+Все вызовы Bot API в синхронизации идут через один экземпляр RateLimiter.
+"""
+
+import asyncio
+import os
+import time
+
+from telegram.error import RetryAfter, TimedOut, NetworkError
+
+from city_sync.metrics import CallMetrics
+
+RATE_LIMIT_PER_SEC = float(os.getenv("RATE_LIMIT_PER_SEC", "28"))
+RATE_BURST = int(os.getenv("RATE_BURST", "30"))
+MIN_CONCURRENCY = int(os.getenv("MIN_CONCURRENCY", "1"))
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "32"))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
+
+
+class TokenBucket:
+    """Асинхронный token bucket с возможностью глобальной паузы"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (RetryAfter) и обнулить запас"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    def slow_down(self, factor: float = 0.7):
+        self.rate = max(1.0, self.rate * factor)
+
+    def speed_up(self, step: float = 0.05):
+        self.rate = min(self.max_rate, self.rate + step)
+
+
+class AIMDConcurrency:
+    """Лимит одновременных запросов с additive-increase / multiplicative-decrease"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    @property
+    def current(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.current)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        # +1 примерно за каждые `limit` успешных ответов
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    async def on_throttle(self):
+        async with self._cond:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """Token bucket + AIMD + корректная обработка RetryAfter"""
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_PER_SEC,
+        burst: int = RATE_BURST,
+        min_concurrency: int = MIN_CONCURRENCY,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AIMDConcurrency(
+            initial=max(min_concurrency, min(max_concurrency, 4)),
+            minimum=min_concurrency,
+            maximum=max_concurrency,
+        )
+        self.max_retries = max_retries
+        self.metrics = CallMetrics()
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+
+    async def call(self, make_request, started: asyncio.Event | None = None):
+        """
+        Выполнить запрос через ограничитель.
+        make_request - функция без аргументов, возвращающая корутину
+        (нужна фабрика, т.к. при повторе корутину создаём заново).
+        started - выставляется, когда ограничитель пропустил запрос в сеть
+        """
+        attempt = 0
+        while True:
+            await self.concurrency.acquire()
+            try:
+                await self.bucket.acquire()
+                if started is not None and not started.is_set():
+                    started.set()
+                self.calls += 1
+                sent_at = time.monotonic()
+                result = await make_request()
+            except RetryAfter as e:
+                self.metrics.observe(time.monotonic() - sent_at, "429")
+                self.throttled += 1
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                self.bucket.pause(float(retry_after))
+                self.bucket.slow_down()
+                await self.concurrency.on_throttle()
+                error, delay = e, 0
+            except (TimedOut, NetworkError) as e:
+                # BadRequest в PTB наследует NetworkError, но это ответ Telegram,
+                # а не сбой сети - такие ошибки не повторяем
+                self.metrics.observe(time.monotonic() - sent_at, type(e).__name__)
+                if type(e) not in (TimedOut, NetworkError):
+                    raise
+                error, delay = e, min(2 ** attempt, 30)
+            except Exception as e:
+                self.metrics.observe(time.monotonic() - sent_at, type(e).__name__)
+                raise
+            else:
+                self.metrics.observe(time.monotonic() - sent_at)
+                self.concurrency.on_success()
+                self.bucket.speed_up()
+                return result
+            finally:
+                await self.concurrency.release()
+
+            attempt += 1
+            self.retries += 1
+            if attempt > self.max_retries:
+                raise error
+            # пауза после RetryAfter уже выставлена в bucket, здесь - только сетевой backoff
+            await asyncio.sleep(delay)
+
+    def stats(self) -> str:
+        return (f"rps≤{self.bucket.rate:.1f} | параллельно≤{self.concurrency.current} | "
+                f"запросов: {self.calls} | 429: {self.throttled} | повторов: {self.retries}")
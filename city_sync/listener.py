@@ -0,0 +1,157 @@
+"""
+Непрерывная синхронизация по уведомлениям Postgres (LISTEN/NOTIFY).
+
+Триггер на users шлёт pg_notify с telegram_id, когда пользователь
+появляется с активной подпиской или subscription_expires переносится
+из прошлого в будущее (новая оплата / возврат). Слушатель собирает
+такие id небольшими пачками и сразу проверяет только их - город нового
+подписчика определяется за секунды, полный проход нужен лишь после
+простоя слушателя.
+
+Сразу после оплаты подписчик обычно ещё не успел вступить в чат, поэтому
+ненайденные проверяются повторно через LISTEN_RECHECK_MINUTES.
+"""
+
+import asyncio
+import heapq
+import os
+import time
+
+from city_sync.core import connect
+
+CHANNEL = "city_sync_users"
+BATCH_WINDOW = float(os.getenv("LISTEN_BATCH_WINDOW", "1"))  # сек, собрать пачку после первого уведомления
+TRIGGER_LOCK_TIMEOUT = os.getenv("LISTEN_TRIGGER_LOCK_TIMEOUT", "5s")
+# Через сколько минут после предыдущей попытки снова искать чат ненайденного подписчика
+RECHECK_MINUTES = [float(m) for m in os.getenv("LISTEN_RECHECK_MINUTES", "5,30,180,1440").split(",") if m.strip()]
+
+TRIGGER_SQL = f"""
+    CREATE OR REPLACE FUNCTION city_sync_notify() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.telegram_id IS NOT NULL
+           AND NEW.subscription_expires > NOW()
+           AND (TG_OP = 'INSERT'
+                OR OLD.subscription_expires IS NULL
+                OR OLD.subscription_expires <= NOW()) THEN
+            PERFORM pg_notify('{CHANNEL}', NEW.telegram_id::text);
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    -- CREATE TRIGGER берёт на users блокировку, несовместимую с записью: только если
+    -- триггера ещё нет (тело функции обновляется выше без блокировки таблицы)
+    DO $do$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                       WHERE tgname = 'city_sync_notify' AND tgrelid = 'users'::regclass) THEN
+            CREATE TRIGGER city_sync_notify
+                AFTER INSERT OR UPDATE OF subscription_expires ON users
+                FOR EACH ROW EXECUTE FUNCTION city_sync_notify();
+        END IF;
+    END
+    $do$;
+"""
+
+
+def ensure_trigger(cur):
+    """
+    Создать триггер уведомлений на users, если его нет (функцию - обновить).
+    Не ждём блокировку users дольше TRIGGER_LOCK_TIMEOUT: за долгой транзакцией
+    в очередь встал бы весь трафик users
+    """
+    cur.execute("SET LOCAL lock_timeout = %s", (TRIGGER_LOCK_TIMEOUT,))
+    cur.execute(TRIGGER_SQL)
+
+
+class NotificationListener:
+    """Отдельное autocommit-соединение с LISTEN, уведомления ждём в цикле событий"""
+
+    def __init__(self, db_config: dict | None = None, channel: str = CHANNEL):
+        self.db_config = db_config
+        self.channel = channel
+        self.conn = None
+
+    def connect(self):
+        self.close()
+        self.conn = connect(self.db_config)
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _drain(self) -> list:
+        self.conn.poll()
+        ids = [int(notify.payload) for notify in self.conn.notifies]
+        self.conn.notifies.clear()
+        return ids
+
+    async def wait(self, timeout: float) -> list:
+        """telegram_id из уведомлений; ждёт не дольше timeout секунд"""
+        ids = self._drain()
+        if ids:
+            return ids
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(self.conn.fileno(), ready.set)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(self.conn.fileno())
+        return self._drain()
+
+    async def batches(self, idle_timeout: float = 60):
+        """
+        Пачки telegram_id: после первого уведомления ждём BATCH_WINDOW, собирая остальные.
+        Без уведомлений за idle_timeout - пустая пачка (время для отложенных проверок)
+        """
+        while True:
+            ids = await self.wait(idle_timeout)
+            if not ids:
+                yield []
+                continue
+            await asyncio.sleep(BATCH_WINDOW)
+            ids += self._drain()
+            yield list(dict.fromkeys(ids))
+
+
+class RecheckSchedule:
+    """Отложенные повторные проверки ненайденных подписчиков (в памяти процесса)"""
+
+    def __init__(self, delays_minutes: list = RECHECK_MINUTES):
+        self.delays = [minutes * 60 for minutes in delays_minutes]
+        self._heap = []        # (когда, telegram_id)
+        self._attempts = {}    # telegram_id -> сколько повторов уже назначено
+        self.scheduled = 0
+        self.given_up = 0
+
+    def schedule(self, telegram_id: int):
+        """Назначить следующую проверку; после последней - оставить полному проходу"""
+        attempt = self._attempts.get(telegram_id, 0)
+        if attempt >= len(self.delays):
+            self._attempts.pop(telegram_id, None)
+            self.given_up += 1
+            return
+        self._attempts[telegram_id] = attempt + 1
+        heapq.heappush(self._heap, (time.monotonic() + self.delays[attempt], telegram_id))
+        self.scheduled += 1
+
+    def found(self, telegram_id: int):
+        self._attempts.pop(telegram_id, None)
+
+    def due(self) -> list:
+        """telegram_id, которым пора повторить проверку"""
+        now = time.monotonic()
+        ids = []
+        while self._heap and self._heap[0][0] <= now:
+            ids.append(heapq.heappop(self._heap)[1])
+        return ids
+
+    def stats(self) -> str:
+        return f"повторных проверок: {self.scheduled}, ждут: {len(self._heap)}, отложено до полного прохода: {self.given_up}"
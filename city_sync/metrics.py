@@ -0,0 +1,183 @@
+"""
+Метрики синхронизации во время работы.
+
+CallMetrics собирается всегда (внутри RateLimiter): задержки последних
+запросов, исходы (ok / 429 / сетевые / прочие ошибки) и темп вызовов.
+MetricsExporter по желанию отдаёт снимок в формате OpenMetrics по HTTP
+(--metrics-port) и/или пишет JSON-файл (--metrics-file) раз в interval секунд:
+вызовы/сек, перцентили задержки, 429 и ошибки, текущая параллельность,
+вызовов на найденного, задержка записи в БД и ETA.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_WINDOW = int(os.getenv("METRICS_LATENCY_WINDOW", "5000"))  # последних запросов
+RATE_WINDOW = 60  # сек для вызовов/сек
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))
+
+
+class CallMetrics:
+    """Задержки и исходы запросов к Bot API"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.completed = deque()
+        self.outcomes = Counter()
+
+    def observe(self, latency: float, outcome: str = "ok"):
+        now = time.monotonic()
+        self.outcomes[outcome] += 1
+        if outcome == "ok":
+            self.latencies.append(latency)
+        self.completed.append(now)
+        while self.completed and self.completed[0] < now - RATE_WINDOW:
+            self.completed.popleft()
+
+    def percentile(self, p: float) -> float | None:
+        """Перцентиль задержки (сек) по последним успешным запросам"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def rate(self) -> float:
+        """Вызовов в секунду за последнюю минуту"""
+        now = time.monotonic()
+        while self.completed and self.completed[0] < now - RATE_WINDOW:
+            self.completed.popleft()
+        if not self.completed:
+            return 0.0
+        span = max(1.0, min(RATE_WINDOW, now - self.completed[0]))
+        return len(self.completed) / span
+
+
+class MetricsExporter:
+    """Периодический снимок метрик SyncContext: OpenMetrics по HTTP и/или JSON-файл"""
+
+    def __init__(self, ctx, port: int | None = None, json_path: str | None = None,
+                 interval: float = METRICS_INTERVAL):
+        self.ctx = ctx
+        self.port = port
+        self.json_path = json_path
+        self.interval = interval
+        self.latest_text = ""
+        self._server = None
+
+    def snapshot(self) -> dict:
+        ctx = self.ctx
+        calls = ctx.limiter.metrics
+        writer = ctx.writer
+        elapsed = (time.monotonic() - ctx.started_monotonic) or 1e-9
+        users_per_sec = ctx.checked / elapsed
+        remaining = max(0, ctx.total - ctx.checked)
+        errors = {k: v for k, v in calls.outcomes.items() if k not in ("ok", "429")}
+        return {
+            "timestamp": time.time(),
+            "elapsed_sec": round(elapsed, 1),
+            "calls_total": ctx.limiter.calls,
+            "calls_per_sec": round(calls.rate(), 2),
+            "latency_p50_ms": _ms(calls.percentile(50)),
+            "latency_p95_ms": _ms(calls.percentile(95)),
+            "latency_p99_ms": _ms(calls.percentile(99)),
+            "http_429_total": calls.outcomes["429"],
+            "errors_total": errors,
+            "rate_limit_rps": round(ctx.limiter.bucket.rate, 2),
+            "concurrency_limit": ctx.limiter.concurrency.current,
+            "in_flight": ctx.limiter.concurrency.in_flight,
+            "users_total": ctx.total,
+            "users_checked": ctx.checked,
+            "users_found": ctx.found,
+            "calls_per_resolved": round(ctx.limiter.calls / ctx.found, 2) if ctx.found else None,
+            "db_flush_last_ms": round(writer.last_flush_seconds * 1000, 1),
+            "db_flush_avg_ms": round(writer.flush_seconds / writer.flushes * 1000, 1) if writer.flushes else None,
+            "hedged_total": ctx.hedger.hedged if ctx.hedger else None,
+            "eta_sec": round(remaining / users_per_sec) if users_per_sec > 0 else None,
+        }
+
+    def openmetrics(self, snap: dict) -> str:
+        lines = []
+
+        def metric(name, kind, value, help_text, labels=""):
+            if value is None:
+                return
+            lines.append(f"# HELP city_sync_{name} {help_text}")
+            lines.append(f"# TYPE city_sync_{name} {kind}")
+            suffix = "_total" if kind == "counter" else ""
+            lines.append(f"city_sync_{name}{suffix}{labels} {value}")
+
+        metric("calls", "counter", snap["calls_total"], "Bot API calls")
+        metric("calls_per_second", "gauge", snap["calls_per_sec"], "Bot API calls per second, last minute")
+        for p in ("50", "95", "99"):
+            value = snap[f"latency_p{p}_ms"]
+            metric(f"latency_p{p}_milliseconds", "gauge", value, f"Bot API latency p{p}")
+        metric("http_429", "counter", snap["http_429_total"], "RetryAfter responses")
+        lines.append("# HELP city_sync_errors Bot API errors by type")
+        lines.append("# TYPE city_sync_errors counter")
+        for kind, value in snap["errors_total"].items():
+            lines.append(f'city_sync_errors_total{{kind="{kind}"}} {value}')
+        metric("rate_limit_rps", "gauge", snap["rate_limit_rps"], "Current token bucket rate")
+        metric("concurrency_limit", "gauge", snap["concurrency_limit"], "Current AIMD concurrency limit")
+        metric("in_flight", "gauge", snap["in_flight"], "Requests in flight")
+        metric("users_checked", "counter", snap["users_checked"], "Users checked")
+        metric("users_found", "counter", snap["users_found"], "Users resolved to a city chat")
+        metric("calls_per_resolved", "gauge", snap["calls_per_resolved"], "Bot API calls per resolved user")
+        metric("db_flush_last_milliseconds", "gauge", snap["db_flush_last_ms"], "Last DB flush duration")
+        metric("hedged", "counter", snap["hedged_total"], "Hedged duplicate requests")
+        metric("eta_seconds", "gauge", snap["eta_sec"], "Estimated time to finish")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def refresh(self):
+        snap = self.snapshot()
+        self.latest_text = self.openmetrics(snap)
+        if self.json_path:
+            tmp = self.json_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(snap, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.json_path)
+
+    def start_http(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = exporter.latest_text.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"📈 Метрики: http://0.0.0.0:{self.port}/metrics", flush=True)
+
+    async def run(self):
+        """
+        Обновлять снимок раз в interval секунд.
+        Снимок считается в цикле событий, HTTP-поток только отдаёт готовый текст.
+        """
+        if self.port:
+            self.start_http()
+        try:
+            while True:
+                self.refresh()
+                await asyncio.sleep(self.interval)
+        finally:
+            self.refresh()
+            if self._server:
+                self._server.shutdown()
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 1) if seconds is not None else None
@@ -0,0 +1,86 @@
+"""
+Отсечение чатов по числу участников.
+
+getChatMemberCount вызывается один раз на чат за запуск. Параллельно
+считаем, сколько наших пользователей уже известно как участники чата
+(users.city_chat_id активных подписчиков, трекер событий, свежие проверки
+и находки этого запуска; ответ «не участник» убирает из известных).
+Когда известных столько же, сколько участников, остальных проверять
+бессмысленно: чат исчерпан и дальше не опрашивается.
+На длинном хвосте маленьких городских чатов это экономит большую часть запросов.
+"""
+
+import os
+
+from city_sync.cache import MEMBER, PROBE_TTL_HOURS
+
+# Места в чате, которые заняты не нашими пользователями: сам бот синхронизации
+BOT_SEATS = int(os.getenv("PRUNE_BOT_SEATS", "1"))
+
+
+class MemberBudget:
+    """Сколько участников каждого чата уже найдено среди наших пользователей"""
+
+    def __init__(self, chat_list: list, member_counts: dict, bot_seats: int = BOT_SEATS):
+        # chat_list: [(telegram_chat_id, db_record_id, city_name)], member_counts: {db_record_id: count}
+        self.record_of = {telegram_chat_id: record_id for telegram_chat_id, record_id, _ in chat_list}
+        self.capacity = {record_id: count - bot_seats for record_id, count in member_counts.items()}
+        self.known = {record_id: set() for record_id in self.capacity}
+        self.skipped = 0
+
+    def load(self, cur):
+        """Известные участники из прошлых запусков, трекера и свежих проверок"""
+        cur.execute("""
+            SELECT u.city_chat_id, u.telegram_id
+            FROM users u
+            WHERE u.city_chat_id IS NOT NULL AND u.telegram_id IS NOT NULL
+              -- city_chat_id у истёкших остаётся, а из чатов их удаляет subscription guard
+              AND u.subscription_expires > NOW()
+            UNION
+            SELECT chat_id, telegram_id
+            FROM city_chat_members
+            WHERE is_member
+            UNION
+            SELECT c.id, p.telegram_id
+            FROM city_chat_probes p
+            JOIN city_chats_ik c ON c.platform_id = p.chat_platform_id::text
+            WHERE p.status = %(member)s
+              AND p.checked_at > NOW() - make_interval(secs => %(ttl)s)
+        """, {"member": MEMBER, "ttl": PROBE_TTL_HOURS[MEMBER] * 3600})
+        for record_id, telegram_id in cur.fetchall():
+            if record_id in self.known:
+                self.known[record_id].add(telegram_id)
+
+    def add(self, telegram_chat_id: int, telegram_id: int):
+        record_id = self.record_of.get(telegram_chat_id)
+        if record_id in self.known:
+            self.known[record_id].add(telegram_id)
+
+    def discard(self, telegram_chat_id: int, telegram_id: int):
+        """Известный участник больше не в чате (проверка ответила «не участник»)"""
+        record_id = self.record_of.get(telegram_chat_id)
+        if record_id in self.known:
+            self.known[record_id].discard(telegram_id)
+
+    def exhausted(self, telegram_chat_id: int) -> bool:
+        """Все участники чата уже известны - остальные пользователи в нём не состоят"""
+        record_id = self.record_of.get(telegram_chat_id)
+        if record_id not in self.capacity:
+            return False  # число участников неизвестно - проверяем как обычно
+        return len(self.known[record_id]) >= self.capacity[record_id]
+
+    def can_skip(self, telegram_chat_id: int, telegram_id: int) -> bool:
+        """
+        Можно не проверять: чат исчерпан и пользователь не среди известных участников.
+        Известных участников проверяем как обычно - они могли выйти из чата.
+        """
+        if not self.exhausted(telegram_chat_id):
+            return False
+        return telegram_id not in self.known[self.record_of[telegram_chat_id]]
+
+    def exhausted_count(self) -> int:
+        return sum(1 for record_id in self.capacity if len(self.known[record_id]) >= self.capacity[record_id])
+
+    def stats(self) -> str:
+        return (f"исчерпано чатов: {self.exhausted_count()}/{len(self.capacity)} | "
+                f"пропущено проверок: {self.skipped}")
@@ -0,0 +1,234 @@
+"""
+Определение города по свободному тексту users.city до перебора чатов в Telegram.
+
+Текст нормализуется (регистр, «г.», пунктуация, области и страны),
+латиница транслитерируется, известные сокращения («мск», «спб», «питер»)
+раскрываются. Затем ищется город чата: точное совпадение, совпадение
+одного из слов/частей строки, опечатки - BK-деревом по расстоянию
+Левенштейна, перестановки и лишние слова - по триграммам.
+
+Уверенное совпадение проверяется одним запросом в угаданный чат,
+перебор всех чатов нужен только неоднозначным и нераспознанным
+пользователям и тем, чья догадка не подтвердилась.
+"""
+
+import os
+import re
+from collections import defaultdict
+
+from city_sync.scoring import normalize_city
+
+MIN_CONFIDENCE = float(os.getenv("RESOLVER_MIN_CONFIDENCE", "0.8"))
+TRIGRAM_MIN_SIMILARITY = 0.6
+
+# Сокращения и разговорные названия → нормализованное название города
+CITY_ALIASES = {
+    "мск": "москва",
+    "msk": "москва",
+    "moscow": "москва",
+    "спб": "санкт петербург",
+    "питер": "санкт петербург",
+    "петербург": "санкт петербург",
+    "с петербург": "санкт петербург",
+    "ст петербург": "санкт петербург",
+    "spb": "санкт петербург",
+    "saint petersburg": "санкт петербург",
+    "st petersburg": "санкт петербург",
+    "екб": "екатеринбург",
+    "ебург": "екатеринбург",
+    "нск": "новосибирск",
+    "новосиб": "новосибирск",
+    "нн": "нижний новгород",
+    "нижний": "нижний новгород",
+    "ростов": "ростов на дону",
+    "ростов он дон": "ростов на дону",
+    "кзн": "казань",
+    "крд": "краснодар",
+    "влад": "владивосток",
+    "челяба": "челябинск",
+    "алма ата": "алматы",
+    "алмата": "алматы",
+    "нур султан": "астана",
+}
+
+# Слова, которые не относятся к названию города: «Москва, Россия», «Подольск МО»
+NOISE_WORDS = {
+    "россия", "рф", "область", "обл", "край", "республика", "респ", "район", "р н",
+    "мо", "ло", "город", "гор", "пгт", "поселок", "пос", "село", "деревня",
+    "казахстан", "беларусь", "украина", "russia", "city",
+}
+
+# Латиница → кириллица, сначала длинные сочетания
+TRANSLIT = [
+    ("shch", "щ"), ("sch", "щ"), ("yo", "ё"), ("zh", "ж"), ("kh", "х"), ("ts", "ц"),
+    ("ch", "ч"), ("sh", "ш"), ("yu", "ю"), ("ya", "я"), ("ye", "е"), ("ju", "ю"), ("ja", "я"),
+    ("a", "а"), ("b", "б"), ("v", "в"), ("g", "г"), ("d", "д"), ("e", "е"), ("z", "з"),
+    ("i", "и"), ("y", "й"), ("k", "к"), ("l", "л"), ("m", "м"), ("n", "н"), ("o", "о"),
+    ("p", "п"), ("r", "р"), ("s", "с"), ("t", "т"), ("u", "у"), ("f", "ф"), ("h", "х"),
+    ("c", "к"), ("w", "в"), ("x", "кс"), ("q", "к"), ("'", "ь"),
+]
+
+
+def transliterate(text: str) -> str:
+    """Латинские слова → кириллица (Kazan → казан, Sankt-Peterburg → санкт петербург)"""
+    def word(match):
+        value = match.group(0)
+        for latin, cyrillic in TRANSLIT:
+            value = value.replace(latin, cyrillic)
+        return value.replace("йа", "я").replace("ийй", "ий")
+    return re.sub(r"[a-z']+", word, text)
+
+
+def levenshtein(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BKTree:
+    """BK-дерево по расстоянию Левенштейна: поиск слов с опечатками без полного перебора"""
+
+    def __init__(self, words=()):
+        self.root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word: str, max_distance: int) -> list:
+        """[(расстояние, слово)] в пределах max_distance, по возрастанию расстояния"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            candidate, children = stack.pop()
+            distance = levenshtein(word, candidate)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+
+class CityResolver:
+    """
+    Сопоставление текста users.city с городами чатов.
+    chats: [(telegram_chat_id, db_record_id, city_name), ...] - как load_chats()
+    """
+
+    def __init__(self, chats: list, min_confidence: float = MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        # Несколько чатов с одинаковым городом - совпадение неоднозначно
+        self.by_name = defaultdict(list)
+        for telegram_chat_id, record_id, city_name in chats:
+            self.by_name[normalize_city(city_name)].append((record_id, city_name))
+        self.by_name.pop("", None)
+        self.tree = BKTree(self.by_name)
+        self.trigram_index = defaultdict(set)
+        for name in self.by_name:
+            for gram in trigrams(name):
+                self.trigram_index[gram].add(name)
+        self.resolved = 0
+        self.ambiguous = 0
+        self.unmatched = 0
+        self._cache = {}
+
+    def variants(self, text: str | None) -> list:
+        """Варианты написания: целиком, по частям через запятую/скобки, без лишних слов"""
+        raw = (text or "").lower().replace("ё", "е")
+        parts = [raw] + re.split(r"[,;/()]", raw)
+        result = []
+        for part in parts:
+            normalized = normalize_city(part)
+            words = [w for w in normalized.split() if w not in NOISE_WORDS]
+            for candidate in (normalized, " ".join(words)):
+                # Латинские сокращения (moscow, st petersburg) ищем до транслитерации,
+                # после неё - кириллические («piter» → «питер»)
+                candidate = CITY_ALIASES.get(candidate) or transliterate(candidate)
+                candidate = CITY_ALIASES.get(candidate, candidate)
+                if candidate and candidate not in result:
+                    result.append(candidate)
+        return result
+
+    def match(self, name: str) -> tuple:
+        """(нормализованное название города чата, уверенность) для одного варианта"""
+        if name in self.by_name:
+            return name, 1.0
+
+        # Опечатки: в коротких названиях не ищем (омск/томск), 1 правка в средних, 2 в длинных
+        max_distance = 0 if len(name) < 5 else 1 if len(name) <= 8 else 2
+        close = self.tree.search(name, max_distance) if max_distance else []
+        if close:
+            best_distance = close[0][0]
+            best = [candidate for distance, candidate in close if distance == best_distance]
+            if len(best) == 1:
+                return best[0], 1.0 - best_distance / max(len(name), len(best[0]))
+
+        # Перестановки слов и лишние слова - триграммное сходство
+        grams = trigrams(name)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_index.get(gram, ()):
+                shared[candidate] += 1
+        scored = sorted(((count / len(grams | trigrams(candidate)), candidate)
+                         for candidate, count in shared.items()), reverse=True)
+        if scored and scored[0][0] >= TRIGRAM_MIN_SIMILARITY:
+            if len(scored) == 1 or scored[1][0] < scored[0][0] - 0.15:
+                return scored[0][1], scored[0][0]
+        return None, 0.0
+
+    def resolve(self, text: str | None):
+        """
+        Чат для текста города, если совпадение уверенное и однозначное.
+        Возвращает (db_record_id, city_name) или None
+        """
+        cached = self._cache.get(text)
+        if cached is None:
+            cached = self._resolve(text)
+            if len(self._cache) < 50_000:
+                self._cache[text] = cached
+        result, outcome = cached
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        return result
+
+    def _resolve(self, text: str | None) -> tuple:
+        matches = set()
+        for variant in self.variants(text):
+            name, confidence = self.match(variant)
+            if name and confidence >= self.min_confidence:
+                matches.add(name)
+
+        if not matches:
+            return None, "unmatched"
+        # «Москва / Питер» или несколько чатов одного города - решает Telegram
+        if len(matches) > 1 or len(self.by_name[next(iter(matches))]) > 1:
+            return None, "ambiguous"
+        return self.by_name[matches.pop()][0], "resolved"
+
+    def stats(self) -> str:
+        return (f"по тексту: {self.resolved} уверенно, {self.ambiguous} неоднозначно, "
+                f"{self.unmatched} не распознано")
@@ -0,0 +1,198 @@
+"""
+Упорядочивание чатов по вероятности для конкретного пользователя.
+
+Вместо перебора чатов по алфавиту (ORDER BY city) сначала проверяем те,
+где пользователь вероятнее всего состоит. Учитываются:
+- свободный текст users.city (совпадение с названием города чата);
+- страна по коду телефона и статистика «префикс телефона → чат»,
+  накопленная по уже определённым пользователям;
+- число участников чата (getChatMemberCount);
+- сколько пользователей уже найдено в чате в прошлых запусках.
+
+Так среднее число getChatMember на найденного пользователя падает
+с ~чатов/2 до нескольких запросов.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+
+# Коды стран → название страны как в city_chats_ik.country.
+# Проверяются от длинных к коротким (7 7xx - Казахстан, остальные 7 - Россия)
+PHONE_COUNTRIES = {
+    "77": "Казахстан",
+    "7": "Россия",
+    "375": "Беларусь",
+    "380": "Украина",
+    "374": "Армения",
+    "994": "Азербайджан",
+    "995": "Грузия",
+    "996": "Киргизия",
+    "998": "Узбекистан",
+    "992": "Таджикистан",
+    "373": "Молдова",
+    "371": "Латвия",
+    "370": "Литва",
+    "372": "Эстония",
+    "49": "Германия",
+    "48": "Польша",
+    "420": "Чехия",
+    "90": "Турция",
+    "972": "Израиль",
+    "971": "ОАЭ",
+    "66": "Таиланд",
+    "34": "Испания",
+    "39": "Италия",
+    "33": "Франция",
+    "44": "Великобритания",
+    "1": "США",
+}
+
+PREFIX_DIGITS = 4       # длина префикса телефона (код страны + начало номера)
+MIN_PREFIX_SAMPLES = 5  # меньше наблюдений - статистике префикса не доверяем
+
+# Веса слагаемых оценки (в логарифмической шкале)
+TEXT_EXACT_BONUS = 12.0
+TEXT_PARTIAL_BONUS = 5.0
+COUNTRY_MATCH_BONUS = 1.5
+COUNTRY_MISMATCH_PENALTY = 4.0
+PREFIX_WEIGHT = 1.0
+
+
+def normalize_city(text: str | None) -> str:
+    """Нормализация названия города для сравнения"""
+    if not text:
+        return ""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"^\s*(г\.|г |город )", "", text)
+    return re.sub(r"[^a-zа-я0-9]+", " ", text).strip()
+
+
+def phone_digits(phone: str | None) -> str:
+    """Только цифры номера, 8XXXXXXXXXX приводится к 7XXXXXXXXXX"""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits
+
+
+def phone_country(phone: str | None) -> str | None:
+    digits = phone_digits(phone)
+    for code in sorted(PHONE_COUNTRIES, key=len, reverse=True):
+        if digits.startswith(code):
+            return PHONE_COUNTRIES[code]
+    return None
+
+
+class ChatScorer:
+    """
+    Оценка чатов для пользователя.
+    chats: [(telegram_chat_id, db_record_id, city_name, country), ...]
+    """
+
+    def __init__(self, chats: list, member_counts: dict | None = None,
+                 chat_hits: Counter | None = None, prefix_hits: dict | None = None):
+        self.chats = chats
+        self.member_counts = member_counts or {}
+        self.chat_hits = chat_hits or Counter()
+        self.prefix_hits = prefix_hits or defaultdict(Counter)
+        self._normalized = {chat[1]: normalize_city(chat[2]) for chat in chats}
+        self._cache = {}
+        self._rebuild_prior()
+
+    @classmethod
+    def from_db(cls, cur, member_counts: dict | None = None) -> "ChatScorer":
+        """Собрать статистику прошлых запусков из БД"""
+        cur.execute("""
+            SELECT platform_id, id, city, country
+            FROM city_chats_ik
+            WHERE platform_id IS NOT NULL
+        """)
+        chats = [(int(platform_id), record_id, city, country)
+                 for platform_id, record_id, city, country in cur.fetchall()]
+
+        # Уже найденные пользователи: сколько в каждом чате и с какими префиксами телефонов
+        cur.execute("""
+            SELECT city_chat_id, phone
+            FROM users
+            WHERE city_chat_id IS NOT NULL
+        """)
+        chat_hits = Counter()
+        prefix_hits = defaultdict(Counter)
+        for chat_record_id, phone in cur.fetchall():
+            chat_hits[chat_record_id] += 1
+            digits = phone_digits(phone)
+            if len(digits) >= PREFIX_DIGITS:
+                prefix_hits[digits[:PREFIX_DIGITS]][chat_record_id] += 1
+
+        return cls(chats, member_counts, chat_hits, prefix_hits)
+
+    def _rebuild_prior(self):
+        """Априорная вероятность чата: смесь доли участников и доли прошлых попаданий"""
+        n = len(self.chats) or 1
+        total_members = sum(self.member_counts.values())
+        total_hits = sum(self.chat_hits.values())
+        self._prior = {}
+        for chat in self.chats:
+            record_id = chat[1]
+            members_share = (self.member_counts.get(record_id, 0) + 1) / (total_members + n)
+            hits_share = (self.chat_hits.get(record_id, 0) + 1) / (total_hits + n)
+            self._prior[record_id] = math.log(0.5 * members_share + 0.5 * hits_share)
+        self._cache.clear()
+
+    def set_member_counts(self, member_counts: dict):
+        self.member_counts = member_counts
+        self._rebuild_prior()
+
+    def record_hit(self, chat_record_id: int, phone: str | None):
+        """Учесть найденного пользователя (статистика уточняется по ходу запуска)"""
+        self.chat_hits[chat_record_id] += 1
+        digits = phone_digits(phone)
+        if len(digits) >= PREFIX_DIGITS:
+            self.prefix_hits[digits[:PREFIX_DIGITS]][chat_record_id] += 1
+        # Пересчитываем не на каждое попадание, а раз в 100 - порядок меняется медленно
+        if sum(self.chat_hits.values()) % 100 == 0:
+            self._rebuild_prior()
+
+    def score(self, chat, city_text: str, country: str | None, prefix: str) -> float:
+        record_id = chat[1]
+        value = self._prior[record_id]
+
+        chat_city = self._normalized[record_id]
+        if city_text and chat_city:
+            if city_text == chat_city:
+                value += TEXT_EXACT_BONUS
+            elif city_text in chat_city or chat_city in city_text:
+                value += TEXT_PARTIAL_BONUS
+
+        if country and chat[3]:
+            value += COUNTRY_MATCH_BONUS if chat[3] == country else -COUNTRY_MISMATCH_PENALTY
+
+        hits = self.prefix_hits.get(prefix)
+        if hits:
+            total = sum(hits.values())
+            if total >= MIN_PREFIX_SAMPLES:
+                share = (hits.get(record_id, 0) + 0.5) / (total + 0.5 * len(self.chats))
+                value += PREFIX_WEIGHT * math.log(share * len(self.chats))
+
+        return value
+
+    def order(self, city_text: str | None, phone: str | None) -> list:
+        """
+        Чаты в порядке убывания вероятности.
+        Возвращает [(telegram_chat_id, db_record_id, city_name), ...] - как load_chats()
+        """
+        normalized = normalize_city(city_text)
+        digits = phone_digits(phone)
+        prefix = digits[:PREFIX_DIGITS] if len(digits) >= PREFIX_DIGITS else ""
+        country = phone_country(phone)
+        key = (normalized, prefix, country)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        ranked = sorted(self.chats, key=lambda chat: self.score(chat, normalized, country, prefix), reverse=True)
+        result = [(chat[0], chat[1], chat[2]) for chat in ranked]
+        if len(self._cache) < 50_000:
+            self._cache[key] = result
+        return result
@@ -0,0 +1,410 @@
+"""
+Стратегии синхронизации городов поверх общего ядра.
+
+- user_major: для каждого пользователя перебираем чаты (в порядке вероятности)
+  до первого совпадения; resume - то же, но только для users без city_chat_id;
+- offline_first: уверенные совпадения по тексту users.city проверяются
+  одним запросом в угаданный чат, остальные - как resume;
+- chat_major: чат за чатом (крупные первыми) проверяем ещё не найденных
+  кандидатов, найденные выбывают;
+- listen: непрерывно, только пользователи с новой подпиской (LISTEN/NOTIFY);
+- event_backfill: начальное заполнение city_chat_members для трекера событий.
+
+Все стратегии используют один SyncContext: ограничитель запросов, кэш проверок,
+оценку чатов, буфер записи и (опционально) общую очередь в БД.
+"""
+
+import asyncio
+import time
+from array import array
+from datetime import datetime
+
+from city_sync.cache import ProbeCache
+from city_sync.core import check_user_in_chat, fetch_member_counts, load_chats
+from city_sync.listener import NotificationListener, RecheckSchedule, ensure_trigger
+from city_sync.pruning import MemberBudget
+from city_sync.resolver import CityResolver
+from city_sync.scoring import ChatScorer
+from city_sync.tracker import backfill
+from city_sync.users import CompactUsers, load_users, user_name
+from city_sync.work_queue import CHUNK_SIZE
+
+ACTIVE_USERS_SQL = "subscription_expires > NOW()"
+PENDING_USERS_SQL = "subscription_expires > NOW() AND city_chat_id IS NULL"
+RECHECK_POLL_SECONDS = 60  # listen: как часто без уведомлений смотреть отложенные проверки
+
+
+class SyncContext:
+    """Общее состояние одного запуска синхронизации"""
+
+    def __init__(self, conn, bot, limiter, writer, queue=None, workers: int = 32,
+                 chunk_size: int = CHUNK_SIZE, hedger=None):
+        self.conn = conn
+        self.bot = bot
+        self.limiter = limiter
+        self.writer = writer
+        self.queue = queue
+        self.hedger = hedger
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.probes = ProbeCache()
+        self.scorer = None
+        self.budget = None
+        self.chat_list = []
+        self.start_time = datetime.now()
+        self.started_monotonic = time.monotonic()
+
+        self.total = 0
+        self.checked = 0
+        self.found = 0
+        self.updated = 0
+        self.errors = 0
+
+    async def prepare(self):
+        """Загрузить чаты, статистику прошлых запусков и число участников"""
+        with self.conn.cursor() as cur:
+            self.chat_list = load_chats(cur)
+            self.scorer = ChatScorer.from_db(cur)
+        self.conn.commit()
+        print(f"📋 Чатов: {len(self.chat_list)}", flush=True)
+        member_counts = await fetch_member_counts(self.bot, self.limiter, self.chat_list)
+        self.scorer.set_member_counts(member_counts)
+        self.budget = MemberBudget(self.chat_list, member_counts)
+        with self.conn.cursor() as cur:
+            self.budget.load(cur)
+        self.conn.commit()
+        print(f"✂️  {self.budget.stats()}", flush=True)
+
+    @property
+    def flush_extra(self) -> tuple:
+        # Пачка очереди помечается done в той же транзакции, что и её результаты
+        return (self.probes, self.queue) if self.queue else (self.probes,)
+
+    def flush(self):
+        self.updated += self.writer.flush(self.conn, *self.flush_extra)
+
+    def maybe_flush(self):
+        # В режиме очереди пачку закрываем только после обработки целиком
+        if not self.queue and self.writer.due(len(self.probes.pending)):
+            self.updated += self.writer.flush(self.conn, self.probes)
+
+    def users(self, where_sql: str) -> CompactUsers:
+        users = CompactUsers.stream(self.conn, where_sql)
+        self.total = len(users)
+        print(f"👥 К проверке: {self.total} ({users.nbytes() / 1024:.0f} КБ)", flush=True)
+        return users
+
+    def chunks(self, where_sql: str):
+        """Пачки пользователей [(telegram_id, city, user_id, phone), ...]"""
+        if self.queue:
+            added = self.queue.enqueue(self.conn, where_sql)
+            done, total = self.queue.progress(self.conn)
+            print(f"🧵 Запуск {self.queue.run_id}: воркер {self.queue.owner}, в очереди {total} "
+                  f"(добавлено {added}, готово {done})", flush=True)
+            self.total = total - done
+            while True:
+                chunk = self.queue.claim(self.conn)
+                if not chunk:
+                    return
+                yield chunk
+        else:
+            telegram_ids = self.users(where_sql).telegram_ids
+            for i in range(0, len(telegram_ids), self.chunk_size):
+                with self.conn.cursor() as cur:
+                    chunk = load_users(cur, telegram_ids[i:i + self.chunk_size])
+                self.conn.commit()
+                yield chunk
+
+    async def probe(self, chat_id: int, tg_id: int) -> bool | None:
+        """Проверка членства с учётом кэша прошлых запусков и исчерпанных чатов"""
+        if self.probes.known(tg_id, chat_id):
+            is_member = self.probes.get(tg_id, chat_id)
+        elif self.budget.can_skip(chat_id, tg_id):
+            # Все участники чата уже найдены, этого пользователя среди них нет
+            self.budget.skipped += 1
+            return False
+        else:
+            if self.hedger:
+                is_member = await self.hedger.run(
+                    lambda started: check_user_in_chat(self.bot, chat_id, tg_id, self.limiter, started))
+            else:
+                is_member = await check_user_in_chat(self.bot, chat_id, tg_id, self.limiter)
+            self.probes.put(tg_id, chat_id, is_member)
+        if is_member:
+            self.budget.add(chat_id, tg_id)
+        elif is_member is False:
+            # Вышел или удалён из чата - иначе чат «исчерпался» бы раньше времени
+            self.budget.discard(chat_id, tg_id)
+        return is_member
+
+    async def run_pool(self, items: list, handler):
+        """Обработать items параллельно (workers задач), темп задаёт limiter"""
+        pending = asyncio.Queue()
+        for item in items:
+            pending.put_nowait(item)
+
+        async def worker():
+            while not pending.empty():
+                await handler(pending.get_nowait())
+                self.maybe_flush()
+
+        lease_task = asyncio.create_task(self._keep_lease()) if self.queue else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(items)))))
+        finally:
+            if lease_task:
+                lease_task.cancel()
+
+    async def _keep_lease(self):
+        # Если Telegram притормозил и пачка обрабатывается дольше аренды
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            self.queue.renew(self.conn)
+
+    def report_progress(self):
+        elapsed = (datetime.now() - self.start_time).total_seconds() / 60
+        print(f"📊 {self.checked}/{self.total} | обновлено: {self.updated} | в чатах: {self.found} | "
+              f"ошибок: {self.errors} | {elapsed:.1f} мин | {self.limiter.stats()}", flush=True)
+
+    def report(self):
+        elapsed = (datetime.now() - self.start_time).total_seconds() / 60
+        print(f"\n{'=' * 60}")
+        print(f"✅ Готово за {elapsed:.1f} мин!")
+        print(f"📊 Проверено: {self.checked}")
+        print(f"🏙  В чатах: {self.found}")
+        print(f"✏️  Обновлено: {self.updated}")
+        print(f"❌ Не проверены из-за ошибок: {self.errors}")
+        print(f"🌐 {self.limiter.stats()} | {self.probes.stats()}")
+        print(f"💾 {self.writer.stats()}")
+        print(f"✂️  {self.budget.stats()}")
+        if self.hedger:
+            print(f"🔁 {self.hedger.stats()}")
+        p50, p95 = self.limiter.metrics.percentile(50), self.limiter.metrics.percentile(95)
+        if p50 is not None:
+            print(f"⏱  Задержка Bot API: p50 {p50 * 1000:.0f} мс, p95 {p95 * 1000:.0f} мс")
+        if self.found:
+            print(f"🎯 Запросов на найденного: {self.limiter.calls / self.found:.1f}")
+
+
+async def find_user_chat(ctx: SyncContext, tg_id: int, chat_list: list):
+    """
+    Перебрать чаты (в порядке вероятности) до первого совпадения.
+    Возвращает ((db_record_id, city_name) | None, была_ли_ошибка)
+    """
+    had_errors = False
+    for telegram_chat_id, db_record_id, city_name in chat_list:
+        is_member = await ctx.probe(telegram_chat_id, tg_id)
+        if is_member:
+            return (db_record_id, city_name), had_errors  # Записываем ID записи, не telegram_chat_id!
+        if is_member is None:
+            had_errors = True
+    return None, had_errors
+
+
+async def sync_user(ctx: SyncContext, user) -> bool:
+    """
+    Найти чат одного пользователя (telegram_id, city, user_id, phone) и поставить в запись.
+    Возвращает, найден ли чат
+    """
+    tg_id, current_city, user_id, phone = user
+    ordered_chats = ctx.scorer.order(current_city, phone)
+    found_chat, had_errors = await find_user_chat(ctx, tg_id, ordered_chats)
+    ctx.probes.forget(tg_id)
+    if had_errors and not found_chat:
+        ctx.errors += 1
+    if found_chat:
+        ctx.found += 1
+        db_record_id, city_name = found_chat
+        ctx.scorer.record_hit(db_record_id, phone)
+        ctx.writer.add(user_id, city_name, db_record_id)
+        if current_city != city_name:
+            print(f"  ✓ {user_name(ctx.conn, user_id)}: '{current_city}' -> '{city_name}' (chat_id={db_record_id})", flush=True)
+    return found_chat is not None
+
+
+async def user_major(ctx: SyncContext, where_sql: str = ACTIVE_USERS_SQL):
+    """Пользователь за пользователем: чаты по убыванию вероятности до первого совпадения"""
+    for chunk in ctx.chunks(where_sql):
+        # Свежие результаты прошлых запусков (включая «не участник»)
+        with ctx.conn.cursor() as cur:
+            ctx.probes.load(cur, [user[0] for user in chunk])
+        ctx.conn.commit()
+
+        await ctx.run_pool(chunk, lambda user: sync_user(ctx, user))
+        ctx.checked += len(chunk)
+        if ctx.queue:
+            ctx.flush()
+        ctx.report_progress()
+
+    ctx.flush()
+
+
+async def resume(ctx: SyncContext):
+    """Только пользователи, у которых ещё нет city_chat_id (бывший v6)"""
+    await user_major(ctx, PENDING_USERS_SQL)
+
+
+def load_city_texts(cur) -> list:
+    """
+    Ещё не найденные пользователи, сгруппированные по тексту users.city:
+    [(city, [user_id, ...], [telegram_id, ...]), ...]
+    """
+    # id::text: для uuid[] у psycopg2 нет преобразователя, массив пришёл бы строкой '{...}'
+    cur.execute(f"""
+        SELECT city, array_agg(id::text), array_agg(telegram_id)
+        FROM users
+        WHERE {PENDING_USERS_SQL} AND COALESCE(city, '') <> ''
+        GROUP BY city
+    """)
+    return cur.fetchall()
+
+
+async def offline_first(ctx: SyncContext):
+    """
+    Сначала город угадывается по тексту users.city, и каждая уверенная догадка
+    проверяется одним запросом в угаданный чат; затем resume перебирает чаты
+    для неподтверждённых, неоднозначных и нераспознанных.
+    """
+    resolver = CityResolver(ctx.chat_list)
+    with ctx.conn.cursor() as cur:
+        texts = load_city_texts(cur)
+    ctx.conn.commit()
+
+    telegram_chat_ids = {record_id: telegram_chat_id for telegram_chat_id, record_id, _ in ctx.chat_list}
+    guesses = []
+    for city_text, user_ids, telegram_ids in texts:
+        match = resolver.resolve(city_text)
+        if not match:
+            continue
+        db_record_id, city_name = match
+        guesses.extend((tg_id, user_id, db_record_id, city_name) for user_id, tg_id in zip(user_ids, telegram_ids))
+    print(f"🔤 {resolver.stats()} (разных написаний: {len(texts)})", flush=True)
+
+    # Догадка по тексту - ещё не членство: непроверенной она попала бы в users.city_chat_id
+    # и в число известных участников чата (MemberBudget) и могла бы «исчерпать» чат
+    with ctx.conn.cursor() as cur:
+        ctx.probes.load(cur, [guess[0] for guess in guesses])
+    ctx.conn.commit()
+    confirmed = 0
+
+    async def verify(guess):
+        nonlocal confirmed
+        tg_id, user_id, db_record_id, city_name = guess
+        # Отрицательный ответ сохраняется в кэше проверок - resume не повторит этот запрос
+        if await ctx.probe(telegram_chat_ids[db_record_id], tg_id):
+            confirmed += 1
+            ctx.writer.add(user_id, city_name, db_record_id)
+        ctx.probes.forget(tg_id)
+
+    await ctx.run_pool(guesses, verify)
+    ctx.found += confirmed
+    ctx.flush()
+    print(f"🔤 Подтверждено в Telegram: {confirmed}/{len(guesses)} | записано: {ctx.updated}", flush=True)
+
+    await resume(ctx)
+
+
+async def chat_major(ctx: SyncContext, where_sql: str = PENDING_USERS_SQL):
+    """
+    Чат за чатом, от крупных к мелким: проверяем всех ещё не найденных
+    кандидатов и исключаем найденных перед следующим чатом.
+    """
+    users = ctx.users(where_sql)
+    with ctx.conn.cursor() as cur:
+        ctx.probes.load(cur, users.telegram_ids)
+    ctx.conn.commit()
+
+    # Крупные чаты первыми: в них больше всего наших пользователей,
+    # и множество кандидатов сокращается быстрее всего
+    chats = sorted(ctx.chat_list, key=lambda chat: (ctx.scorer.member_counts.get(chat[1], 0),
+                                                    ctx.scorer.chat_hits.get(chat[1], 0)), reverse=True)
+    remaining = array("q", range(len(users)))  # индексы ещё не найденных в users
+    had_errors = set()
+
+    for telegram_chat_id, db_record_id, city_name in chats:
+        if not remaining:
+            break
+        if all(ctx.budget.can_skip(telegram_chat_id, users.telegram_ids[i]) for i in remaining):
+            print(f"✂️  {city_name}: все участники уже известны, пропускаем", flush=True)
+            continue
+        found = set()
+
+        async def process_user(index):
+            tg_id = users.telegram_ids[index]
+            is_member = await ctx.probe(telegram_chat_id, tg_id)
+            if is_member:
+                found.add(index)
+                ctx.writer.add(users.user_id(index), city_name, db_record_id)
+            elif is_member is None:
+                had_errors.add(index)
+
+        await ctx.run_pool(remaining, process_user)
+        for index in found:
+            ctx.probes.forget(users.telegram_ids[index])
+        remaining = array("q", (i for i in remaining if i not in found))
+        ctx.found += len(found)
+        ctx.checked = ctx.total - len(remaining)
+        print(f"📍 {city_name}: найдено {len(found)} | осталось {len(remaining)} | {ctx.limiter.stats()}",
+              flush=True)
+
+    ctx.errors = len(had_errors.intersection(remaining))
+    ctx.checked = ctx.total
+    ctx.flush()
+
+
+async def listen(ctx: SyncContext):
+    """
+    Непрерывный режим: проверять пользователей по мере появления подписки
+    (LISTEN/NOTIFY), без полного прохода. Ненайденных - повторно по RecheckSchedule.
+    """
+    with ctx.conn.cursor() as cur:
+        ensure_trigger(cur)
+    ctx.conn.commit()
+    # Число участников за время работы устаревает, а новые подписчики как раз
+    # вступают в чаты - отсечение по нему здесь дало бы ложные «не участник»
+    ctx.budget = MemberBudget(ctx.chat_list, {})
+    # По той же причине «не участник» не сохраняем: с TTL в 7 дней следующие
+    # resume пропустили бы подписчика, который вступил в чат после проверки
+    ctx.probes = ProbeCache(save_negative=False)
+    rechecks = RecheckSchedule()
+
+    async def process(user):
+        if await sync_user(ctx, user):
+            rechecks.found(user[0])
+        else:
+            rechecks.schedule(user[0])
+
+    listener = NotificationListener()
+    listener.connect()
+    print(f"👂 Ждём новых подписчиков (канал {listener.channel})", flush=True)
+    try:
+        async for telegram_ids in listener.batches(idle_timeout=RECHECK_POLL_SECONDS):
+            telegram_ids = list(dict.fromkeys(telegram_ids + rechecks.due()))
+            if not telegram_ids:
+                continue
+            with ctx.conn.cursor() as cur:
+                users = load_users(cur, telegram_ids)
+            ctx.conn.commit()
+            ctx.total += len(users)
+            await ctx.run_pool(users, process)
+            ctx.checked += len(users)
+            ctx.flush()
+            ctx.report_progress()
+            print(f"⏳ {rechecks.stats()}", flush=True)
+    finally:
+        listener.close()
+
+
+async def event_backfill(ctx: SyncContext):
+    """Начальное заполнение city_chat_members для трекера событий"""
+    await backfill(ctx.conn, ctx.bot, ctx.limiter)
+
+
+STRATEGIES = {
+    "resume": resume,
+    "user-major": user_major,
+    "chat-major": chat_major,
+    "offline-first": offline_first,
+    "listen": listen,
+    "event-backfill": event_backfill,
+}
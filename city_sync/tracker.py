@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Событийное отслеживание участников городских чатов.
+
+Вместо перебора getChatMember по всем парам пользователь × чат слушаем
+обновления chat_member / my_chat_member (getUpdates) и по мере их прихода
+поддерживаем таблицу city_chat_members и поля users.city / users.city_chat_id.
+Полный опрос нужен один раз - как начальное заполнение (--backfill).
+
+Требования:
+- бот должен быть администратором в чатах, иначе chat_member не приходят;
+- у токена не должно быть webhook (иначе getUpdates вернёт Conflict),
+  поэтому токен можно задать отдельно через TRACKER_BOT_TOKEN;
+- для локальной проверки укажите TELEGRAM_API_URL фейкового Bot API.
+
+Запуск: python3 -m city_sync.tracker [--backfill]
+"""
+
+import argparse
+import asyncio
+import os
+from datetime import datetime
+
+from telegram.error import Conflict, NetworkError, RetryAfter
+
+from city_sync.config import BOT_TOKEN
+from city_sync.core import (
+    check_user_in_chat, connect, ensure_schema, get_state, is_active_member, load_chats,
+    make_bot, set_state,
+)
+from city_sync.limiter import RateLimiter
+from city_sync.users import CompactUsers
+
+TRACKER_BOT_TOKEN = os.getenv("TRACKER_BOT_TOKEN", BOT_TOKEN)
+
+ALLOWED_UPDATES = ["chat_member", "my_chat_member"]
+POLL_TIMEOUT = 50  # long polling, сек
+OFFSET_KEY = "tracker_offset"
+BACKFILL_KEY = "tracker_backfill_done"
+
+
+def record_membership(cur, telegram_id: int, chat_record_id: int, status: str, is_member: bool):
+    """Сохранить текущий статус пользователя в чате"""
+    cur.execute("""
+        INSERT INTO city_chat_members (telegram_id, chat_id, status, is_member, updated_at)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (telegram_id, chat_id) DO UPDATE SET
+            status = EXCLUDED.status,
+            is_member = EXCLUDED.is_member,
+            updated_at = NOW()
+    """, (telegram_id, chat_record_id, status, is_member))
+
+
+def apply_membership(cur, telegram_id: int, chat_record_id: int, city: str, is_member: bool) -> bool:
+    """
+    Обновить users.city / city_chat_id по событию вступления или выхода.
+    Возвращает True, если строка пользователя изменилась.
+    """
+    if is_member:
+        cur.execute("""
+            UPDATE users SET city = %s, city_chat_id = %s
+            WHERE telegram_id = %s AND city_chat_id IS DISTINCT FROM %s
+        """, (city, chat_record_id, telegram_id, chat_record_id))
+        return cur.rowcount > 0
+
+    # Вышел из чата, который был записан как его город:
+    # переключаем на другой известный чат или сбрасываем city_chat_id
+    cur.execute("""
+        SELECT m.chat_id, c.city
+        FROM city_chat_members m
+        JOIN city_chats_ik c ON c.id = m.chat_id
+        WHERE m.telegram_id = %s AND m.is_member AND m.chat_id <> %s
+        ORDER BY m.updated_at DESC
+        LIMIT 1
+    """, (telegram_id, chat_record_id))
+    other = cur.fetchone()
+    if other:
+        cur.execute("""
+            UPDATE users SET city = %s, city_chat_id = %s
+            WHERE telegram_id = %s AND city_chat_id = %s
+        """, (other[1], other[0], telegram_id, chat_record_id))
+    else:
+        cur.execute("""
+            UPDATE users SET city_chat_id = NULL
+            WHERE telegram_id = %s AND city_chat_id = %s
+        """, (telegram_id, chat_record_id))
+    return cur.rowcount > 0
+
+
+def handle_update(cur, chats_by_platform: dict, update) -> str | None:
+    """Обработать одно обновление. Возвращает строку для лога или None"""
+    if update.my_chat_member:
+        # Изменились права самого бота: без админки chat_member перестанут приходить
+        event = update.my_chat_member
+        chat = chats_by_platform.get(event.chat.id)
+        if not chat:
+            return None
+        status = event.new_chat_member.status
+        set_state(cur, f"bot_status:{event.chat.id}", status)
+        if status != "administrator":
+            return f"⚠️  Бот в чате {chat[1]} теперь '{status}' - события по нему приходить не будут"
+        return f"🤖 Бот снова администратор в чате {chat[1]}"
+
+    event = update.chat_member
+    if not event:
+        return None
+    chat = chats_by_platform.get(event.chat.id)
+    if not chat:
+        return None
+
+    chat_record_id, city = chat
+    member = event.new_chat_member
+    if member.user.is_bot:
+        return None
+
+    is_member = is_active_member(member)
+    record_membership(cur, member.user.id, chat_record_id, member.status, is_member)
+    changed = apply_membership(cur, member.user.id, chat_record_id, city, is_member)
+
+    action = "➕" if is_member else "➖"
+    suffix = " (users обновлён)" if changed else ""
+    return f"  {action} {member.user.id} {city}: {event.old_chat_member.status} -> {member.status}{suffix}"
+
+
+async def backfill(conn, bot, limiter: RateLimiter | None = None):
+    """
+    Начальное заполнение city_chat_members полным опросом getChatMember.
+    Запускается один раз, дальше таблицу поддерживают события.
+    """
+    user_ids = CompactUsers.stream(conn, "subscription_expires > NOW()").telegram_ids
+    cur = conn.cursor()
+    chat_list = load_chats(cur)
+    print(f"📥 Начальное заполнение: {len(user_ids)} пользователей × {len(chat_list)} чатов", flush=True)
+
+    limiter = limiter or RateLimiter()
+    found = 0
+    for i, tg_id in enumerate(user_ids):
+        for telegram_chat_id, chat_record_id, city in chat_list:
+            if await check_user_in_chat(bot, telegram_chat_id, tg_id, limiter):
+                record_membership(cur, tg_id, chat_record_id, "member", True)
+                if apply_membership(cur, tg_id, chat_record_id, city, True):
+                    found += 1
+                break
+        if (i + 1) % 50 == 0:
+            conn.commit()
+            print(f"📊 {i + 1}/{len(user_ids)} | обновлено: {found} | {limiter.stats()}", flush=True)
+
+    set_state(cur, BACKFILL_KEY, datetime.now().isoformat())
+    conn.commit()
+    cur.close()
+    print(f"✅ Заполнение завершено, обновлено: {found}", flush=True)
+
+
+async def track(conn, bot, stop: asyncio.Event | None = None):
+    """Основной цикл: long polling getUpdates и применение событий"""
+    cur = conn.cursor()
+    chats_by_platform = {
+        telegram_chat_id: (chat_record_id, city)
+        for telegram_chat_id, chat_record_id, city in load_chats(cur)
+    }
+    offset = int(get_state(cur, OFFSET_KEY, 0))
+    conn.commit()
+    print(f"👂 Слушаем {len(chats_by_platform)} чатов, offset={offset}", flush=True)
+
+    while not (stop and stop.is_set()):
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=POLL_TIMEOUT,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except NetworkError as e:
+            print(f"⚠️  Сетевая ошибка: {e}", flush=True)
+            await asyncio.sleep(5)
+            continue
+
+        if not updates:
+            continue
+
+        for update in updates:
+            line = handle_update(cur, chats_by_platform, update)
+            if line:
+                print(line, flush=True)
+            offset = update.update_id + 1
+
+        # offset сохраняем в той же транзакции, что и изменения,
+        # чтобы после падения события не потерялись и не применились дважды
+        set_state(cur, OFFSET_KEY, offset)
+        conn.commit()
+
+    cur.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Событийное отслеживание участников городских чатов")
+    parser.add_argument("--backfill", action="store_true",
+                        help="принудительно выполнить начальное заполнение опросом")
+    parser.add_argument("--backfill-only", action="store_true",
+                        help="только заполнение, без прослушивания событий")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("👂 Трекер участников городских чатов")
+    print(f"⏰ Начало: {datetime.now().strftime('%H:%M:%S')}")
+    print("=" * 60, flush=True)
+
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        ensure_schema(cur)
+        backfill_done = get_state(cur, BACKFILL_KEY)
+        conn.commit()
+        cur.close()
+
+        async with make_bot(TRACKER_BOT_TOKEN) as bot:
+            if args.backfill or args.backfill_only or not backfill_done:
+                await backfill(conn, bot)
+            if not args.backfill_only:
+                await track(conn, bot)
+
+    except Conflict as e:
+        print(f"❌ getUpdates недоступен (у токена настроен webhook?): {e}", flush=True)
+        conn.rollback()
+    except Exception as e:
+        print(f"❌ Ошибка: {e}", flush=True)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        print("🔌 Соединение закрыто", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Пользователи для синхронизации без полного списка кортежей в памяти.
+
+Кандидаты читаются серверным курсором в плотные буферы:
+telegram_id в array('q') и users.id (UUID) по 16 байт в bytearray -
+24 байта на пользователя вместо сотен на кортеж с именем и городом.
+Город и телефон подгружаются пачками по мере обработки,
+имя - только когда его нужно вывести в лог.
+"""
+
+import uuid
+from array import array
+
+STREAM_ITERSIZE = 10_000
+
+
+class CompactUsers:
+    """telegram_id и users.id кандидатов в плотных буферах"""
+
+    def __init__(self):
+        self.telegram_ids = array("q")
+        self._user_ids = bytearray()
+
+    @classmethod
+    def stream(cls, conn, where_sql: str, itersize: int = STREAM_ITERSIZE) -> "CompactUsers":
+        """Прочитать кандидатов серверным курсором, не держа всю выборку на клиенте"""
+        users = cls()
+        with conn.cursor(name="city_sync_users") as cur:
+            cur.itersize = itersize
+            cur.execute(f"""
+                SELECT telegram_id, id
+                FROM users
+                WHERE {where_sql} AND telegram_id IS NOT NULL
+                ORDER BY telegram_id
+            """)
+            for telegram_id, user_id in cur:
+                users.append(telegram_id, user_id)
+        conn.commit()
+        return users
+
+    def append(self, telegram_id: int, user_id):
+        self.telegram_ids.append(telegram_id)
+        self._user_ids += uuid.UUID(str(user_id)).bytes
+
+    def __len__(self) -> int:
+        return len(self.telegram_ids)
+
+    def user_id(self, index: int) -> str:
+        return str(uuid.UUID(bytes=bytes(self._user_ids[index * 16:(index + 1) * 16])))
+
+    def __getitem__(self, index: int) -> tuple:
+        """(telegram_id, user_id)"""
+        return self.telegram_ids[index], self.user_id(index)
+
+    def nbytes(self) -> int:
+        return self.telegram_ids.itemsize * len(self.telegram_ids) + len(self._user_ids)
+
+
+def load_users(cur, telegram_ids) -> list:
+    """Данные пачки пользователей: [(telegram_id, city, user_id, phone), ...]"""
+    cur.execute("""
+        SELECT telegram_id, city, id, phone
+        FROM users
+        WHERE telegram_id = ANY(%s)
+        ORDER BY telegram_id
+    """, (list(telegram_ids),))
+    return cur.fetchall()
+
+
+def user_name(conn, user_id) -> str:
+    """Имя пользователя для лога"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT first_name FROM users WHERE id = %s", (user_id,))
+        row = cur.fetchone()
+    return (row and row[0]) or str(user_id)
@@ -0,0 +1,141 @@
+"""
+Очередь пользователей на проверку в Postgres для нескольких воркеров.
+
+Запуск синхронизации получает run_id. Первый воркер заполняет очередь
+(повторное заполнение ничего не дублирует), дальше каждый процесс
+забирает пачки через FOR UPDATE SKIP LOCKED и ставит на них аренду
+(lease_until). Обработанная пачка помечается done в той же транзакции,
+что и запись результатов. Если воркер упал, аренда истекает и пачку
+забирает другой.
+"""
+
+import os
+import socket
+import uuid
+
+from city_sync.users import load_users
+
+CHUNK_SIZE = int(os.getenv("QUEUE_CHUNK_SIZE", "200"))
+LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS city_sync_queue (
+        run_id TEXT NOT NULL,
+        telegram_id BIGINT NOT NULL,
+        user_id UUID NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',   -- pending / done
+        lease_owner TEXT,
+        lease_until TIMESTAMP,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        done_at TIMESTAMP,
+        PRIMARY KEY (run_id, telegram_id)
+    );
+    CREATE INDEX IF NOT EXISTS city_sync_queue_pending_idx
+        ON city_sync_queue (run_id, telegram_id) WHERE status = 'pending';
+"""
+
+
+class WorkQueue:
+    """Аренда пачек пользователей из city_sync_queue"""
+
+    def __init__(self, run_id: str, chunk_size: int = CHUNK_SIZE, lease_seconds: int = LEASE_SECONDS):
+        self.run_id = run_id
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.claimed = []
+
+    def enqueue(self, conn, where_sql: str) -> int:
+        """
+        Заполнить очередь пользователями по условию на users (без WHERE).
+        Уже добавленные в этот run_id не дублируются.
+        """
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO city_sync_queue (run_id, telegram_id, user_id)
+                SELECT %s, telegram_id, id FROM users WHERE {where_sql}
+                ON CONFLICT (run_id, telegram_id) DO NOTHING
+            """, (self.run_id,))
+            added = cur.rowcount
+        conn.commit()
+        return added
+
+    def claim(self, conn) -> list:
+        """
+        Взять следующую пачку в аренду.
+        Возвращает [(telegram_id, city, user_id, phone), ...]
+        """
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH picked AS (
+                    SELECT run_id, telegram_id
+                    FROM city_sync_queue
+                    WHERE run_id = %(run_id)s
+                      AND status = 'pending'
+                      AND (lease_until IS NULL OR lease_until < NOW())
+                      AND attempts < %(max_attempts)s
+                    ORDER BY telegram_id
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE city_sync_queue q
+                SET lease_owner = %(owner)s,
+                    lease_until = NOW() + make_interval(secs => %(lease)s),
+                    attempts = q.attempts + 1
+                FROM picked
+                WHERE q.run_id = picked.run_id AND q.telegram_id = picked.telegram_id
+                RETURNING q.telegram_id
+            """, {
+                "run_id": self.run_id,
+                "max_attempts": MAX_ATTEMPTS,
+                "limit": self.chunk_size,
+                "owner": self.owner,
+                "lease": self.lease_seconds,
+            })
+            ids = [row[0] for row in cur.fetchall()]
+            users = []
+            if ids:
+                users = load_users(cur, ids)
+        # Коммитим сразу: аренда записана, блокировки строк очереди сняты
+        conn.commit()
+        self.claimed = ids
+        return users
+
+    def renew(self, conn):
+        """Продлить аренду текущей пачки (для долгих пачек)"""
+        if not self.claimed:
+            return
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE city_sync_queue
+                SET lease_until = NOW() + make_interval(secs => %s)
+                WHERE run_id = %s AND telegram_id = ANY(%s) AND lease_owner = %s
+            """, (self.lease_seconds, self.run_id, self.claimed, self.owner))
+        conn.commit()
+
+    def flush(self, cur):
+        """
+        Пометить текущую пачку обработанной.
+        Вызывается в транзакции записи результатов (CityWriter.flush),
+        поэтому done ставится только вместе с сохранёнными городами.
+        """
+        if not self.claimed:
+            return
+        cur.execute("""
+            UPDATE city_sync_queue
+            SET status = 'done', done_at = NOW(), lease_owner = NULL, lease_until = NULL
+            WHERE run_id = %s AND telegram_id = ANY(%s) AND lease_owner = %s
+        """, (self.run_id, self.claimed, self.owner))
+        self.claimed = []
+
+    def progress(self, conn) -> tuple:
+        """(обработано, всего) по run_id"""
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*) FILTER (WHERE status = 'done'), COUNT(*)
+                FROM city_sync_queue WHERE run_id = %s
+            """, (self.run_id,))
+            done, total = cur.fetchone()
+        conn.commit()
+        return done, total
@@ -0,0 +1,86 @@
+"""
+Буфер записи найденных городов в users.
+
+Вместо UPDATE на каждого найденного пользователя посреди запросов к Bot API
+результаты копятся в памяти и сбрасываются одним
+UPDATE ... FROM (VALUES ...) раз в FLUSH_INTERVAL секунд или FLUSH_SIZE строк.
+Транзакция открывается только на время сброса, поэтому блокировки строк users
+не держатся, пока идут сетевые запросы.
+"""
+
+import os
+import time
+
+from psycopg2.extras import execute_values
+
+FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "10"))  # сек
+FLUSH_SIZE = int(os.getenv("FLUSH_SIZE", "500"))          # строк
+
+UPDATE_SQL = """
+    UPDATE users AS u
+    SET city = v.city, city_chat_id = v.city_chat_id
+    FROM (VALUES %s) AS v(id, city, city_chat_id)
+    WHERE u.id = v.id
+      AND (u.city IS DISTINCT FROM v.city OR u.city_chat_id IS DISTINCT FROM v.city_chat_id)
+"""
+
+
+class CityWriter:
+    """Накопление (user_id, city, city_chat_id) и пакетная запись"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.buffer = {}
+        self.last_flush = time.monotonic()
+        self.flushes = 0
+        self.written = 0
+        self.flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+
+    def add(self, user_id, city: str, city_chat_id: int):
+        # dict: если пользователь попал дважды, пишем последний результат
+        self.buffer[user_id] = (city, city_chat_id)
+
+    def due(self, pending: int = 0) -> bool:
+        """
+        Пора ли сбрасывать буфер.
+        pending - сколько строк ждут записи в других буферах той же транзакции
+        """
+        total = len(self.buffer) + pending
+        if not total:
+            return False
+        return (total >= self.flush_size
+                or time.monotonic() - self.last_flush >= self.flush_interval)
+
+    def flush(self, conn, *extra) -> int:
+        """
+        Записать буфер одним запросом и закоммитить.
+        extra - объекты с методом flush(cur) (например, ProbeCache),
+        которые нужно записать в той же транзакции.
+        Возвращает число реально изменённых строк users.
+        """
+        started = time.monotonic()
+        rows = [(user_id, city, chat_id) for user_id, (city, chat_id) in self.buffer.items()]
+        updated = 0
+        with conn.cursor() as cur:
+            if rows:
+                execute_values(cur, UPDATE_SQL, rows,
+                               template="(%s::uuid, %s::text, %s::integer)",
+                               page_size=len(rows))
+                updated = cur.rowcount
+            for other in extra:
+                other.flush(cur)
+        conn.commit()
+
+        self.buffer.clear()
+        self.last_flush = time.monotonic()
+        self.flushes += 1
+        self.written += max(updated, 0)
+        self.last_flush_seconds = self.last_flush - started
+        self.flush_seconds += self.last_flush_seconds
+        return updated
+
+    def stats(self) -> str:
+        avg_ms = self.flush_seconds / self.flushes * 1000 if self.flushes else 0
+        return f"записей в БД: {self.written} за {self.flushes} сбросов (~{avg_ms:.0f} мс)"
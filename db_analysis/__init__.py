@@ -0,0 +1,4 @@
+"""
+Общие части скриптов анализа БД клуба (analyze_*.py, migration/analyze_old_db.py):
+постоянная SSH-сессия, один долгоживущий psql на весь анализ.
+"""
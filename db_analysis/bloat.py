@@ -0,0 +1,263 @@
+"""
+Раздувание таблиц и индексов, мёртвые строки и отставание autovacuum.
+
+Массовые UPDATE/DELETE (cleanup_lessons.py, синхронизация городов,
+удаление и повторная вставка контента) оставляют в users, course_days и
+content_items мёртвые строки и пустое место в страницах - seq scan и
+индексы читают лишнее, пока VACUUM/REINDEX это не уберут.
+
+Оценка:
+- если установлен pgstattuple - pgstattuple_approx() для таблиц (по карте
+  видимости, без полного чтения) и pgstatindex() для btree-индексов;
+- иначе по каталогу: ожидаемый размер из reltuples, средней ширины строки
+  (pg_stats.avg_width) и fillfactor против фактического размера.
+Мёртвые строки и отставание autovacuum - из pg_stat_user_tables и порогов
+autovacuum (с учётом reloptions таблицы).
+
+Замер можно сохранить до задания и сравнить с замером после.
+"""
+
+import json
+import math
+import os
+from datetime import datetime
+
+from db_analysis.counts import quote_ident
+from db_analysis.profile import parse_array, quote_literal
+
+TABLES = ["users", "course_days", "content_items"]
+DEAD_SHARE = 0.2            # VACUUM, если мёртвых строк больше 20%
+BLOAT_SHARE = 0.3           # раздувание считаем существенным от 30% размера
+BLOAT_MIN_BYTES = 8 * 1024 * 1024
+INDEX_BLOAT_MIN_BYTES = 1024 * 1024
+ANALYZE_SHARE = 0.1         # ANALYZE, если после прошлого изменилось больше 10% строк
+BTREE_FILLFACTOR = 90
+
+TUPLE_HEADER = 24 + 4       # заголовок строки + указатель в странице
+INDEX_TUPLE_HEADER = 8 + 4
+PAGE_HEADER = 24
+
+SETTINGS_SQL = """
+    SELECT current_setting('block_size'),
+           current_setting('autovacuum_vacuum_threshold'),
+           current_setting('autovacuum_vacuum_scale_factor'),
+           current_setting('autovacuum_analyze_threshold'),
+           current_setting('autovacuum_analyze_scale_factor'),
+           EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pgstattuple');
+"""
+
+
+def _tables_sql(tables: list) -> str:
+    return "ARRAY[" + ", ".join(quote_literal(table) for table in tables) + "]::text[]"
+
+
+def _int(value):
+    return None if value is None or value == "" else int(float(value))
+
+
+def _float(value):
+    return None if value is None or value == "" else float(value)
+
+
+def _options(reloptions) -> dict:
+    """reloptions ({fillfactor=70,autovacuum_vacuum_scale_factor=0.05}) -> dict"""
+    if isinstance(reloptions, list):
+        items = reloptions
+    else:
+        items = parse_array(reloptions) if reloptions else []
+    return dict(item.split("=", 1) for item in items if item and "=" in item)
+
+
+def _align(size: float) -> float:
+    return math.ceil(size / 8) * 8
+
+
+class BloatMonitor:
+    """
+    Замер состояния таблиц и их индексов.
+    fetch(sql) -> список строк-кортежей, как у TableCounts.
+    """
+
+    def __init__(self, fetch, tables: list | None = None):
+        self.fetch = fetch
+        self.tables = tables
+
+    def measure(self) -> dict:
+        """Замер: {"taken_at", "method", "tables": {...}, "indexes": {...}} - можно сохранить в JSON"""
+        (block_size, vac_threshold, vac_scale, an_threshold, an_scale, has_pgstattuple), = self.fetch(SETTINGS_SQL)
+        block_size = int(block_size)
+        has_pgstattuple = has_pgstattuple in (True, "t", "true")
+        where = f"c.relname = ANY({_tables_sql(self.tables)})" if self.tables else "TRUE"
+
+        tables = {}
+        for (name, oid, size, total_size, reltuples, n_live, n_dead, n_mod, last_vacuum, last_autovacuum,
+             row_width, reloptions) in self.fetch(f"""
+                SELECT c.relname, c.oid, pg_relation_size(c.oid), pg_total_relation_size(c.oid), c.reltuples,
+                       s.n_live_tup, s.n_dead_tup, s.n_mod_since_analyze,
+                       s.last_vacuum::text, s.last_autovacuum::text,
+                       (SELECT sum(st.avg_width) FROM pg_stats st
+                        WHERE st.schemaname = 'public' AND st.tablename = c.relname),
+                       c.reloptions::text
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                WHERE n.nspname = 'public' AND c.relkind = 'r' AND {where}
+                ORDER BY c.relname;
+             """):
+            options = _options(reloptions)
+            rows = max(_float(reltuples) or 0, 0)
+            n_live, n_dead, n_mod = _int(n_live) or 0, _int(n_dead) or 0, _int(n_mod) or 0
+            vacuum_at = (float(options.get("autovacuum_vacuum_threshold", vac_threshold))
+                         + float(options.get("autovacuum_vacuum_scale_factor", vac_scale)) * rows)
+            analyze_at = (float(options.get("autovacuum_analyze_threshold", an_threshold))
+                          + float(options.get("autovacuum_analyze_scale_factor", an_scale)) * rows)
+            size = _int(size)
+            table = {
+                "oid": str(oid),
+                "bytes": size,
+                "total_bytes": _int(total_size),
+                "live_rows": n_live,
+                "dead_rows": n_dead,
+                "modified_since_analyze": n_mod,
+                "autovacuum_at": round(vacuum_at),
+                "autoanalyze_at": round(analyze_at),
+                "last_vacuum": max(filter(None, (last_vacuum, last_autovacuum)), default=None),
+                "bloat_bytes": None,
+            }
+            # Оценка по каталогу: сколько страниц заняли бы живые строки при fillfactor таблицы
+            width = _float(row_width)
+            if width and rows and size:
+                fillfactor = int(options.get("fillfactor", 100)) / 100
+                per_page = max(int((block_size - PAGE_HEADER) * fillfactor // _align(TUPLE_HEADER + width)), 1)
+                expected = math.ceil(rows / per_page) * block_size
+                table["bloat_bytes"] = max(size - expected, 0)
+            tables[name] = table
+
+        indexes = self._indexes(where, block_size)
+        method = "каталог"
+        if has_pgstattuple:
+            # Всё или ничего: иначе при ошибке на середине в отчёте смешались бы
+            # цифры pgstattuple и каталога под одной подписью
+            try:
+                table_bloat, index_bloat = self._pgstattuple(tables, indexes)
+            except Exception as e:
+                method = f"каталог (pgstattuple недоступен: {str(e).strip().splitlines()[0]})"
+            else:
+                for name, bloat in table_bloat.items():
+                    tables[name]["bloat_bytes"] = bloat
+                for name, bloat in index_bloat.items():
+                    indexes[name]["bloat_bytes"] = bloat
+                method = "pgstattuple"
+        return {"taken_at": datetime.now().isoformat(timespec="seconds"), "method": method,
+                "tables": tables, "indexes": indexes}
+
+    def _indexes(self, where: str, block_size: int) -> dict:
+        indexes = {}
+        for name, table, size, reltuples, key_width, is_btree, reloptions in self.fetch(f"""
+                SELECT ic.relname, c.relname, pg_relation_size(i.indexrelid), ic.reltuples,
+                       (SELECT sum(st.avg_width)
+                        FROM pg_attribute a
+                        JOIN pg_stats st ON st.schemaname = 'public' AND st.tablename = c.relname
+                                        AND st.attname = a.attname
+                        WHERE a.attrelid = c.oid AND a.attnum = ANY(i.indkey)
+                          AND NOT 0 = ANY(i.indkey)),
+                       am.amname = 'btree', ic.reloptions::text
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_class ic ON ic.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = ic.relam
+                WHERE n.nspname = 'public' AND c.relkind = 'r' AND {where}
+                ORDER BY c.relname, ic.relname;
+             """):
+            size, rows, width = _int(size), max(_float(reltuples) or 0, 0), _float(key_width)
+            index = {"table": table, "bytes": size, "btree": is_btree in (True, "t", "true"), "bloat_bytes": None,
+                     "fillfactor": None}
+            if index["btree"]:
+                index["fillfactor"] = int(_options(reloptions).get("fillfactor", BTREE_FILLFACTOR))
+            if index["btree"] and width and rows and size:
+                fillfactor = index["fillfactor"] / 100
+                per_page = max(int((block_size - PAGE_HEADER) * fillfactor // _align(INDEX_TUPLE_HEADER + width)), 1)
+                # + метастраница и внутренние страницы (~1%)
+                expected = (math.ceil(rows / per_page * 1.01) + 1) * block_size
+                index["bloat_bytes"] = max(size - expected, 0)
+            indexes[name] = index
+        return indexes
+
+    def _pgstattuple(self, tables: dict, indexes: dict) -> tuple:
+        """
+        Оценки через pgstattuple (нужны права pg_stat_scan_tables):
+        ({таблица: байт}, {индекс: байт}), замер не меняет
+        """
+        table_bloat, index_bloat = {}, {}
+        for name, table in tables.items():
+            (free, dead_len), = self.fetch(
+                f"SELECT approx_free_space, dead_tuple_len FROM pgstattuple_approx({table['oid']}::oid);")
+            table_bloat[name] = (_int(free) or 0) + (_int(dead_len) or 0)
+        for name, index in indexes.items():
+            if not index["btree"]:
+                continue
+            (density,), = self.fetch(f"SELECT avg_leaf_density FROM pgstatindex({quote_literal(quote_ident(name))}::regclass);")
+            density = _float(density)
+            if density and density == density:  # NaN у пустого индекса
+                # Плотность листьев сравниваем с fillfactor самого индекса: при fillfactor=70 это норма
+                index_bloat[name] = max(int(index["bytes"] * (1 - density / index["fillfactor"])), 0)
+        return table_bloat, index_bloat
+
+
+def advice(measurement: dict) -> list:
+    """Рекомендации VACUUM / ANALYZE / REINDEX по замеру"""
+    lines = []
+    for name, table in measurement["tables"].items():
+        rows = table["live_rows"] + table["dead_rows"]
+        dead_share = table["dead_rows"] / rows if rows else 0
+        if dead_share >= DEAD_SHARE or table["dead_rows"] > table["autovacuum_at"]:
+            lines.append(f"VACUUM (ANALYZE) {name};  -- мёртвых строк {table['dead_rows']:,} ({dead_share:.0%}), "
+                         f"порог autovacuum {table['autovacuum_at']:,}")
+        elif table["modified_since_analyze"] > max(ANALYZE_SHARE * table["live_rows"], table["autoanalyze_at"]):
+            lines.append(f"ANALYZE {name};  -- изменено {table['modified_since_analyze']:,} строк после прошлого ANALYZE")
+        bloat = table["bloat_bytes"]
+        if bloat and bloat >= BLOAT_MIN_BYTES and bloat >= BLOAT_SHARE * table["bytes"]:
+            lines.append(f"-- {name}: ~{bloat / table['bytes']:.0%} таблицы - пустое место; VACUUM его не вернёт, "
+                         f"только VACUUM FULL {name} (блокирует таблицу) или pg_repack")
+    for name, index in measurement["indexes"].items():
+        bloat = index["bloat_bytes"]
+        if bloat and bloat >= INDEX_BLOAT_MIN_BYTES and bloat >= BLOAT_SHARE * index["bytes"]:
+            lines.append(f"REINDEX INDEX CONCURRENTLY {name};  -- ~{bloat / index['bytes']:.0%} индекса {index['table']}")
+    return lines
+
+
+def compare(before: dict, after: dict) -> list:
+    """Изменения между замерами до и после задания"""
+    lines = []
+    for name, table in after["tables"].items():
+        old = before["tables"].get(name)
+        if old is None:
+            continue
+        changes = []
+        for key, label in (("bytes", "размер"), ("dead_rows", "мёртвых строк"), ("bloat_bytes", "раздувание")):
+            if old.get(key) is not None and table.get(key) is not None and old[key] != table[key]:
+                delta = table[key] - old[key]
+                changes.append(f"{label} {old[key]:,} -> {table[key]:,} ({delta:+,})")
+        if old.get("last_vacuum") != table.get("last_vacuum"):
+            changes.append(f"прошёл VACUUM ({table['last_vacuum']})")
+        if changes:
+            lines.append(f"{name}: " + ", ".join(changes))
+    for name, index in after["indexes"].items():
+        old = before["indexes"].get(name)
+        if old and old["bytes"] != index["bytes"]:
+            lines.append(f"{name}: размер {old['bytes']:,} -> {index['bytes']:,} ({index['bytes'] - old['bytes']:+,})")
+    return lines
+
+
+def save(measurement: dict, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(measurement, f, ensure_ascii=False, indent=1)
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
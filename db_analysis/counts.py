@@ -0,0 +1,149 @@
+"""
+Количество строк без SELECT COUNT(*) по всей таблице.
+
+COUNT(*) на проде - это полный seq scan каждой таблицы (statistics_club_IK
+в том числе) на каждый запуск анализа. По умолчанию берём оценку из
+статистики планировщика: pg_class.reltuples, пересчитанный на текущее
+число страниц (как это делает сам планировщик), а если таблицу ещё ни разу
+не анализировали - n_live_tup из pg_stat_user_tables. Все таблицы схемы -
+одним запросом к каталогу, вместе с размером на диске.
+
+Точный COUNT(*) - только по запросу: для отдельных таблиц или для всех
+(--exact / --exact=t1,t2 или ANALYZE_EXACT_COUNT=all|t1,t2).
+"""
+
+import argparse
+import os
+
+EXACT_ALL = "all"
+EXACT_COUNT = os.getenv("ANALYZE_EXACT_COUNT", "")
+
+ESTIMATES_SQL = """
+    SELECT c.relname,
+           CASE
+               WHEN c.reltuples >= 0 AND c.relpages > 0 THEN
+                   round(c.reltuples / c.relpages
+                         * (pg_relation_size(c.oid) / current_setting('block_size')::int))
+               WHEN c.reltuples >= 0 AND s.n_live_tup IS NULL THEN c.reltuples
+               ELSE s.n_live_tup
+           END::bigint,
+           s.n_dead_tup,
+           pg_relation_size(c.oid),
+           pg_total_relation_size(c.oid)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+    ORDER BY c.relname;
+"""
+
+
+def quote_ident(name: str) -> str:
+    """Имя таблицы в кавычках: без них statistics_club_IK превращается в statistics_club_ik"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def parse_exact(argv=None):
+    """Какие таблицы считать точно: EXACT_ALL, множество имён или пустое множество"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--exact", nargs="?", const=EXACT_ALL, default=EXACT_COUNT)
+    args, _ = parser.parse_known_args(argv)
+    if args.exact.strip() == EXACT_ALL:
+        return EXACT_ALL
+    return {name.strip() for name in args.exact.split(",") if name.strip()}
+
+
+def format_bytes(size: int | None) -> str:
+    if size is None:
+        return "?"
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+class TableCount:
+    """Строки таблицы (оценка или точное число) и размер на диске"""
+
+    def __init__(self, table: str, rows: int | None, exact: bool = False, dead_rows: int | None = None,
+                 table_bytes: int | None = None, total_bytes: int | None = None):
+        self.table = table
+        self.rows = rows
+        self.exact = exact
+        self.dead_rows = dead_rows
+        self.table_bytes = table_bytes
+        self.total_bytes = total_bytes
+
+    def rows_str(self) -> str:
+        if self.rows is None:
+            return "?"
+        return f"{self.rows:,}" if self.exact else f"~{self.rows:,}"
+
+    def __str__(self) -> str:
+        kind = "" if self.exact else " (оценка)"
+        return f"{self.rows_str()}{kind}, {format_bytes(self.total_bytes)}"
+
+
+class TableCounts:
+    """
+    Оценки для всех таблиц схемы одним запросом, точный COUNT(*) лениво для выбранных.
+    fetch(sql) -> список строк-кортежей: cursor_fetch() для psycopg2, psql_fetch() для RemotePsql.
+    """
+
+    def __init__(self, fetch, exact=None):
+        self.fetch = fetch
+        self.exact = parse_exact() if exact is None else exact
+        self._estimates = None
+        self._exact = {}
+
+    def load(self) -> "TableCounts":
+        self._estimates = {}
+        for table, rows, dead_rows, table_bytes, total_bytes in self.fetch(ESTIMATES_SQL):
+            self._estimates[table] = TableCount(table, _int(rows), dead_rows=_int(dead_rows),
+                                                table_bytes=_int(table_bytes), total_bytes=_int(total_bytes))
+        return self
+
+    def wants_exact(self, table: str) -> bool:
+        return self.exact == EXACT_ALL or table in self.exact
+
+    def get(self, table: str) -> TableCount:
+        if self._estimates is None:
+            self.load()
+        estimate = self._estimates.get(table) or TableCount(table, None)
+        if not self.wants_exact(table):
+            return estimate
+        if table not in self._exact:
+            (rows,), = self.fetch(f"SELECT COUNT(*) FROM {quote_ident(table)};")
+            self._exact[table] = TableCount(table, _int(rows), exact=True, dead_rows=estimate.dead_rows,
+                                            table_bytes=estimate.table_bytes, total_bytes=estimate.total_bytes)
+        return self._exact[table]
+
+    __getitem__ = get
+
+    def mode(self) -> str:
+        if self.exact == EXACT_ALL:
+            return "точный COUNT(*) для всех таблиц"
+        if self.exact:
+            return f"оценка по статистике, точно: {', '.join(sorted(self.exact))}"
+        return "оценка по статистике (точно: --exact или --exact=таблица,...)"
+
+
+def cursor_fetch(get_connection):
+    """fetch для TableCounts поверх psycopg2: get_connection() - контекстный менеджер соединения"""
+    def fetch(sql):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                return cur.fetchall()
+    return fetch
+
+
+def psql_fetch(psql):
+    """fetch для TableCounts поверх RemotePsql (строки через COPY ... CSV)"""
+    return psql.rows
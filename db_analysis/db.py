@@ -0,0 +1,52 @@
+"""
+Прямое подключение к Postgres для анализаторов: небольшой пул соединений
+вместо нового psycopg2.connect на каждый запрос.
+
+Соединения открываются лениво (не больше size) и переиспользуются потоками,
+которые профилируют таблицы параллельно. Анализ только читает данные:
+сессии read-only и autocommit, чтобы не держать транзакции на проде.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+POOL_SIZE = int(os.getenv("ANALYZE_POOL_SIZE", "4"))
+
+
+class ConnectionPool:
+    """Пул из size read-only соединений"""
+
+    def __init__(self, db_config: dict, size: int = POOL_SIZE):
+        self.db_config = db_config
+        self.size = size
+        self._pool = None
+
+    @contextmanager
+    def connection(self):
+        if self._pool is None:
+            self._pool = ThreadedConnectionPool(0, self.size, **self.db_config)
+        conn = self._pool.getconn()
+        broken = False
+        try:
+            if not conn.readonly:
+                conn.set_session(readonly=True, autocommit=True)
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._pool.putconn(conn, close=broken or conn.closed)
+
+    def map(self, fn, items) -> list:
+        """fn(item) для всех items параллельно (не больше size потоков), порядок сохраняется"""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(fn, items))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
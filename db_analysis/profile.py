@@ -0,0 +1,250 @@
+"""
+Профиль колонок без полного прохода по таблице.
+
+Сначала читаем pg_stats - то, что ANALYZE уже собрал для планировщика:
+доля NULL, оценка числа различных значений, частые значения с частотами,
+границы гистограммы (первая и последняя - приблизительные min/max).
+Для колонок без статистики (таблицу ни разу не анализировали или
+статистика недоступна) - выборка TABLESAMPLE SYSTEM: читается только
+SAMPLE_PERCENT процентов страниц, одним запросом на все такие колонки
+плюс по запросу на частые значения. Маленькие таблицы (до FULL_SCAN_BYTES)
+читаются целиком - выборка из пары страниц ничего не скажет.
+"""
+
+import argparse
+import os
+
+from db_analysis.counts import format_bytes, quote_ident
+
+SAMPLE_PERCENT = float(os.getenv("ANALYZE_SAMPLE_PERCENT", "1"))
+SAMPLE_SEED = 42  # REPEATABLE: все запросы по таблице видят одну и ту же выборку
+FULL_SCAN_BYTES = 8 * 1024 * 1024
+MCV_LIMIT = 5
+HISTOGRAM_BUCKETS = 10
+VALUE_WIDTH = 40
+
+# typcategory с упорядочиванием: числа, даты/время, строки, интервалы
+ORDERED_CATEGORIES = ("N", "D", "S", "T")
+
+
+def parse_sample_percent(argv=None) -> float:
+    """--sample-percent N (или ANALYZE_SAMPLE_PERCENT): доля страниц для TABLESAMPLE"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--sample-percent", type=float, default=SAMPLE_PERCENT)
+    args, _ = parser.parse_known_args(argv)
+    return min(max(args.sample_percent, 0.01), 100)
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def parse_array(text):
+    """Текстовый массив Postgres ({a,"b c",NULL}) -> список строк (NULL -> None)"""
+    if not text or text[0] != "{":
+        return []
+    items, current, quoted, was_quoted, depth = [], [], False, False, 0
+    chars = iter(text[1:-1])
+    for char in chars:
+        if quoted:
+            if char == "\\":
+                current.append(next(chars, ""))
+            elif char == '"':
+                quoted = False
+            else:
+                current.append(char)
+        elif char == '"':
+            quoted = was_quoted = True
+        elif char == "{":
+            depth += 1
+            current.append(char)
+        elif char == "}":
+            depth -= 1
+            current.append(char)
+        elif char == "," and depth == 0:
+            value = "".join(current)
+            items.append(None if value == "NULL" and not was_quoted else value)
+            current, was_quoted = [], False
+        else:
+            current.append(char)
+    if current or was_quoted or items:
+        value = "".join(current)
+        items.append(None if value == "NULL" and not was_quoted else value)
+    return items
+
+
+def _float(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _text(value):
+    return None if value is None or value == "" else str(value)
+
+
+def _short(value) -> str:
+    if value is None:
+        return "NULL"
+    value = str(value).replace("\n", " ")
+    return repr(value if len(value) <= VALUE_WIDTH else value[:VALUE_WIDTH] + "...")
+
+
+class ColumnProfile:
+    """Статистика одной колонки: из pg_stats или из выборки"""
+
+    def __init__(self, column: str, data_type: str, category: str):
+        self.column = column
+        self.data_type = data_type
+        self.category = category
+        self.source = None
+        self.null_frac = None
+        self.n_distinct = None   # как в pg_stats: < 0 - доля от числа строк
+        self.mcv = []            # [(значение, частота)]
+        self.histogram = []
+        self.min = None
+        self.max = None
+
+    def to_dict(self) -> dict:
+        return {
+            "column": self.column, "type": self.data_type, "category": self.category,
+            "source": self.source, "null_frac": self.null_frac, "n_distinct": self.n_distinct,
+            "mcv": [list(item) for item in self.mcv], "histogram": self.histogram,
+            "min": self.min, "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ColumnProfile":
+        column = cls(data["column"], data["type"], data.get("category"))
+        column.source = data.get("source")
+        column.null_frac = data.get("null_frac")
+        column.n_distinct = data.get("n_distinct")
+        column.mcv = [tuple(item) for item in data.get("mcv", [])]
+        column.histogram = data.get("histogram", [])
+        column.min, column.max = data.get("min"), data.get("max")
+        return column
+
+    @property
+    def ordered(self) -> bool:
+        return self.category in ORDERED_CATEGORIES
+
+    def distinct_str(self, rows: int | None = None) -> str:
+        if self.n_distinct is None:
+            return "?"
+        if self.n_distinct == -1:
+            return "все уникальные"
+        if self.n_distinct < 0:
+            if rows:
+                return f"~{-self.n_distinct * rows:,.0f}"
+            return f"~{-self.n_distinct:.0%} строк"
+        return f"~{self.n_distinct:,.0f}"
+
+    def lines(self, rows: int | None = None) -> list:
+        null_str = "?" if self.null_frac is None else f"{self.null_frac:.1%}"
+        lines = [f"- {self.column}: {self.data_type} - NULL {null_str}, "
+                 f"различных {self.distinct_str(rows)} ({self.source})"]
+        if self.mcv:
+            lines.append("    частые: " + ", ".join(f"{_short(v)} {f:.1%}" for v, f in self.mcv[:MCV_LIMIT]))
+        if self.min is not None or self.max is not None:
+            lines.append(f"    min/max: {_short(self.min)} … {_short(self.max)}")
+        if len(self.histogram) > 2:
+            step = max(1, (len(self.histogram) - 1) // HISTOGRAM_BUCKETS)
+            bounds = self.histogram[::step]
+            if bounds[-1] != self.histogram[-1]:
+                bounds.append(self.histogram[-1])
+            lines.append("    гистограмма: " + " | ".join(_short(v) for v in bounds))
+        return lines
+
+
+class ColumnProfiler:
+    """
+    Профиль всех колонок таблицы.
+    fetch(sql) -> список строк-кортежей, как у TableCounts.
+    """
+
+    def __init__(self, fetch, sample_percent: float = SAMPLE_PERCENT):
+        self.fetch = fetch
+        self.sample_percent = sample_percent
+
+    def profile(self, table: str, table_bytes: int | None = None) -> list:
+        columns = []
+        for (name, data_type, category, null_frac, n_distinct,
+             mcv, mcv_freqs, histogram) in self.fetch(self._stats_sql(table)):
+            column = ColumnProfile(name, data_type, _text(category))
+            if _float(null_frac) is not None:
+                column.source = "pg_stats"
+                column.null_frac = _float(null_frac)
+                column.n_distinct = _float(n_distinct)
+                freqs = [float(f) for f in parse_array(_text(mcv_freqs))]
+                column.mcv = list(zip(parse_array(_text(mcv)), freqs))
+                column.histogram = parse_array(_text(histogram))
+                if column.histogram:
+                    column.min, column.max = column.histogram[0], column.histogram[-1]
+            columns.append(column)
+
+        missing = [column for column in columns if column.source is None]
+        if missing:
+            self._sample(table, missing, table_bytes)
+        return columns
+
+    def _stats_sql(self, table: str) -> str:
+        return f"""
+            SELECT a.attname, format_type(a.atttypid, a.atttypmod), t.typcategory,
+                   s.null_frac, s.n_distinct,
+                   s.most_common_vals::text, s.most_common_freqs::text, s.histogram_bounds::text
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            LEFT JOIN pg_stats s ON s.schemaname = 'public' AND s.tablename = {quote_literal(table)}
+                                AND s.attname = a.attname AND NOT s.inherited
+            WHERE a.attrelid = {quote_literal(quote_ident(table))}::regclass
+              AND a.attnum > 0 AND NOT a.attisdropped
+            ORDER BY a.attnum;
+        """
+
+    def _source(self, table: str, table_bytes: int | None) -> tuple:
+        """FROM-часть запроса и подпись источника"""
+        if table_bytes is not None and table_bytes <= FULL_SCAN_BYTES:
+            return quote_ident(table), f"вся таблица, {format_bytes(table_bytes)}"
+        return (f"{quote_ident(table)} TABLESAMPLE SYSTEM ({self.sample_percent:g}) REPEATABLE ({SAMPLE_SEED})",
+                f"выборка {self.sample_percent:g}%")
+
+    def _sample(self, table: str, columns: list, table_bytes: int | None):
+        source, label = self._source(table, table_bytes)
+        fractions = ", ".join(f"{i / HISTOGRAM_BUCKETS:g}" for i in range(HISTOGRAM_BUCKETS + 1))
+        selects = ["count(*)"]
+        for column in columns:
+            ident = quote_ident(column.column)
+            selects += [f"count({ident})", f"count(DISTINCT {ident}::text)"]
+            if column.ordered:
+                selects += [f"min({ident})::text", f"max({ident})::text",
+                            f"(percentile_disc(ARRAY[{fractions}]) WITHIN GROUP (ORDER BY {ident}))::text"]
+        (row,) = self.fetch(f"SELECT {', '.join(selects)} FROM {source};")
+
+        values = iter(row)
+        total = int(next(values))
+        for column in columns:
+            non_null, distinct = int(next(values)), int(next(values))
+            column.source = f"{label}, {total:,} строк"
+            column.null_frac = 1 - non_null / total if total else None
+            if non_null and distinct == non_null:
+                column.n_distinct = -1
+            elif total:
+                column.n_distinct = distinct
+            if column.ordered:
+                column.min, column.max = _text(next(values)), _text(next(values))
+                column.histogram = parse_array(_text(next(values)))
+            if non_null and column.n_distinct != -1:
+                column.mcv = self._sample_mcv(source, column, total)
+
+    def _sample_mcv(self, source: str, column: ColumnProfile, total: int) -> list:
+        ident = quote_ident(column.column)
+        rows = self.fetch(f"""
+            SELECT {ident}::text, count(*)
+            FROM {source}
+            WHERE {ident} IS NOT NULL
+            GROUP BY 1
+            HAVING count(*) > 1
+            ORDER BY 2 DESC
+            LIMIT {MCV_LIMIT};
+        """)
+        return [(_text(value), int(count) / total) for value, count in rows]
@@ -0,0 +1,247 @@
+"""
+Снимки схемы и профилей колонок в JSON и их сравнение.
+
+Анализатор сохраняет всё, что узнал о таблицах, в файл снимка: ключ - OID
+таблицы, рядом имя, размер, n_mod_since_analyze и "версия статистики"
+(число ANALYZE + autoanalyze). При следующем запуске таблица профилируется
+заново, только если что-то из этого изменилось; для остальных берётся
+профиль из прошлого снимка - ни pg_stats, ни TABLESAMPLE по ним не читаются.
+
+Сравнение двух снимков:
+    python -m db_analysis.snapshot diff old.json new.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from db_analysis.profile import ColumnProfile
+
+SNAPSHOT_DIR = os.getenv("ANALYZE_SNAPSHOT_DIR", "db_snapshots")
+SNAPSHOT_VERSION = 1
+NULL_FRAC_CHANGE = 0.05    # в diff показываем изменение доли NULL от 5 п.п.
+DISTINCT_CHANGE = 0.2      # и числа различных значений от 20%
+
+STATE_SQL = """
+    SELECT c.oid, c.relname,
+           pg_relation_size(c.oid),
+           s.n_mod_since_analyze,
+           COALESCE(s.analyze_count, 0) + COALESCE(s.autoanalyze_count, 0),
+           GREATEST(s.last_analyze, s.last_autoanalyze)::text
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+    ORDER BY c.relname;
+"""
+
+
+def parse_snapshot_path(name: str, argv=None) -> str:
+    """--snapshot PATH (по умолчанию SNAPSHOT_DIR/<name>.json)"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--snapshot", default=os.path.join(SNAPSHOT_DIR, f"{name}.json"))
+    args, _ = parser.parse_known_args(argv)
+    return args.snapshot
+
+
+def _int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+class Snapshot:
+    """Содержимое файла снимка: {"created", "tables": {oid: {...}}}"""
+
+    def __init__(self, tables: dict | None = None, created: str | None = None):
+        self.tables = tables or {}
+        self.created = created
+
+    @classmethod
+    def load(cls, path: str) -> "Snapshot":
+        """Снимок из файла; если файла нет или формат старый - пустой"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        if data.get("version") != SNAPSHOT_VERSION:
+            return cls()
+        return cls(data["tables"], data.get("created"))
+
+    def save(self, path: str):
+        """Атомарная запись: прерванный запуск не портит прошлый снимок"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.created = datetime.now().isoformat(timespec="seconds")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": SNAPSHOT_VERSION, "created": self.created, "tables": self.tables},
+                      f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, path)
+
+    def by_name(self) -> dict:
+        return {entry["name"]: oid for oid, entry in self.tables.items()}
+
+
+class SnapshotProfiler:
+    """
+    Профиль таблицы из прошлого снимка, если таблица не менялась, иначе - ColumnProfiler.
+    После анализа save() записывает новый снимок.
+    """
+
+    def __init__(self, fetch, profiler, path: str):
+        self.fetch = fetch
+        self.profiler = profiler
+        self.path = path
+        self.previous = Snapshot.load(path)
+        self.current = Snapshot()
+        self.state = None
+        self.reused = 0
+        self.profiled = 0
+
+    def load(self) -> "SnapshotProfiler":
+        """Текущее состояние таблиц (OID, размер, изменения после ANALYZE) одним запросом"""
+        self.state = {}
+        for oid, name, table_bytes, n_mod, stats_version, last_analyze in self.fetch(STATE_SQL):
+            self.state[name] = {
+                "oid": str(oid),
+                "name": name,
+                "table_bytes": _int(table_bytes),
+                "n_mod_since_analyze": _int(n_mod),
+                "stats_version": _int(stats_version),
+                "last_analyze": last_analyze or None,
+            }
+        # Таблицы, которые в этот раз не профилируются, переносим из прошлого снимка как есть
+        alive = {state["oid"] for state in self.state.values()}
+        self.current.tables = {oid: entry for oid, entry in self.previous.tables.items() if oid in alive}
+        return self
+
+    @staticmethod
+    def fingerprint(entry: dict) -> tuple:
+        return entry["name"], entry["table_bytes"], entry["n_mod_since_analyze"], entry["stats_version"]
+
+    def profile(self, table: str, count=None) -> list:
+        """Список ColumnProfile; count (TableCount) сохраняется в снимок вместе с профилем"""
+        if self.state is None:
+            self.load()
+        state = self.state.get(table)
+        if state is None:
+            return self.profiler.profile(table, count.table_bytes if count else None)
+
+        cached = self.previous.tables.get(state["oid"])
+        if cached and self.fingerprint(cached) == self.fingerprint(state):
+            self.reused += 1
+            self.current.tables[state["oid"]] = cached
+            return [ColumnProfile.from_dict(column) for column in cached["columns"]]
+
+        self.profiled += 1
+        columns = self.profiler.profile(table, state["table_bytes"])
+        self.current.tables[state["oid"]] = {
+            **state,
+            "rows": count.rows if count else None,
+            "rows_exact": count.exact if count else False,
+            "total_bytes": count.total_bytes if count else None,
+            "profiled_at": datetime.now().isoformat(timespec="seconds"),
+            "columns": [column.to_dict() for column in columns],
+        }
+        return columns
+
+    def save(self):
+        self.current.save(self.path)
+
+    def stats(self) -> str:
+        return (f"снимок {self.path}: профилировано {self.profiled}, "
+                f"из прошлого снимка {self.reused}")
+
+
+def _pct(value) -> str:
+    return "?" if value is None else f"{value:.1%}"
+
+
+def _distinct(column: dict, rows) -> float | None:
+    n_distinct = column.get("n_distinct")
+    if n_distinct is None or n_distinct >= 0:
+        return n_distinct
+    return -n_distinct * rows if rows else None
+
+
+def diff_columns(old: dict, new: dict) -> list:
+    lines = []
+    old_columns = {column["column"]: column for column in old.get("columns", [])}
+    new_columns = {column["column"]: column for column in new.get("columns", [])}
+    for name in new_columns.keys() - old_columns.keys():
+        lines.append(f"    + колонка {name}: {new_columns[name]['type']}")
+    for name in old_columns.keys() - new_columns.keys():
+        lines.append(f"    - колонка {name}")
+    for name in sorted(old_columns.keys() & new_columns.keys()):
+        before, after = old_columns[name], new_columns[name]
+        if before["type"] != after["type"]:
+            lines.append(f"    ~ {name}: тип {before['type']} -> {after['type']}")
+        if (before.get("null_frac") is not None and after.get("null_frac") is not None
+                and abs(after["null_frac"] - before["null_frac"]) >= NULL_FRAC_CHANGE):
+            lines.append(f"    ~ {name}: NULL {_pct(before['null_frac'])} -> {_pct(after['null_frac'])}")
+        d_before, d_after = _distinct(before, old.get("rows")), _distinct(after, new.get("rows"))
+        if d_before and d_after and abs(d_after - d_before) / d_before >= DISTINCT_CHANGE:
+            lines.append(f"    ~ {name}: различных ~{d_before:,.0f} -> ~{d_after:,.0f}")
+    return lines
+
+
+def diff(old: Snapshot, new: Snapshot) -> list:
+    """Отличия двух снимков построчно: таблицы, строки/размер, колонки"""
+    lines = []
+    old_names = old.by_name()
+    matched = set()
+    for oid, entry in sorted(new.tables.items(), key=lambda item: item[1]["name"]):
+        # Та же таблица - тот же OID; если таблицу пересоздали, сопоставляем по имени
+        old_oid = oid if oid in old.tables else old_names.get(entry["name"])
+        if old_oid is None:
+            lines.append(f"+ {entry['name']}: новая таблица, {len(entry.get('columns', []))} колонок")
+            continue
+        matched.add(old_oid)
+        before = old.tables[old_oid]
+        changes = []
+        if before["name"] != entry["name"]:
+            changes.append(f"  переименована из {before['name']}")
+        if old_oid != oid:
+            changes.append(f"  пересоздана (OID {old_oid} -> {oid})")
+        if before.get("rows") != entry.get("rows"):
+            changes.append(f"  строк: {before.get('rows')} -> {entry.get('rows')}")
+        if before.get("table_bytes") != entry.get("table_bytes"):
+            changes.append(f"  размер: {before.get('table_bytes')} -> {entry.get('table_bytes')} байт")
+        changes += diff_columns(before, entry)
+        if changes:
+            lines.append(f"~ {entry['name']}")
+            lines += changes
+    for oid, entry in sorted(old.tables.items(), key=lambda item: item[1]["name"]):
+        if oid not in matched:
+            lines.append(f"- {entry['name']}: таблицы больше нет")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Снимки анализа БД")
+    commands = parser.add_subparsers(dest="command", required=True)
+    diff_parser = commands.add_parser("diff", help="Сравнить два снимка")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    args = parser.parse_args(argv)
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            parser.error(f"нет файла {path}")
+
+    old, new = Snapshot.load(args.old), Snapshot.load(args.new)
+    print(f"📸 {args.old} ({old.created}) -> {args.new} ({new.created})")
+    lines = diff(old, new)
+    for line in lines:
+        print(line)
+    if not lines:
+        print("✅ Без изменений")
+    return 1 if lines else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Постоянная SSH-сессия и один psql на весь анализ.
+
+Раньше каждый запрос запускал отдельный `sshpass ssh ... psql -c`:
+TCP + SSH-рукопожатие + запуск psql (и docker exec) на каждый COUNT(*).
+Теперь:
+- SSHMaster поднимает ControlMaster-соединение один раз, остальные ssh-команды
+  идут через него без рукопожатия; ControlPersist держит его ещё несколько минут,
+  так что следующий скрипт анализа тоже подключится мгновенно;
+- RemotePsql запускает psql на сервере один раз и отправляет запросы в его stdin,
+  конец ответа отмечается маркером \\echo.
+
+Результаты запросов приходят через COPY (query) TO STDOUT в CSV и разбираются
+по мере чтения (RemotePsql.copy): значения с '|', переводами строк и кавычками
+доходят без искажений, NULL отличается от пустой строки.
+"""
+
+import io
+import itertools
+import os
+import subprocess
+import tempfile
+import time
+
+CONTROL_PERSIST = os.getenv("SSH_CONTROL_PERSIST", "600")  # сек жизни мастера после последнего клиента
+CONNECT_TIMEOUT = 15
+
+
+class SSHMaster:
+    """Одно мультиплексированное SSH-соединение (OpenSSH ControlMaster)"""
+
+    def __init__(self, host: str, user: str, password: str | None = None, port: int = 22):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.control_path = os.path.join(tempfile.gettempdir(), f"analyze-ssh-{user}@{host}:{port}")
+        self._master = None
+
+    def _ssh(self, *options) -> list:
+        return [
+            "ssh", "-o", "StrictHostKeyChecking=no",
+            "-o", f"ControlPath={self.control_path}",
+            "-o", "ServerAliveInterval=15",
+            "-p", str(self.port),
+            *options,
+            f"{self.user}@{self.host}",
+        ]
+
+    def check(self) -> bool:
+        return subprocess.run(self._ssh("-O", "check"), capture_output=True).returncode == 0
+
+    def start(self) -> "SSHMaster":
+        """Поднять мастер-соединение (или подхватить оставшееся от прошлого запуска)"""
+        if self.check():
+            return self
+        cmd = self._ssh("-M", "-N", "-o", f"ControlPersist={CONTROL_PERSIST}")
+        if self.password:
+            cmd = ["sshpass", "-p", self.password, *cmd]
+        self._master = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.PIPE, text=True)
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.check():
+                return self
+            # С ControlPersist мастер уходит в фон, и запущенный процесс завершается с кодом 0
+            if self._master.poll() not in (None, 0):
+                raise ConnectionError(f"SSH: {self._master.stderr.read().strip()}")
+            time.sleep(0.2)
+        raise ConnectionError(f"SSH: нет соединения с {self.host} за {CONNECT_TIMEOUT} с")
+
+    def run(self, command: str, timeout: float = 60) -> tuple:
+        """Выполнить команду через мастер: (stdout, stderr, returncode)"""
+        try:
+            result = subprocess.run([*self._ssh(), command], capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            return None, str(e), 1
+        return result.stdout, result.stderr, result.returncode
+
+    def popen(self, command: str) -> subprocess.Popen:
+        """Долгоживущий процесс на сервере с текстовыми stdin/stdout"""
+        proc = subprocess.Popen([*self._ssh(), command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        # Строки режем только по \n и не переводим \r: он может быть внутри значения
+        proc.stdin = io.TextIOWrapper(proc.stdin, encoding="utf-8", line_buffering=True)
+        proc.stdout = io.TextIOWrapper(proc.stdout, encoding="utf-8", newline="\n")
+        return proc
+
+    def close(self):
+        """Мастер остаётся жить ControlPersist секунд - следующий запуск не будет заново логиниться"""
+        if CONTROL_PERSIST in ("0", "no"):
+            subprocess.run(self._ssh("-O", "exit"), capture_output=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_csv_record(record: str) -> list:
+    """
+    Одна запись CSV из COPY ... FORCE_QUOTE *: все значения в кавычках,
+    поэтому поле без кавычек - это NULL (None)
+    """
+    fields, i, end = [], 0, len(record)
+    while True:
+        if i < end and record[i] == '"':
+            parts, j = [], i + 1
+            while True:
+                k = record.index('"', j)
+                parts.append(record[j:k])
+                if record.startswith('"', k + 1):
+                    parts.append('"')
+                    j = k + 2
+                else:
+                    i = k + 1
+                    break
+            fields.append("".join(parts))
+        else:
+            k = record.find(",", i)
+            k = end if k < 0 else k
+            fields.append(record[i:k] or None)
+            i = k
+        if i >= end:
+            return fields
+        i += 1
+
+
+class RemotePsql:
+    """
+    Один psql на сервере на весь анализ.
+    psql_command - как запускать psql там: "sudo -u postgres psql -d postgres"
+    или "docker exec -i postgres psql -U postgres -d postgres".
+    """
+
+    def __init__(self, ssh: SSHMaster, psql_command: str):
+        self.ssh = ssh
+        self.psql_command = psql_command
+        self._proc = None
+        self._markers = itertools.count(1)
+
+    def start(self) -> "RemotePsql":
+        # -X: без ~/.psqlrc; ошибки (2>&1) приходят в тот же поток, что и данные COPY
+        self._proc = self.ssh.popen(f"{self.psql_command} -X -q -v ON_ERROR_STOP=0 -v VERBOSITY=terse 2>&1")
+        return self
+
+    def copy(self, sql: str):
+        """
+        Строки результата запроса через COPY (query) TO STDOUT (FORMAT csv):
+        генератор списков значений (NULL -> None), разбор по мере чтения.
+        Ошибка запроса - RuntimeError.
+        """
+        if self._proc is None or self._proc.poll() is not None:
+            self.start()
+        marker = f"__analyze_end_{next(self._markers)}__"
+        self._proc.stdin.write(f"COPY ({sql.strip().rstrip(';')}) TO STDOUT "
+                               f"WITH (FORMAT csv, FORCE_QUOTE *);\n\\echo {marker}\n")
+        self._proc.stdin.flush()
+
+        errors, record, quotes, done = [], [], 0, False
+        try:
+            for line in self._proc.stdout:
+                if errors:
+                    # После ошибки данных уже не будет: всё до маркера - текст ошибки
+                    if line.rstrip("\n") == marker:
+                        done = True
+                        break
+                    errors.append(line.rstrip())
+                    continue
+                if not record:
+                    # На границе записи: маркер конца или сообщение psql (ошибки идут через 2>&1).
+                    # С FORCE_QUOTE * строка данных начинается с '"', ',' или пуста - не спутать
+                    if line.rstrip("\n") == marker:
+                        done = True
+                        break
+                    if line.startswith(("psql:", "ERROR:", "FATAL:")):
+                        errors.append(line.strip())
+                        continue
+                record.append(line)
+                quotes += line.count('"')
+                if quotes % 2 == 0:
+                    # Чётное число кавычек - запись закончилась (перевод строки не внутри значения)
+                    text = "".join(record)
+                    record, quotes = [], 0
+                    yield parse_csv_record(text[:-1] if text.endswith("\n") else text)
+            else:
+                errors.append("psql завершился")
+        finally:
+            if not done and self._proc.poll() is None:
+                # Генератор бросили на середине - дочитываем до маркера, чтобы не сбить следующий запрос
+                for line in self._proc.stdout:
+                    if line.rstrip("\n") == marker:
+                        break
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+    def rows(self, sql: str) -> list:
+        """Все строки результата списком кортежей"""
+        return [tuple(row) for row in self.copy(sql)]
+
+    def close(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.stdin.write("\\q\n")
+            self._proc.stdin.flush()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        self._proc = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
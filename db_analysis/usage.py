@@ -0,0 +1,249 @@
+"""
+Нагрузка на БД по накопительной статистике Postgres.
+
+- pg_stat_statements: самые дорогие запросы по суммарному времени;
+- pg_stat_user_indexes: индексы, которые ни разу не использовались
+  (кроме PK/UNIQUE - они держат ограничения), с размером;
+- pg_stat_user_tables: таблицы, которые в основном читаются seq scan;
+- кандидаты в индексы: колонки из условий WHERE/JOIN горячих запросов
+  по таким таблицам, для которых нет индекса с этой колонкой первой.
+  Выигрыш оцениваем по статистике: сколько строк читает один seq scan
+  сейчас и сколько прочитал бы индекс (строк / n_distinct из pg_stats),
+  плюс суммарное время запросов с этим условием.
+
+Все цифры - с момента последнего сброса статистики (stats_reset).
+"""
+
+import re
+
+HOT_QUERIES_LIMIT = 15
+QUERY_WIDTH = 160
+SEQ_SCAN_MIN_ROWS = 10_000   # маленькие таблицы seq scan читать дешевле, чем по индексу
+SEQ_SCAN_SHARE = 0.5         # таблица "seq-scan-heavy", если так читается больше половины обращений
+
+# Условие на колонку в нормализованном тексте запроса: "users"."telegram_id" = $1, city IN ($2, $3), ...
+CONDITION_RE = re.compile(
+    r'(?:"?(\w+)"?\.)?"?(\w+)"?\s*(?:=|<>|!=|<=|>=|<|>|\bIN\b|\bLIKE\b|\bILIKE\b)\s*(?:ANY\s*)?\(?\s*\$\d+',
+    re.IGNORECASE,
+)
+
+# Условия ищем только в WHERE / JOIN ... ON / USING: в SET у UPDATE и ON CONFLICT DO UPDATE
+# те же «колонка = $1» - это присваивания, а не фильтры
+CLAUSE_RE = re.compile(
+    r'\b(?:WHERE|ON(?!\s+CONFLICT\b)|USING)\b(.*?)'
+    r'(?=\b(?:WHERE|ON|USING|SET|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|OFFSET|RETURNING|DO|WINDOW'
+    r'|UNION|INTERSECT|EXCEPT|FOR\s+(?:UPDATE|SHARE)|(?:LEFT|RIGHT|FULL|INNER|CROSS)?\s*JOIN)\b|$)',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Таблица и её псевдоним в FROM/JOIN/UPDATE/INTO: energy_transactions et, "users" AS "u"
+TABLE_ALIAS_RE = re.compile(
+    r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:"?public"?\.)?"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?',
+    re.IGNORECASE,
+)
+# Слова, которые после имени таблицы идут вместо псевдонима
+NOT_ALIASES = {
+    "where", "on", "using", "join", "inner", "left", "right", "full", "cross", "natural", "set",
+    "group", "order", "limit", "offset", "returning", "values", "select", "default", "union",
+    "intersect", "except", "for", "window", "having", "tablesample", "only", "lateral",
+}
+
+STATS_RESET_SQL = """
+    SELECT stats_reset::text, now() - stats_reset
+    FROM pg_stat_database
+    WHERE datname = current_database();
+"""
+
+STATEMENTS_COLUMNS_SQL = """
+    SELECT a.attname
+    FROM pg_extension e
+    JOIN pg_attribute a ON a.attrelid = to_regclass('pg_stat_statements')
+    WHERE e.extname = 'pg_stat_statements' AND a.attnum > 0;
+"""
+
+UNUSED_INDEXES_SQL = """
+    SELECT s.relname, s.indexrelname, pg_relation_size(s.indexrelid), s.idx_scan
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    WHERE s.schemaname = 'public' AND s.idx_scan = 0
+      AND NOT i.indisunique AND NOT i.indisprimary
+    ORDER BY pg_relation_size(s.indexrelid) DESC;
+"""
+
+TABLE_SCANS_SQL = """
+    SELECT relname, seq_scan, seq_tup_read, COALESCE(idx_scan, 0), COALESCE(idx_tup_fetch, 0), n_live_tup
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public'
+    ORDER BY seq_tup_read DESC;
+"""
+
+COLUMNS_SQL = """
+    SELECT table_name, column_name
+    FROM information_schema.columns
+    WHERE table_schema = 'public';
+"""
+
+LEADING_INDEX_COLUMNS_SQL = """
+    SELECT t.relname, a.attname
+    FROM pg_index i
+    JOIN pg_class t ON t.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = i.indkey[0]
+    WHERE n.nspname = 'public' AND i.indisvalid;
+"""
+
+N_DISTINCT_SQL = """
+    SELECT tablename, attname, n_distinct
+    FROM pg_stats
+    WHERE schemaname = 'public';
+"""
+
+
+def _int(value):
+    return 0 if value is None or value == "" else int(float(value))
+
+
+def _float(value):
+    return 0.0 if value is None or value == "" else float(value)
+
+
+def short_query(query: str) -> str:
+    query = " ".join(query.split())
+    return query if len(query) <= QUERY_WIDTH else query[:QUERY_WIDTH] + "..."
+
+
+def filter_columns(query: str) -> set:
+    """{(таблица или "", колонка)} из условий WHERE/ON/USING запроса"""
+    found = set()
+    for clause in CLAUSE_RE.findall(query):
+        found.update(CONDITION_RE.findall(clause))
+    return found
+
+
+def query_aliases(query: str) -> dict:
+    """{псевдоним или имя: таблица} из FROM/JOIN/UPDATE/INTO запроса"""
+    aliases = {}
+    for table, alias in TABLE_ALIAS_RE.findall(query):
+        aliases[table] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def table_pattern(table: str):
+    """Таблица в FROM/JOIN/UPDATE/INTO запроса"""
+    return re.compile(rf'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:"?public"?\.)?"?{re.escape(table)}"?(?:\W|$)',
+                      re.IGNORECASE)
+
+
+class UsageReport:
+    """
+    Отчёт по накопительной статистике.
+    fetch(sql) -> список строк-кортежей, как у TableCounts.
+    """
+
+    def __init__(self, fetch, hot_limit: int = HOT_QUERIES_LIMIT):
+        self.fetch = fetch
+        self.hot_limit = hot_limit
+        self._statements = None
+
+    def stats_reset(self) -> str:
+        rows = self.fetch(STATS_RESET_SQL)
+        if not rows or not rows[0][0]:
+            return "статистика не сбрасывалась с создания кластера"
+        return f"статистика с {rows[0][0]} ({rows[0][1]})"
+
+    def statements(self) -> list:
+        """
+        Все запросы из pg_stat_statements: [(total_ms, calls, mean_ms, rows, read_blocks, query)],
+        по убыванию суммарного времени. Пусто, если расширение не установлено.
+        """
+        if self._statements is None:
+            columns = {row[0] for row in self.fetch(STATEMENTS_COLUMNS_SQL)}
+            if not columns:
+                self._statements = []
+                return self._statements
+            # PG 13+: total_exec_time, раньше total_time
+            total = "total_exec_time" if "total_exec_time" in columns else "total_time"
+            self._statements = [
+                (_float(total_ms), _int(calls), _float(total_ms) / max(_int(calls), 1), _int(rows),
+                 _int(read_blocks), query)
+                for total_ms, calls, rows, read_blocks, query in self.fetch(f"""
+                    SELECT s.{total}, s.calls, s.rows, s.shared_blks_read, s.query
+                    FROM pg_stat_statements s
+                    JOIN pg_database d ON d.oid = s.dbid
+                    WHERE d.datname = current_database()
+                    ORDER BY s.{total} DESC;
+                """)
+            ]
+        return self._statements
+
+    def hot_queries(self) -> list:
+        """[(доля времени, total_ms, calls, mean_ms, rows, read_blocks, query)] - топ hot_limit"""
+        statements = self.statements()
+        overall = sum(row[0] for row in statements) or 1
+        return [(total_ms / overall, total_ms, *rest) for total_ms, *rest in statements[:self.hot_limit]]
+
+    def unused_indexes(self) -> list:
+        """[(таблица, индекс, байт)] - idx_scan = 0, не PK/UNIQUE"""
+        return [(table, index, _int(size)) for table, index, size, _ in self.fetch(UNUSED_INDEXES_SQL)]
+
+    def table_scans(self) -> list:
+        """[(таблица, seq_scan, seq_tup_read, idx_scan, idx_tup_fetch, n_live_tup)]"""
+        return [(table, *map(_int, rest)) for table, *rest in self.fetch(TABLE_SCANS_SQL)]
+
+    def seq_scan_heavy(self) -> list:
+        """Таблицы от SEQ_SCAN_MIN_ROWS строк, которые в основном читаются seq scan"""
+        heavy = []
+        for table, seq_scan, seq_tup_read, idx_scan, _, n_live in self.table_scans():
+            if n_live >= SEQ_SCAN_MIN_ROWS and seq_scan and seq_scan / (seq_scan + idx_scan) >= SEQ_SCAN_SHARE:
+                heavy.append((table, seq_scan, seq_tup_read, idx_scan, n_live))
+        return heavy
+
+    def index_candidates(self) -> list:
+        """
+        [(таблица, колонка, seq_scan, строк на seq scan, строк по индексу, мс запросов, число запросов)]
+        по убыванию оценки сэкономленных строк чтения
+        """
+        heavy = self.seq_scan_heavy()
+        if not heavy:
+            return []
+        columns, indexed, distinct = {}, set(), {}
+        for table, column in self.fetch(COLUMNS_SQL):
+            columns.setdefault(table, set()).add(column)
+        for table, column in self.fetch(LEADING_INDEX_COLUMNS_SQL):
+            indexed.add((table, column))
+        for table, column, n_distinct in self.fetch(N_DISTINCT_SQL):
+            distinct[(table, column)] = _float(n_distinct)
+
+        candidates = []
+        for table, seq_scan, seq_tup_read, _, n_live in heavy:
+            used = {}  # колонка -> [суммарное время, число запросов]
+            mentions = table_pattern(table)
+            for total_ms, _, _, _, _, query in self.statements():
+                if not mentions.search(query):
+                    continue
+                aliases = query_aliases(query)
+                for qualifier, column in filter_columns(query):
+                    # et.user_id при FROM energy_transactions et - тоже колонка energy_transactions
+                    if qualifier and aliases.get(qualifier, qualifier) != table:
+                        continue
+                    if column in columns.get(table, ()) and (table, column) not in indexed:
+                        stat = used.setdefault(column, [0.0, 0])
+                        stat[0] += total_ms
+                        stat[1] += 1
+            per_scan = seq_tup_read / seq_scan
+            for column, (total_ms, queries) in used.items():
+                n_distinct = distinct.get((table, column))
+                if n_distinct is None or n_distinct == 0:
+                    by_index = None
+                else:
+                    groups = n_distinct if n_distinct > 0 else -n_distinct * n_live
+                    by_index = n_live / max(groups, 1)
+                candidates.append((table, column, seq_scan, per_scan, by_index, total_ms, queries))
+
+        def saved(candidate):
+            _, _, seq_scan, per_scan, by_index, total_ms, _ = candidate
+            return (seq_scan * (per_scan - (by_index if by_index is not None else per_scan)), total_ms)
+
+        return sorted(candidates, key=saved, reverse=True)
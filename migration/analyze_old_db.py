@@ -4,9 +4,15 @@
 Подключается к БД и анализирует таблицы с данными пользователей и транзакций
 """
 
+import os
+import sys
+
 import psycopg2
-from datetime import datetime
-import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_analysis.counts import TableCounts
+from db_analysis.profile import ColumnProfiler, parse_sample_percent
+from db_analysis.snapshot import SnapshotProfiler, parse_snapshot_path
 
 # Параметры подключения
 # Попробуем разные варианты подключения
@@ -76,6 +82,29 @@ def analyze_database():
         cur = conn.cursor()
         print(f"\n✅ Работаем с БД: {db_config['database']}\n")
 
+        def fetch(sql):
+            cur.execute(sql)
+            return cur.fetchall()
+
+        # Оценка количества записей из статистики; точный COUNT(*) - с --exact
+        counts = TableCounts(fetch).load()
+        print(f"🔢 Количество записей: {counts.mode()}\n")
+
+        # Профиль колонок: pg_stats, без статистики - TABLESAMPLE (--sample-percent)
+        profiler = ColumnProfiler(fetch, parse_sample_percent())
+        # Снимок: таблицы без изменений берутся из прошлого запуска (--snapshot PATH)
+        snapshots = SnapshotProfiler(fetch, profiler, parse_snapshot_path(f"old_db_{db_config['database']}")).load()
+
+        def print_profile(table_name, count):
+            print("\nПрофиль колонок:")
+            try:
+                for column in snapshots.profile(table_name, count):
+                    for line in column.lines(count.rows):
+                        print(f"  {line}")
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"  ⚠️  Не удалось: {e}")
+
         # 1. Найти таблицы с данными пользователей
         print("=" * 80)
         print("📊 ПОИСК ТАБЛИЦ С ПОЛЬЗОВАТЕЛЯМИ")
@@ -126,13 +155,14 @@ def analyze_database():
                 print(f"  - {col_name}: {data_type}{len_info} {null_info}")
 
             # Количество записей
-            cur.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cur.fetchone()[0]
-            print(f"\nКоличество записей: {count:,}")
+            count = counts[table_name]
+            print(f"\nКоличество записей: {count}")
+
+            print_profile(table_name, count)
 
             # Примеры данных (первые 3 записи)
-            if count > 0:
-                cur.execute(f"SELECT * FROM {table_name} LIMIT 3")
+            if count.rows != 0:
+                cur.execute(f'SELECT * FROM "{table_name}" LIMIT 3')
                 samples = cur.fetchall()
                 print(f"\nПримеры данных (первые {len(samples)} записи):")
                 for i, row in enumerate(samples, 1):
@@ -197,13 +227,14 @@ def analyze_database():
                 print(f"  - {col_name}: {data_type}{len_info} {null_info}")
 
             # Количество
-            cur.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cur.fetchone()[0]
-            print(f"\nКоличество записей: {count:,}")
+            count = counts[table_name]
+            print(f"\nКоличество записей: {count}")
+
+            print_profile(table_name, count)
 
             # Примеры
-            if count > 0:
-                cur.execute(f"SELECT * FROM {table_name} LIMIT 3")
+            if count.rows != 0:
+                cur.execute(f'SELECT * FROM "{table_name}" LIMIT 3')
                 samples = cur.fetchall()
                 print(f"\nПримеры данных (первые {len(samples)} записи):")
                 for i, row in enumerate(samples, 1):
@@ -223,6 +254,9 @@ def analyze_database():
         print(f"\nВсего таблиц с пользователями: {len(user_tables)}")
         print(f"Всего таблиц с транзакциями: {len(tx_tables)}")
 
+        snapshots.save()
+        print(f"📸 {snapshots.stats()}")
+
         # Итоговая информация для миграции
         print("\n" + "=" * 80)
         print("✅ РЕКОМЕНДАЦИИ ДЛЯ МИГРАЦИИ")
@@ -218,6 +218,13 @@ if __name__ == "__main__":
     print("=" * 80)
     print("МИГРАЦИЯ ПОЛЬЗОВАТЕЛЕЙ: private_club_users → users")
     print("=" * 80)
+
+    # Предполётная проверка данных (один проход по private_club_users), --no-preflight - пропустить
+    if '--no-preflight' not in sys.argv:
+        from preflight import preflight
+        anomalies = preflight(['private_club_users'], db_config=OLD_DB_CONFIG)
+        if anomalies:
+            print(f"\n⚠️  Найдено аномалий: {anomalies:,} - проверьте перед миграцией")
     print()
 
     # Проверить флаг --auto для автоматического запуска
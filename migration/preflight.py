@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Предполётная проверка данных старой БД перед миграцией
+
+По каждой таблице - один SELECT с агрегатами FILTER, то есть один проход:
+- даты вне диапазона (год < 1900, бесконечность, далёкое будущее);
+- NULL и дубли platform_id / client_id / telegram_id;
+- ключ telegram_id, как его строит migrate_users.py (platform_id, иначе client_id):
+  строки без ключа и строки, которые схлопнутся в одну через ON CONFLICT;
+- отрицательные coins;
+- некорректные email и телефоны.
+
+Проверки строятся по типам и именам колонок, поэтому подходят для любой
+таблицы старой БД.
+
+Использование:
+    python3 preflight.py                      # таблицы по умолчанию
+    python3 preflight.py private_club_users   # только указанные
+    python3 preflight.py --all                # все таблицы public
+Код возврата 1, если найдены аномалии.
+"""
+
+import argparse
+import os
+import sys
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_analysis.counts import quote_ident
+
+from migrate_users import OLD_DB_CONFIG
+
+DATE_MIN = os.getenv("PREFLIGHT_DATE_MIN", "1900-01-01")
+DATE_MAX = os.getenv("PREFLIGHT_DATE_MAX", "2100-01-01")
+EMAIL_RE = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+PHONE_DIGITS = (10, 15)  # цифр в номере (E.164 - до 15)
+ID_COLUMNS = ("platform_id", "client_id", "telegram_id")
+
+TABLES = [
+    'private_club_users',
+    'private_club_transactions',
+    'private_club_free_dostup',
+    'private_club_update_podpiska',
+    'prodamus_payments',
+    'club_email_webapp',
+]
+
+DATE_TYPES = ("date", "timestamp without time zone", "timestamp with time zone")
+NUMERIC_TYPES = ("smallint", "integer", "bigint", "numeric", "real", "double precision")
+TEXT_TYPES = ("text", "character varying", "character")
+
+
+def get_columns(cur, table):
+    """[(колонка, тип)] таблицы"""
+    cur.execute("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return cur.fetchall()
+
+
+def build_checks(columns):
+    """[(описание, выражение-агрегат)] для колонок таблицы"""
+    types = dict(columns)
+    checks = []
+
+    for name, data_type in columns:
+        col = quote_ident(name)
+        if data_type in DATE_TYPES:
+            checks.append((f"{name}: дата вне [{DATE_MIN}, {DATE_MAX})",
+                           f"count(*) FILTER (WHERE NOT isfinite({col}) "
+                           f"OR {col} < %(date_min)s OR {col} >= %(date_max)s)"))
+        if name.startswith("coins") and data_type in NUMERIC_TYPES:
+            checks.append((f"{name}: отрицательные", f"count(*) FILTER (WHERE {col} < 0)"))
+        if "email" in name and data_type in TEXT_TYPES:
+            checks.append((f"{name}: некорректный email",
+                           f"count(*) FILTER (WHERE btrim({col}) <> '' AND btrim({col}) !~ %(email_re)s)"))
+        if "phone" in name and data_type in TEXT_TYPES:
+            digits = f"length(regexp_replace({col}, '\\D', '', 'g'))"
+            checks.append((f"{name}: некорректный телефон",
+                           f"count(*) FILTER (WHERE btrim({col}) <> '' "
+                           f"AND {digits} NOT BETWEEN %(phone_min)s AND %(phone_max)s)"))
+
+    for name in ID_COLUMNS:
+        if name in types:
+            col = quote_ident(name)
+            checks.append((f"{name}: NULL", f"count(*) FILTER (WHERE {col} IS NULL)"))
+            checks.append((f"{name}: дубли (лишние строки)", f"count({col}) - count(DISTINCT {col})"))
+
+    # telegram_id в migrate_users.py: str(platform_id if platform_id else client_id),
+    # ON CONFLICT (telegram_id) - строки с одинаковым ключом схлопываются в одну
+    if "telegram_id" not in types and "platform_id" in types and "client_id" in types:
+        key = "COALESCE(NULLIF(platform_id, 0), client_id)"
+        checks.append(("telegram_id (platform_id/client_id): нет ключа - все станут 'None'",
+                       f"count(*) FILTER (WHERE {key} IS NULL)"))
+        checks.append(("telegram_id (platform_id/client_id): схлопнутся при миграции",
+                       f"count({key}) - count(DISTINCT {key})"))
+    return checks
+
+
+def scan_table(cur, table):
+    """Один проход по таблице: (строк, [(описание, количество)])"""
+    checks = build_checks(get_columns(cur, table))
+    aggregates = ",\n       ".join(["count(*)"] + [expr for _, expr in checks])
+    cur.execute(f"SELECT {aggregates}\nFROM {quote_ident(table)}", {
+        "date_min": DATE_MIN,
+        "date_max": DATE_MAX,
+        "email_re": EMAIL_RE,
+        "phone_min": PHONE_DIGITS[0],
+        "phone_max": PHONE_DIGITS[1],
+    })
+    total, *counts = cur.fetchone()
+    return total, [(label, count) for (label, _), count in zip(checks, counts)]
+
+
+def preflight(tables=None, scan_all=False, db_config=OLD_DB_CONFIG):
+    """Отчёт по таблицам; возвращает число найденных аномалий"""
+    conn = psycopg2.connect(**db_config)
+    conn.set_session(readonly=True, autocommit=True)
+    anomalies = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' ORDER BY tablename")
+            existing = [row[0] for row in cur.fetchall()]
+            for table in (existing if scan_all else tables or TABLES):
+                print(f"\n📋 {table}")
+                if table not in existing:
+                    print("   ⚠️  Таблица не найдена")
+                    continue
+                try:
+                    total, results = scan_table(cur, table)
+                except psycopg2.Error as e:
+                    print(f"   ❌ Ошибка: {e}")
+                    continue
+                print(f"   Строк: {total:,}")
+                for label, count in results:
+                    if count:
+                        anomalies += count
+                        print(f"   ⚠️  {label}: {count:,}")
+                clean = sum(1 for _, count in results if not count)
+                print(f"   ✅ Без замечаний проверок: {clean} из {len(results)}")
+    finally:
+        conn.close()
+    return anomalies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка данных старой БД перед миграцией")
+    parser.add_argument("tables", nargs="*", help=f"таблицы (по умолчанию: {', '.join(TABLES)})")
+    parser.add_argument("--all", action="store_true", help="все таблицы схемы public")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("ПРЕДПОЛЁТНАЯ ПРОВЕРКА ДАННЫХ ПЕРЕД МИГРАЦИЕЙ")
+    print("=" * 80)
+
+    found = preflight(args.tables, args.all)
+    print("\n" + "=" * 80)
+    if found:
+        print(f"⚠️  Найдено аномалий: {found:,}")
+    else:
+        print("✅ Аномалий не найдено")
+    sys.exit(1 if found else 0)
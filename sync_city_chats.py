@@ -1,115 +1,132 @@
 #!/usr/bin/env python3
 """
-Скрипт для синхронизации городов пользователей по участию в чатах.
-Проходит по всем чатам из city_chats_ik, получает участников через Telegram API,
-и обновляет city + city_chat_id в таблице users.
+Синхронизация городов пользователей по участию в городских чатах.
+Единая точка входа вместо sync_city_chats.py / _v2 ... _v6.
+
+В users записывается:
+- city = название города из city_chats_ik.city
+- city_chat_id = ID записи из city_chats_ik.id (не platform_id!)
+
+Стратегии:
+  resume          - только пользователи без city_chat_id (по умолчанию, бывший v6)
+  user-major      - все активные подписчики, чаты по вероятности до первого совпадения (v5)
+  offline-first   - сначала город по тексту users.city (одна проверка в угаданном чате), остальные как resume
+  chat-major      - чат за чатом от крупных к мелким, найденные выбывают из кандидатов
+  listen          - непрерывно: новые подписчики проверяются по уведомлению из Postgres
+  event-backfill  - начальное заполнение city_chat_members для трекера событий
+  track           - слушать chat_member и обновлять города по событиям
+
+Все настройки задаются флагами или переменными окружения
+(RATE_LIMIT_PER_SEC, MAX_CONCURRENCY, FLUSH_INTERVAL, SYNC_RUN_ID, METRICS_PORT, ...).
+
+Запуск: python3 sync_city_chats.py [стратегия] [--rate 25] [--run-id 2026-10-19]
 """
 
+import argparse
 import asyncio
-import psycopg2
-from telegram import Bot
-from telegram.error import TelegramError
-import time
-
-# Конфигурация
-BOT_TOKEN = "8233570593:AAFUrEuTDQbUvwollurpJhxynMHu54i4_sk"
-DB_CONFIG = {
-    "host": "31.128.36.81",
-    "port": 5423,
-    "database": "club_hranitel",
-    "user": "postgres",
-    "password": "kH*kyrS&9z7K"
-}
-
-async def get_chat_members(bot: Bot, chat_id: int):
-    """Получить всех участников чата через getChatAdministrators (для обычных участников нужен Premium)"""
-    members = []
-    try:
-        # Для обычных групп можно попробовать getChatMembersCount
-        count = await bot.get_chat_member_count(chat_id)
-        print(f"  Чат {chat_id}: {count} участников")
+import os
+from datetime import datetime
+
+from city_sync import limiter as limiter_config
+from city_sync import work_queue as queue_config
+from city_sync import writer as writer_config
+from city_sync.core import connect, ensure_schema, make_bot
+from city_sync.hedging import HEDGE_BUDGET, Hedger
+from city_sync.limiter import RateLimiter
+from city_sync.metrics import METRICS_INTERVAL, MetricsExporter
+from city_sync.strategies import STRATEGIES, SyncContext
+from city_sync.tracker import TRACKER_BOT_TOKEN, track
+from city_sync.work_queue import WorkQueue
+from city_sync.writer import CityWriter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Синхронизация городов по участию в городских чатах")
+    parser.add_argument("strategy", nargs="?", default=os.getenv("SYNC_STRATEGY", "resume"),
+                        choices=[*STRATEGIES, "track"])
+    parser.add_argument("--rate", type=float, default=limiter_config.RATE_LIMIT_PER_SEC,
+                        help="запросов в секунду к Bot API (token bucket)")
+    parser.add_argument("--burst", type=int, default=limiter_config.RATE_BURST,
+                        help="размер token bucket")
+    parser.add_argument("--max-concurrency", type=int, default=limiter_config.MAX_CONCURRENCY,
+                        help="верхняя граница AIMD для одновременных запросов")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SYNC_WORKERS", limiter_config.MAX_CONCURRENCY)),
+                        help="сколько пользователей обрабатывается одновременно")
+    parser.add_argument("--chunk-size", type=int, default=queue_config.CHUNK_SIZE,
+                        help="размер пачки пользователей")
+    parser.add_argument("--flush-interval", type=float, default=writer_config.FLUSH_INTERVAL,
+                        help="как часто сбрасывать результаты в БД, сек")
+    parser.add_argument("--flush-size", type=int, default=writer_config.FLUSH_SIZE,
+                        help="сбрасывать результаты при накоплении N строк")
+    parser.add_argument("--run-id", default=os.getenv("SYNC_RUN_ID", ""),
+                        help="общий запуск для нескольких воркеров через очередь в БД")
+    parser.add_argument("--hedge", action="store_true", default=os.getenv("HEDGE_REQUESTS") == "1",
+                        help="дублировать запросы медленнее p95 (против хвостовых задержек)")
+    parser.add_argument("--hedge-budget", type=float, default=HEDGE_BUDGET,
+                        help="не больше этой доли дополнительных запросов")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "0")),
+                        help="отдавать метрики в формате OpenMetrics на этом порту")
+    parser.add_argument("--metrics-file", default=os.getenv("METRICS_FILE", ""),
+                        help="периодически записывать снимок метрик в JSON")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="период обновления метрик, сек")
+    return parser.parse_args()
 
-        # Получаем админов (это всегда работает)
-        admins = await bot.get_chat_administrators(chat_id)
-        for admin in admins:
-            if admin.user.id and not admin.user.is_bot:
-                members.append(admin.user.id)
-        print(f"  Получено админов: {len(members)}")
 
-    except TelegramError as e:
-        print(f"  Ошибка для чата {chat_id}: {e}")
+async def main():
+    args = parse_args()
+    print("=" * 60)
+    print(f"🔄 Синхронизация городов: {args.strategy}")
+    print(f"⏰ Начало: {datetime.now().strftime('%H:%M:%S')}")
+    print("=" * 60, flush=True)
 
-    return members
+    if args.run_id and args.strategy not in ("resume", "user-major"):
+        print("❌ --run-id поддерживается только стратегиями resume и user-major", flush=True)
+        return
+
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            ensure_schema(cur)
+        conn.commit()
+
+        if args.strategy == "track":
+            async with make_bot(TRACKER_BOT_TOKEN) as bot:
+                await track(conn, bot)
+            return
+
+        limiter = RateLimiter(rate=args.rate, burst=args.burst, max_concurrency=args.max_concurrency)
+        writer = CityWriter(flush_interval=args.flush_interval, flush_size=args.flush_size)
+        queue = WorkQueue(args.run_id, chunk_size=args.chunk_size) if args.run_id else None
+        hedger = Hedger(limiter, budget=args.hedge_budget) if args.hedge else None
+
+        async with make_bot(pool_size=args.max_concurrency) as bot:
+            ctx = SyncContext(conn, bot, limiter, writer, queue,
+                              workers=args.workers, chunk_size=args.chunk_size, hedger=hedger)
+            metrics_task = None
+            if args.metrics_port or args.metrics_file:
+                exporter = MetricsExporter(ctx, port=args.metrics_port or None,
+                                           json_path=args.metrics_file or None,
+                                           interval=args.metrics_interval)
+                metrics_task = asyncio.create_task(exporter.run())
+            try:
+                await ctx.prepare()
+                print("-" * 60, flush=True)
+                await STRATEGIES[args.strategy](ctx)
+            finally:
+                if metrics_task:
+                    metrics_task.cancel()
+                    await asyncio.gather(metrics_task, return_exceptions=True)
+            ctx.report()
+
+    except Exception as e:
+        print(f"❌ Ошибка: {e}", flush=True)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        print("🔌 Соединение закрыто", flush=True)
 
-async def main():
-    # Подключение к базе
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-
-    # Получаем все чаты
-    cur.execute("SELECT platform_id, city FROM city_chats_ik ORDER BY city")
-    chats = cur.fetchall()
-    print(f"Найдено {len(chats)} чатов")
-
-    # Инициализируем бота
-    bot = Bot(token=BOT_TOKEN)
-
-    # Статистика
-    total_updated = 0
-    total_users_found = 0
-
-    for chat_id_str, city in chats:
-        chat_id = int(chat_id_str)
-        print(f"\n📍 Обработка: {city} ({chat_id})")
-
-        try:
-            # Получаем участников чата
-            member_ids = await get_chat_members(bot, chat_id)
-
-            if not member_ids:
-                print(f"  Нет участников или ошибка")
-                continue
-
-            # Проверяем, есть ли эти пользователи в базе
-            placeholders = ','.join(['%s'] * len(member_ids))
-            cur.execute(f"""
-                SELECT telegram_id, city, first_name
-                FROM users
-                WHERE telegram_id IN ({placeholders})
-            """, member_ids)
-
-            db_users = cur.fetchall()
-            print(f"  Найдено в базе: {len(db_users)} пользователей")
-
-            # Обновляем city для тех, у кого он не установлен или отличается
-            for tg_id, current_city, first_name in db_users:
-                total_users_found += 1
-                if current_city != city:
-                    cur.execute("""
-                        UPDATE users
-                        SET city = %s, city_chat_id = %s
-                        WHERE telegram_id = %s
-                    """, (city, str(chat_id), tg_id))
-                    print(f"    ✓ {first_name} ({tg_id}): {current_city} -> {city}")
-                    total_updated += 1
-
-            # Небольшая пауза чтобы не превысить лимиты API
-            await asyncio.sleep(0.5)
-
-        except Exception as e:
-            print(f"  Ошибка: {e}")
-            continue
-
-    # Сохраняем изменения
-    conn.commit()
-
-    print(f"\n{'='*50}")
-    print(f"✅ Готово!")
-    print(f"Всего найдено пользователей: {total_users_found}")
-    print(f"Обновлено записей: {total_updated}")
-
-    cur.close()
-    conn.close()
 
 if __name__ == "__main__":
     asyncio.run(main())